@@ -1,22 +1,47 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Response, Request
+from fastapi.responses import RedirectResponse, StreamingResponse
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import and_, or_, update
 from sqlalchemy.orm import selectinload
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
-from models import TravelEvent, Trip, EventMedia, TripPreparation
-import boto3
-import os
-from database import get_session
-from utils.geocoder import geocode_city
-from pydantic import BaseModel, ConfigDict
+from models import TravelEvent, Trip, EventMedia, TripPreparation, TravelRoute, AnalysisJob, AnalysisJobItem, MediaBlob, TravelStat
+from database import get_async_session
+from storage import get_storage
+from utils.geocoder import geocode_cities
+from pydantic import BaseModel, ConfigDict, model_validator
 from datetime import datetime
-import urllib.parse
+import asyncio
+import base64
 import json
-import tempfile
-import shutil
-from utils.media_analyzer import analyze_media
+import os
 from utils.clustering import cluster_media_to_suggestions
-
-router = APIRouter(prefix="/events", tags=["events"])
+from utils.routes import TRANSPORT_MODES
+from utils.stats import stats_payload
+from utils.response_cache import CachedRoute, cached_response
+from utils.spatial import within_box, within_radius, nearest_destination, EVENT_POINTS, MEDIA_POINTS
+from utils.media_pipeline import run_blocking, map_bounded, analyze_uploads, extract_uploads_in_pool, store_upload, media_type_for
+from utils.jobs import create_job
+from utils.exporter import stream_events_export, EXPORT_FORMATS
+from utils.json_import import import_trips
+from utils.media_analyzer import metadata_to_json, metadata_from_json
+from utils.media_blobs import hashed_uploads, blob_key, insert_blob, release_unreferenced, owned_by_blob
+from utils.derivatives import can_render, create_derivatives, create_stored_derivatives, derivative_key, delete_derivatives
+
+# GET endpoints marked @cached_response are served from utils/response_cache.py
+router = APIRouter(prefix="/events", tags=["events"], route_class=CachedRoute)
+
+# Where the browser reaches this API (the frontend proxies it under /api)
+API_PUBLIC_URL = os.getenv("API_PUBLIC_URL", "/api").rstrip("/")
+# Photos join the trip's closest destination within this distance in upload_media
+DESTINATION_MATCH_KM = float(os.getenv("DESTINATION_MATCH_KM", "25"))
+SPATIAL_MAX_RADIUS_KM = 20000
+# EventMedia column holding the URL of each derivative
+DERIVATIVE_FIELDS = {"thumb": "thumbnail_url", "preview": "preview_url", "tiles": "tiles_url"}
+
+def _derivative_urls(storage, key, names):
+    return {field: storage.url_for(derivative_key(key, name)) for name, field in DERIVATIVE_FIELDS.items() if name in names}
 
 class ItineraryLeg(BaseModel):
     city_name: str
@@ -27,6 +52,9 @@ class EventMediaRead(BaseModel):
     url: str
     media_type: str
     event_id: int
+    thumbnail_url: Optional[str] = None
+    preview_url: Optional[str] = None
+    tiles_url: Optional[str] = None  # panorama tile manifest (JSON)
     # Intelligence fields
     captured_at: Optional[datetime] = None
     lat: Optional[float] = None
@@ -35,7 +63,17 @@ class EventMediaRead(BaseModel):
     country: Optional[str] = None
     model_config = ConfigDict(from_attributes=True)
 
-class TravelEventRead(BaseModel):
+    @model_validator(mode="after")
+    def _lazy_derivatives(self):
+        # Not rendered yet: point at the endpoint that renders them on first request
+        for name, field in DERIVATIVE_FIELDS.items():
+            if name == "tiles" and self.media_type != "pano_image":
+                continue
+            if not getattr(self, field):
+                setattr(self, field, f"{API_PUBLIC_URL}/events/media/{self.id}/{name}")
+        return self
+
+class TravelEventSummaryRead(BaseModel):
     id: int
     trip_id: int
     start_datetime: datetime
@@ -48,65 +86,267 @@ class TravelEventRead(BaseModel):
     transport: str
     title: str
     note: Optional[str] = None
-    media_list: List[EventMediaRead] = []
+    distance_km: Optional[float] = None
+    bearing_deg: Optional[float] = None
     model_config = ConfigDict(from_attributes=True)
 
-class TripRead(BaseModel):
+class TravelEventRead(TravelEventSummaryRead):
+    media_list: List[EventMediaRead] = []
+
+class TripSummaryRead(BaseModel):
     id: int
     title: str
     description: Optional[str] = None
     note: Optional[str] = None
     cost: Optional[float] = None
     created_at: datetime
-    events: List[TravelEventRead] = []
     model_config = ConfigDict(from_attributes=True)
 
+class TripRead(TripSummaryRead):
+    events: List[TravelEventRead] = []
+
 class SimpleTripRequest(BaseModel):
     title: str
     start_city: str
     start_date: datetime
     legs: List[ItineraryLeg]
 
-@router.get("/trips", response_model=List[TripRead])
-def read_trips(session: Session = Depends(get_session)):
+TRIP_INCLUDE_FIELDS = {"events", "media"}
+
+def _encode_trip_cursor(trip: Trip) -> str:
+    raw = f"{trip.created_at.isoformat()}|{trip.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_trip_cursor(cursor: str):
+    try:
+        created_at, trip_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(trip_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _parse_trip_include(include: Optional[str]) -> set:
+    if include is None:
+        return set(TRIP_INCLUDE_FIELDS)
+    fields = {f.strip() for f in include.split(",") if f.strip()}
+    unknown = fields - TRIP_INCLUDE_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include fields: {', '.join(sorted(unknown))}")
+    if "media" in fields:
+        fields.add("events")
+    return fields
+
+def _serialize_trip(trip: Trip, include: set) -> dict:
+    """Serialize only the parts of the trip graph requested by `include`.
+    Relationships that were not eager-loaded are never touched."""
+    data = TripSummaryRead.model_validate(trip).model_dump()
+    if "events" in include:
+        event_model = TravelEventRead if "media" in include else TravelEventSummaryRead
+        data["events"] = [event_model.model_validate(e).model_dump() for e in trip.events]
+    return data
+
+@router.get("/trips", response_model=List[TripRead], response_model_exclude_unset=True)
+@cached_response(Trip, TravelEvent, EventMedia)
+async def read_trips(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    trip_ids: Optional[List[int]] = Query(None, alias="id"),
+    include: Optional[str] = None,
+    session: AsyncSession = Depends(get_async_session)
+):
     """
-    Get all trips with their events hierarchically.
+    Get trips with their events hierarchically, newest first.
+
+    - limit/cursor: keyset pagination over (created_at, id). When more trips are
+      available the opaque cursor for the next page is returned in `X-Next-Cursor`.
+    - start_date/end_date: only trips having an event in that range.
+    - id: restrict to the given trip ids (repeatable).
+    - include: comma separated subset of `events,media` (default both). An empty
+      value returns bare trip rows.
     """
-    trips = session.exec(
-        select(Trip)
-        .options(selectinload(Trip.events).selectinload(TravelEvent.media_list))
-        .order_by(Trip.created_at.desc())
-    ).all()
-    return trips
+    fields = _parse_trip_include(include)
+
+    query = select(Trip)
+    if trip_ids:
+        query = query.where(Trip.id.in_(trip_ids))
+    if start_date or end_date:
+        in_range = select(TravelEvent.id).where(TravelEvent.trip_id == Trip.id)
+        if start_date:
+            in_range = in_range.where(TravelEvent.start_datetime >= start_date)
+        if end_date:
+            in_range = in_range.where(TravelEvent.start_datetime <= end_date)
+        query = query.where(in_range.exists())
+    if cursor:
+        cursor_created_at, cursor_id = _decode_trip_cursor(cursor)
+        query = query.where(or_(
+            Trip.created_at < cursor_created_at,
+            and_(Trip.created_at == cursor_created_at, Trip.id < cursor_id)
+        ))
+
+    if "media" in fields:
+        query = query.options(selectinload(Trip.events).selectinload(TravelEvent.media_list))
+    elif "events" in fields:
+        query = query.options(selectinload(Trip.events))
+
+    query = query.order_by(Trip.created_at.desc(), Trip.id.desc())
+    if limit:
+        query = query.limit(limit + 1)
+
+    trips = (await session.exec(query)).all()
+    if limit and len(trips) > limit:
+        trips = trips[:limit]
+        response.headers["X-Next-Cursor"] = _encode_trip_cursor(trips[-1])
+
+    return [_serialize_trip(trip, fields) for trip in trips]
 
 @router.get("/", response_model=List[TravelEventRead])
-def read_events(session: Session = Depends(get_session)):
-    events = session.exec(select(TravelEvent).options(selectinload(TravelEvent.media_list)).order_by(TravelEvent.start_datetime)).all()
+@cached_response(TravelEvent, EventMedia)
+async def read_events(session: AsyncSession = Depends(get_async_session)):
+    events = (await session.exec(select(TravelEvent).options(selectinload(TravelEvent.media_list)).order_by(TravelEvent.start_datetime))).all()
     print(f"DEBUG: read_events found {len(events)} events")
-    for e in events:
-        print(f"DEBUG: Event {e.id} ({e.to_name}) - Media count: {len(e.media_list)}")
     return events
 
+@router.get("/arcs")
+@cached_response(TravelRoute, TravelEvent)
+async def read_arcs(
+    trip_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Compact globe payload: one entry per leg in parallel (columnar) arrays,
+    read from the denormalized route table. `transport` holds indexes into
+    `transport_modes`; `to_name` labels the destinations.
+    """
+    route = TravelRoute.__table__.c
+    event = TravelEvent.__table__.c
+    query = select(
+        route.event_id, route.trip_id, route.start_datetime,
+        route.from_lat, route.from_lng, route.to_lat, route.to_lng, route.transport, event.to_name
+    ).join_from(TravelRoute.__table__, TravelEvent.__table__, event.id == route.event_id)
+    if trip_id is not None:
+        query = query.where(route.trip_id == trip_id)
+    if start_date:
+        query = query.where(route.start_datetime >= start_date)
+    if end_date:
+        query = query.where(route.start_datetime <= end_date)
+
+    rows = (await session.execute(query.order_by(route.start_datetime, route.event_id))).all()
+    columns = list(zip(*rows)) if rows else [()] * 9
+    return {
+        "count": len(rows),
+        "transport_modes": TRANSPORT_MODES,
+        "event_id": list(columns[0]),
+        "trip_id": list(columns[1]),
+        "start_datetime": [d.isoformat() for d in columns[2]],
+        "from_lat": list(columns[3]),
+        "from_lng": list(columns[4]),
+        "to_lat": list(columns[5]),
+        "to_lng": list(columns[6]),
+        "transport": list(columns[7]),
+        "to_name": list(columns[8]),
+    }
+
+@router.get("/legs/longest", response_model=List[TravelEventSummaryRead])
+@cached_response(TravelEvent)
+async def read_longest_legs(
+    limit: int = Query(10, ge=1, le=100),
+    trip_id: Optional[int] = None,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """Legs by great-circle length, longest first, read in distance_km index order."""
+    query = select(TravelEvent).where(TravelEvent.distance_km.is_not(None))
+    if trip_id is not None:
+        query = query.where(TravelEvent.trip_id == trip_id)
+    return (await session.exec(query.order_by(TravelEvent.distance_km.desc()).limit(limit))).all()
+
+def _media_in_trip(trip_id: Optional[int]):
+    if trip_id is None:
+        return ()
+    return (EventMedia.event_id.in_(select(TravelEvent.id).where(TravelEvent.trip_id == trip_id)),)
+
+@router.get("/bbox")
+@cached_response(TravelEvent, EventMedia)
+async def read_bbox(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+    trip_id: Optional[int] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Event destinations and geotagged media inside a bounding box, via the
+    geohash indexes. min_lng > max_lng selects a box across the antimeridian.
+    """
+    if min_lat > max_lat:
+        raise HTTPException(status_code=400, detail="min_lat must not exceed max_lat")
+    box = (min_lat, min_lng, max_lat, max_lng)
+    trip_filter = (TravelEvent.trip_id == trip_id,) if trip_id is not None else ()
+    events = await within_box(session, EVENT_POINTS, *box, *trip_filter, limit=limit)
+    media = await within_box(session, MEDIA_POINTS, *box, *_media_in_trip(trip_id), limit=limit)
+    return {
+        "events": [TravelEventSummaryRead.model_validate(e) for e in events],
+        "media": [EventMediaRead.model_validate(m) for m in media],
+    }
+
+@router.get("/near")
+@cached_response(TravelEvent, EventMedia)
+async def read_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(50, gt=0, le=SPATIAL_MAX_RADIUS_KM),
+    trip_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """Event destinations and geotagged media within radius_km of a point, nearest first."""
+    trip_filter = (TravelEvent.trip_id == trip_id,) if trip_id is not None else ()
+    events = await within_radius(session, EVENT_POINTS, lat, lng, radius_km, *trip_filter, limit=limit)
+    media = await within_radius(session, MEDIA_POINTS, lat, lng, radius_km, *_media_in_trip(trip_id), limit=limit)
+    return {
+        "events": [
+            {"distance_km": round(distance, 3), "event": TravelEventSummaryRead.model_validate(e)}
+            for e, distance in events
+        ],
+        "media": [
+            {"distance_km": round(distance, 3), "media": EventMediaRead.model_validate(m)}
+            for m, distance in media
+        ],
+    }
+
+@router.get("/stats")
+@cached_response(TravelStat)
+async def read_stats(session: AsyncSession = Depends(get_async_session)):
+    """
+    Travel totals with per-continent, country, year and transport breakdowns,
+    read from the aggregate table kept up to date on every write.
+    """
+    return stats_payload((await session.exec(select(TravelStat))).all())
+
 @router.post("/simple")
-async def create_simple_trip(req: SimpleTripRequest, session: Session = Depends(get_session)):
+async def create_simple_trip(req: SimpleTripRequest, session: AsyncSession = Depends(get_async_session)):
     # 1. Resolve all locations BEFORE starting DB transaction to avoid locking
-    # Resolve Start City
-    start_lat, start_lng = geocode_city(req.start_city)
+    coords = await run_in_threadpool(geocode_cities, [req.start_city] + [leg.city_name for leg in req.legs])
+    start_lat, start_lng = coords[0]
     if start_lat is None:
         raise HTTPException(status_code=400, detail=f"Could not resolve start city: {req.start_city}")
     
     legs_with_coords = []
-    for leg in req.legs:
-        dest_lat, dest_lng = geocode_city(leg.city_name)
+    for leg, (dest_lat, dest_lng) in zip(req.legs, coords[1:]):
         if dest_lat is None:
-            raise HTTPException(status_code=400, detail=f"Could not resolve leg city: {req.city_name}")
+            raise HTTPException(status_code=400, detail=f"Could not resolve leg city: {leg.city_name}")
         legs_with_coords.append((leg, dest_lat, dest_lng))
 
     # 2. Database Operations
     # 2.1 Create Trip
     trip = Trip(title=req.title)
     session.add(trip)
-    session.flush() # Get trip ID
+    await session.flush() # Get trip ID
     
     # 2.2 Create Events for each leg
     event_ids = []
@@ -129,7 +369,7 @@ async def create_simple_trip(req: SimpleTripRequest, session: Session = Depends(
             title=f"Flight to {leg.city_name}"
         )
         session.add(evt)
-        session.flush()
+        await session.flush()
         event_ids.append(evt.id)
         
         # Update for next
@@ -137,26 +377,29 @@ async def create_simple_trip(req: SimpleTripRequest, session: Session = Depends(
         current_lat, current_lng = dest_lat, dest_lng
         current_date = leg.arrival_date
     
-    session.commit()
+    await session.commit()
     return {"trip_id": trip.id, "event_ids": event_ids}
 
 # --- Trip Preparation Endpoints ---
 
 @router.get("/trips/{trip_id}/preparations", response_model=List[TripPreparation])
-def get_preparations(trip_id: int, session: Session = Depends(get_session)):
-    return session.exec(select(TripPreparation).where(TripPreparation.trip_id == trip_id)).all()
+@cached_response(TripPreparation)
+async def get_preparations(trip_id: int, session: AsyncSession = Depends(get_async_session)):
+    return (await session.exec(select(TripPreparation).where(TripPreparation.trip_id == trip_id))).all()
 
 @router.post("/trips/{trip_id}/preparations", response_model=TripPreparation)
-def create_preparation(trip_id: int, prep: TripPreparation, session: Session = Depends(get_session)):
+async def create_preparation(trip_id: int, prep: TripPreparation, session: AsyncSession = Depends(get_async_session)):
+    if not await session.get(Trip, trip_id):
+        raise HTTPException(status_code=404, detail="Trip not found")
     prep.trip_id = trip_id
     session.add(prep)
-    session.commit()
-    session.refresh(prep)
+    await session.commit()
+    await session.refresh(prep)
     return prep
 
 @router.patch("/preparations/{prep_id}", response_model=TripPreparation)
-def update_preparation(prep_id: int, prep_data: dict, session: Session = Depends(get_session)):
-    db_prep = session.get(TripPreparation, prep_id)
+async def update_preparation(prep_id: int, prep_data: dict, session: AsyncSession = Depends(get_async_session)):
+    db_prep = await session.get(TripPreparation, prep_id)
     if not db_prep:
         raise HTTPException(status_code=404, detail="Preparation item not found")
     
@@ -165,19 +408,28 @@ def update_preparation(prep_id: int, prep_data: dict, session: Session = Depends
         setattr(db_prep, key, value)
     
     session.add(db_prep)
-    session.commit()
-    session.refresh(db_prep)
+    await session.commit()
+    await session.refresh(db_prep)
     return db_prep
 
 @router.delete("/preparations/{prep_id}")
-def delete_preparation(prep_id: int, session: Session = Depends(get_session)):
-    db_prep = session.get(TripPreparation, prep_id)
+async def delete_preparation(prep_id: int, session: AsyncSession = Depends(get_async_session)):
+    db_prep = await session.get(TripPreparation, prep_id)
     if not db_prep:
         raise HTTPException(status_code=404, detail="Preparation item not found")
-    session.delete(db_prep)
-    session.commit()
+    await session.delete(db_prep)
+    await session.commit()
     return {"ok": True}
 
+async def _load_trip(session: AsyncSession, trip_id: int) -> Optional[Trip]:
+    """Trip with events and media eager-loaded (async sessions cannot lazy-load)."""
+    return (await session.exec(
+        select(Trip)
+        .where(Trip.id == trip_id)
+        .options(selectinload(Trip.events).selectinload(TravelEvent.media_list))
+        .execution_options(populate_existing=True)
+    )).first()
+
 class TripUpdate(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
@@ -185,8 +437,8 @@ class TripUpdate(BaseModel):
     cost: Optional[float] = None
 
 @router.patch("/trips/{trip_id}", response_model=TripRead)
-def update_trip(trip_id: int, trip_update: TripUpdate, session: Session = Depends(get_session)):
-    trip = session.get(Trip, trip_id)
+async def update_trip(trip_id: int, trip_update: TripUpdate, session: AsyncSession = Depends(get_async_session)):
+    trip = await session.get(Trip, trip_id)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
         
@@ -195,147 +447,187 @@ def update_trip(trip_id: int, trip_update: TripUpdate, session: Session = Depend
         setattr(trip, key, value)
         
     session.add(trip)
-    session.commit()
-    session.refresh(trip)
-    return trip
+    await session.commit()
+    return await _load_trip(session, trip_id)
 
 
 
 @router.delete("/trips/{trip_id}")
-def delete_trip(trip_id: int, session: Session = Depends(get_session)):
-    trip = session.get(Trip, trip_id)
+async def delete_trip(trip_id: int, session: AsyncSession = Depends(get_async_session)):
+    trip = await _load_trip(session, trip_id)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     
     # Manually delete events to ensure cascade
     for event in trip.events:
-        session.delete(event)
+        await session.delete(event)
+    for prep in (await session.exec(select(TripPreparation).where(TripPreparation.trip_id == trip_id))).all():
+        await session.delete(prep)
         
-    session.delete(trip)
-    session.commit()
+    await session.delete(trip)
+    await session.commit()
+    await release_unreferenced(session, get_storage())
     return {"ok": True}
 
 @router.post("/{event_id}/media")
-async def upload_media(event_id: int, files: List[UploadFile] = File(...), session: Session = Depends(get_session)):
-    db_event = session.get(TravelEvent, event_id)
+async def upload_media(event_id: int, files: List[UploadFile] = Depends(hashed_uploads), session: AsyncSession = Depends(get_async_session)):
+    db_event = await session.get(TravelEvent, event_id)
     if not db_event:
         raise HTTPException(status_code=404, detail="Event not found")
     
-    endpoint = os.getenv('MINIO_ENDPOINT', 'http://minio:9000')
-    s3 = boto3.client(
-        's3',
-        endpoint_url=endpoint if endpoint.startswith('http') else f"http://{endpoint}",
-        aws_access_key_id=os.getenv('MINIO_ACCESS_KEY', 'minioadmin'),
-        aws_secret_access_key=os.getenv('MINIO_SECRET_KEY', 'minioadmin')
-    )
-    bucket_name = os.getenv('MINIO_BUCKET', 'voyage-media')
-    
-    # Ensure bucket exists
-    try:
-        s3.head_bucket(Bucket=bucket_name)
-    except Exception:
-        s3.create_bucket(Bucket=bucket_name)
-        # Apply public read policy to new bucket
-        policy = {
-            "Version": "2012-10-17",
-            "Statement": [{
-                "Sid": "PublicRead",
-                "Effect": "Allow",
-                "Principal": "*",
-                "Action": ["s3:GetObject"],
-                "Resource": [f"arn:aws:s3:::{bucket_name}/*"]
-            }]
-        }
-        s3.put_bucket_policy(Bucket=bucket_name, Policy=json.dumps(policy))
-        print(f"DEBUG: Created bucket {bucket_name} and applied public read policy")
-
-    new_media_list = []
-    print(f"DEBUG: upload_media started for event {event_id} with {len(files)} files")
-    for file in files:
-        # Create a temporary file to analyze it locally before uploading to S3
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
-
-        try:
-            # 1. Intelligence: Analyze metadata
-            intelligence = analyze_media(tmp_path)
-            print(f"DEBUG: Intelligence for {file.filename}: {intelligence}")
-
-            # 2. Intelligence: Auto-Destination Logic
-            # If the photo has a city, check if it exists in this trip. If not, create it.
-            target_event_id = event_id
-            photo_city = intelligence.get("city")
-            if photo_city:
-                trip_id = db_event.trip_id
-                # Search for an event with this city name in the same trip
-                existing_event = session.exec(
+    storage = get_storage()
+    # Files are processed concurrently; the session is shared, so destination
+    # lookups/creation are serialized. Photos with coordinates join the trip's
+    # nearest destination within DESTINATION_MATCH_KM (geohash index, see
+    # utils/spatial.py); photos with only a city are matched by name.
+    session_lock = asyncio.Lock()
+    destination_ids = {}
+
+    async def resolve_destination(intelligence):
+        # If the photo has a city, find its destination in this trip. If there is none, create it.
+        photo_city = intelligence.get("city")
+        lat, lng = intelligence.get("lat"), intelligence.get("lng")
+        located = lat is not None and lng is not None
+        if not photo_city and not located:
+            return event_id
+        async with session_lock:
+            trip_id = db_event.trip_id
+            if located:
+                # Destinations created by this upload are flushed, so they are found here too
+                nearest = await nearest_destination(session, trip_id, lat, lng, DESTINATION_MATCH_KM)
+                if nearest:
+                    return nearest[0].id
+            elif photo_city in destination_ids:
+                return destination_ids[photo_city]
+            else:
+                existing_event = (await session.exec(
                     select(TravelEvent).where(
-                        TravelEvent.trip_id == trip_id, 
+                        TravelEvent.trip_id == trip_id,
                         TravelEvent.to_name == photo_city
                     )
-                ).first()
-                
+                )).first()
                 if existing_event:
-                    target_event_id = existing_event.id
-                else:
-                    # Create a new event for this destination automatically
-                    print(f"DEBUG: Creating new destination '{photo_city}' for trip {trip_id}")
-                    new_evt = TravelEvent(
-                        trip_id=trip_id,
-                        title=f"Visit to {photo_city}",
-                        to_name=photo_city,
-                        from_name=db_event.to_name, # Default from current
-                        from_lat=db_event.to_lat,
-                        from_lng=db_event.to_lng,
-                        to_lat=intelligence.get("lat") or 0,
-                        to_lng=intelligence.get("lng") or 0,
-                        start_datetime=intelligence.get("captured_at") or datetime.now(),
-                        transport="car" # Assume car/bus for auto-detected local spots
-                    )
-                    session.add(new_evt)
-                    session.flush() # Get the new ID
-                    target_event_id = new_evt.id
-
-            # 3. Upload to S3
-            with open(tmp_path, 'rb') as f_data:
-                s3.upload_fileobj(f_data, bucket_name, f"events/{target_event_id}/{file.filename}")
-            
-            # URL encode the filename
-            encoded_filename = urllib.parse.quote(file.filename)
-            encoded_file_path = f"events/{target_event_id}/{encoded_filename}"
-            public_url_base = os.getenv('MEDIA_PUBLIC_URL', 'http://localhost:9999')
-            
-            # Determine media type
-            lower_filename = file.filename.lower()
-            if "pano" in lower_filename:
-                m_type = "pano_image"
-            elif any(lower_filename.endswith(ext) for ext in ['.mp4', '.mov', '.avi', '.mkv']):
-                m_type = "video"
-            else:
-                m_type = "image"
-                
-            media = EventMedia(
-                event_id=target_event_id,
-                url=f"{public_url_base}/{bucket_name}/{encoded_file_path}",
-                media_type=m_type,
-                captured_at=intelligence.get("captured_at"),
-                lat=intelligence.get("lat"),
-                lng=intelligence.get("lng"),
-                city=intelligence.get("city"),
-                country=intelligence.get("country")
+                    destination_ids[photo_city] = existing_event.id
+                    return existing_event.id
+            if not photo_city:
+                return event_id
+
+            # Create a new event for this destination automatically
+            print(f"DEBUG: Creating new destination '{photo_city}' for trip {trip_id}")
+            new_evt = TravelEvent(
+                trip_id=trip_id,
+                title=f"Visit to {photo_city}",
+                to_name=photo_city,
+                from_name=db_event.to_name, # Default from current
+                from_lat=db_event.to_lat,
+                from_lng=db_event.to_lng,
+                to_lat=lat or 0,
+                to_lng=lng or 0,
+                start_datetime=intelligence.get("captured_at") or datetime.now(),
+                transport="car" # Assume car/bus for auto-detected local spots
             )
-            session.add(media)
-            new_media_list.append(media)
-            
-        finally:
-            # Cleanup temp file
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-    
-    session.commit()
+            session.add(new_evt)
+            await session.flush() # Get the new ID
+            destination_ids[photo_city] = new_evt.id
+            return new_evt.id
+
+    async def process(item):
+        file, content_hash = item
+        blob = blobs[content_hash]
+        intelligence = metadata_from_json(blob.intelligence)
+        print(f"DEBUG: Intelligence for {file.filename}: {intelligence}")
+
+        # 4. Intelligence: Auto-Destination Logic
+        target_event_id = await resolve_destination(intelligence)
+
+        return EventMedia(
+            event_id=target_event_id,
+            url=storage.url_for(blob.key),
+            media_type=media_type_for(file.filename),
+            content_hash=content_hash,
+            derivatives=blob.derivatives,
+            **_derivative_urls(storage, blob.key, (blob.derivatives or "").split(",")),
+            captured_at=intelligence.get("captured_at"),
+            lat=intelligence.get("lat"),
+            lng=intelligence.get("lng"),
+            city=intelligence.get("city"),
+            country=intelligence.get("country")
+        )
+
+    print(f"DEBUG: upload_media started for event {event_id} with {len(files)} files")
+    # 1. Content hashes, computed while the request body was spooled
+    hashes = [file.content_hash for file in files]
+    blobs = {
+        blob.content_hash: blob
+        for blob in (await session.exec(select(MediaBlob).where(MediaBlob.content_hash.in_(set(hashes))))).all()
+    }
+    first_upload = {}
+    for file, content_hash in zip(files, hashes):
+        first_upload.setdefault(content_hash, file)
+
+    # 2. Intelligence: only content never seen before is analyzed (header bytes
+    # only, geocoded as one batch); known content reuses the cached result
+    unseen = [content_hash for content_hash in first_upload if content_hash not in blobs]
+    intelligence_list = await analyze_uploads([first_upload[content_hash] for content_hash in unseen])
+    for content_hash, intelligence in zip(unseen, intelligence_list):
+        file = first_upload[content_hash]
+        blobs[content_hash] = MediaBlob(
+            content_hash=content_hash,
+            key=blob_key(content_hash, file.filename),
+            size=file.size,
+            content_type=file.content_type,
+            intelligence=metadata_to_json(intelligence)
+        )
+
+    # 3. New content is stored and rendered before anything is written, so the
+    # database write lock is never held across object storage or rendering.
+    # The lookup's read transaction ends first; expire_on_commit=False keeps
+    # the loaded rows usable.
+    await session.commit()
+    async def store(content_hash):
+        file, blob = first_upload[content_hash], blobs[content_hash]
+        await run_blocking(store_upload, storage, file, blob.key)
+        # Derivatives come from the spooled upload rather than a storage round trip
+        names = await run_blocking(create_derivatives, storage, file.file, blob.key, media_type_for(file.filename))
+        blob.derivatives = ",".join(names)
+
+    await map_bounded(store, unseen)
+    if len(unseen) < len(files):
+        print(f"DEBUG: {len(files) - len(unseen)} of {len(files)} files reuse stored content")
+
+    # 4. One short write transaction for blob, destination and media rows. A
+    # concurrent upload of the same content may have created its blob row
+    # meanwhile: that row wins and our copy is dropped. A known blob released
+    # meanwhile is recreated here and its bytes stored again afterwards.
+    stored = set(unseen)
+    duplicate_keys, restored = [], []
+    for content_hash, blob in list(blobs.items()):
+        result = await session.execute(insert_blob(session.bind.dialect.name, blob))
+        if result.rowcount:
+            if content_hash not in stored:
+                restored.append(content_hash)
+        elif content_hash in stored:
+            winner = (await session.exec(select(MediaBlob).where(MediaBlob.content_hash == content_hash))).one()
+            if winner.key != blob.key:
+                duplicate_keys.append(blob.key)
+            blobs[content_hash] = winner
+
+    new_media_list = await map_bounded(process, list(zip(files, hashes)))
+    session.add_all(new_media_list)
+    await session.commit()
+
+    for key in duplicate_keys:
+        await run_blocking(storage.delete, key)
+        await run_blocking(delete_derivatives, storage, key)
+    if restored:
+        await map_bounded(store, restored)
+        for content_hash in restored:
+            await session.execute(
+                update(MediaBlob).where(MediaBlob.content_hash == content_hash).values(derivatives=blobs[content_hash].derivatives)
+            )
+        await session.commit()
     for media in new_media_list:
-        session.refresh(media)
+        await session.refresh(media)
         
     return new_media_list
 
@@ -345,21 +637,11 @@ async def analyze_files(files: List[UploadFile] = File(...)):
     Intelligent bulk analysis for suggestion workflow.
     Takes multiple files, extracts metadata, and clusters them into travel event suggestions.
     """
-    analyzed_data = []
-    for file in files:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
-        
-        try:
-            intelligence = analyze_media(tmp_path)
-            analyzed_data.append({
-                "filename": file.filename,
-                "intelligence": intelligence
-            })
-        finally:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+    intelligence_list = await run_blocking(extract_uploads_in_pool, files)
+    analyzed_data = [
+        {"filename": file.filename, "intelligence": intelligence}
+        for file, intelligence in zip(files, intelligence_list)
+    ]
                 
     # Use clustering logic to group into suggested events
     suggestions = cluster_media_to_suggestions(analyzed_data)
@@ -370,16 +652,64 @@ async def analyze_files(files: List[UploadFile] = File(...)):
     }
 
 
+def _job_payload(job, items=None):
+    payload = {
+        "job_id": job.id,
+        "status": job.status,
+        "total": job.total,
+        "processed": job.processed,
+        "failed": job.failed,
+        "suggestions": json.loads(job.suggestions) if job.suggestions else [],
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+    if items is not None:
+        payload["items"] = [
+            {
+                "filename": item.filename,
+                "status": item.status,
+                "intelligence": metadata_from_json(item.intelligence) if item.intelligence else None,
+                "error": item.error,
+            }
+            for item in items
+        ]
+    return payload
+
+@router.post("/analyze/jobs", status_code=202)
+async def create_analysis_job(files: List[UploadFile] = File(...)):
+    """
+    Queue a bulk analysis and return at once. Poll GET /events/analyze/jobs/{job_id}
+    for progress; suggestions fill in while the files are being analyzed.
+    """
+    job = await run_in_threadpool(create_job, [(file.filename, file.file) for file in files])
+    print(f"DEBUG: Queued analysis job {job.id} with {job.total} files")
+    return _job_payload(job)
+
+@router.get("/analyze/jobs/{job_id}")
+@cached_response(AnalysisJob, AnalysisJobItem)
+async def read_analysis_job(job_id: int, include_items: bool = False, session: AsyncSession = Depends(get_async_session)):
+    job = await session.get(AnalysisJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    items = None
+    if include_items:
+        items = (await session.exec(
+            select(AnalysisJobItem).where(AnalysisJobItem.job_id == job_id).order_by(AnalysisJobItem.id)
+        )).all()
+    return _job_payload(job, items)
+
 @router.post("/", response_model=TravelEvent)
-def create_event(event: TravelEvent, session: Session = Depends(get_session)):
+async def create_event(event: TravelEvent, session: AsyncSession = Depends(get_async_session)):
+    if not await session.get(Trip, event.trip_id):
+        raise HTTPException(status_code=404, detail="Trip not found")
     session.add(event)
-    session.commit()
-    session.refresh(event)
+    await session.commit()
+    await session.refresh(event)
     return event
 
 @router.patch("/{event_id}", response_model=TravelEvent)
-def update_event(event_id: int, event_data: dict, session: Session = Depends(get_session)):
-    db_event = session.get(TravelEvent, event_id)
+async def update_event(event_id: int, event_data: dict, session: AsyncSession = Depends(get_async_session)):
+    db_event = await session.get(TravelEvent, event_id)
     if not db_event:
         raise HTTPException(status_code=404, detail="Event not found")
     for key, value in event_data.items():
@@ -391,155 +721,141 @@ def update_event(event_id: int, event_data: dict, session: Session = Depends(get
                 pass # Fallback or let it fail if invalid format
         setattr(db_event, key, value)
     session.add(db_event)
-    session.commit()
-    session.refresh(db_event)
+    await session.commit()
+    await session.refresh(db_event)
     return db_event
 
 @router.delete("/{event_id}")
-def delete_event(event_id: int, session: Session = Depends(get_session)):
-    db_event = session.get(TravelEvent, event_id)
+async def delete_event(event_id: int, session: AsyncSession = Depends(get_async_session)):
+    db_event = await session.get(TravelEvent, event_id, options=[selectinload(TravelEvent.media_list)])
     if not db_event:
         raise HTTPException(status_code=404, detail="Event not found")
-    session.delete(db_event)
-    session.commit()
+    content_hashes = [media.content_hash for media in db_event.media_list if media.content_hash]
+    await session.delete(db_event)
+    await session.commit()
+    await release_unreferenced(session, get_storage(), content_hashes)
     return {"ok": True}
 
+@router.get("/media/{media_id}/{name}")
+async def read_media_derivative(media_id: int, name: str, session: AsyncSession = Depends(get_async_session)):
+    """
+    Redirect to a thumbnail, preview or panorama tile manifest, rendering the
+    derivatives on first request for media stored before they existed. Media
+    that cannot be rendered redirect to the original (tiles: 404); the attempt
+    is recorded in `derivatives`, so it is not repeated on every request.
+    """
+    if name not in DERIVATIVE_FIELDS:
+        raise HTTPException(status_code=404, detail="Unknown derivative")
+    db_media = await session.get(EventMedia, media_id)
+    if not db_media:
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    url = getattr(db_media, DERIVATIVE_FIELDS[name])
+    if not url and db_media.derivatives is None:
+        storage = get_storage()
+        object_key = storage.key_from_url(db_media.url)
+        names = None
+        if object_key and can_render(db_media.media_type):
+            try:
+                names = await run_blocking(create_stored_derivatives, storage, object_key, db_media.media_type)
+            except Exception as e:
+                # e.g. the original could not be downloaded: try again on a later request
+                print(f"DEBUG: Failed to render derivatives for media {media_id}: {e}")
+        if names is not None:
+            # An empty list is recorded too: the original cannot be rendered
+            urls = _derivative_urls(storage, object_key, names)
+            derivatives = ",".join(names)
+            if db_media.content_hash:
+                # Every row sharing the object gets the URLs
+                await session.execute(
+                    update(EventMedia).where(EventMedia.content_hash == db_media.content_hash)
+                    .values(derivatives=derivatives, **urls)
+                )
+                await session.execute(
+                    update(MediaBlob).where(MediaBlob.content_hash == db_media.content_hash).values(derivatives=derivatives)
+                )
+            else:
+                await session.execute(update(EventMedia).where(EventMedia.id == media_id).values(derivatives=derivatives, **urls))
+            await session.commit()
+            url = urls.get(DERIVATIVE_FIELDS[name])
+    if not url and name == "tiles":
+        # The viewer then loads the full image instead
+        raise HTTPException(status_code=404, detail="Panorama has no tiles")
+    return RedirectResponse(url or db_media.url)
+
 @router.delete("/media/{media_id}")
-def delete_media(media_id: int, session: Session = Depends(get_session)):
-    db_media = session.get(EventMedia, media_id)
+async def delete_media(media_id: int, session: AsyncSession = Depends(get_async_session)):
+    db_media = await session.get(EventMedia, media_id)
     if not db_media:
         raise HTTPException(status_code=404, detail="Media not found")
     
-    # Attempt to delete from Minio
-    try:
-        endpoint = os.getenv('MINIO_ENDPOINT', 'http://minio:9000')
-        s3 = boto3.client(
-            's3',
-            endpoint_url=endpoint if endpoint.startswith('http') else f"http://{endpoint}",
-            aws_access_key_id=os.getenv('MINIO_ACCESS_KEY', 'minioadmin'),
-            aws_secret_access_key=os.getenv('MINIO_SECRET_KEY', 'minioadmin')
-        )
-        bucket_name = os.getenv('MINIO_BUCKET', 'voyage-media')
-        
-        # Extract object key from URL
-        # URL format: http://host:port/bucket_name/path/to/file
-        # We need 'path/to/file'
-        
-        # Simple parsing logic assuming standard structure
-        parts = db_media.url.split(f"/{bucket_name}/")
-        if len(parts) > 1:
-            object_key = parts[1]
-            # Decode URL encoded characters (e.g. %20 -> space) if strictly needed, 
-            # but usually S3 keys handling via boto3 might expect the exact key used during upload.
-            # During upload we used: events/{event_id}/{encoded_filename}
-            # So the URL component IS the key as stored in S3 (since we stored encoded path).
-            
-            s3.delete_object(Bucket=bucket_name, Key=object_key)
-            print(f"DEBUG: Deleted S3 object {object_key}")
-    except Exception as e:
-        print(f"ERROR: Failed to delete media from Minio: {e}")
-        # We proceed to delete from DB even if S3 fails, to keep app consistent? 
-        # Or fail? Let's log and proceed to avoid orphaned DB records blocking UI.
-
-    session.delete(db_media)
-    session.commit()
+    storage = get_storage()
+    content_hash = db_media.content_hash
+    if not content_hash:
+        # Media uploaded before content addressing owns its object, unless a blob shares the key
+        try:
+            object_key = storage.key_from_url(db_media.url)
+            if object_key and not await owned_by_blob(session, object_key):
+                await run_in_threadpool(storage.delete, object_key)
+                await run_in_threadpool(delete_derivatives, storage, object_key)
+                print(f"DEBUG: Deleted stored object {object_key}")
+        except Exception as e:
+            print(f"ERROR: Failed to delete media from storage: {e}")
+            # Proceed with the DB delete anyway so orphaned records don't block the UI.
+
+    await session.delete(db_media)
+    await session.commit()
+    if content_hash:
+        # The blob (and its object) goes with its last reference
+        await release_unreferenced(session, storage, [content_hash])
     return {"ok": True}
 
 @router.get("/export")
-def export_data(
-    start_date: Optional[datetime] = None, 
-    end_date: Optional[datetime] = None, 
-    session: Session = Depends(get_session)
+async def export_data(
+        start_date: Optional[datetime] = None, 
+        end_date: Optional[datetime] = None, 
+        format: str = Query("json", pattern="^(json|ndjson)$")
 ):
-    query = select(TravelEvent).options(selectinload(TravelEvent.media_list))
-    
-    if start_date:
-        query = query.where(TravelEvent.start_datetime >= start_date)
-    if end_date:
-        query = query.where(TravelEvent.start_datetime <= end_date)
-        
-    events = session.exec(query.order_by(TravelEvent.start_datetime)).all()
-    
-    # Group by Trip
-    trips_data = {}
-    for event in events:
-        trip_id = event.trip_id
-        if trip_id not in trips_data:
-            # Get Trip title
-            trip = session.get(Trip, trip_id)
-            trips_data[trip_id] = {
-                "title": trip.title if trip else "Unnamed Trip",
-                "events": []
-            }
-        
-        # Serialize event
-        event_dict = {
-            "title": event.title,
-            "from_name": event.from_name,
-            "to_name": event.to_name,
-            "from_lat": event.from_lat,
-            "from_lng": event.from_lng,
-            "to_lat": event.to_lat,
-            "to_lng": event.to_lng,
-            "start_datetime": event.start_datetime.isoformat(),
-            "transport": event.transport,
-            "note": event.note
-        }
-        trips_data[trip_id]["events"].append(event_dict)
-        
-    return {
-        "version": "1.0",
-        "export_date": datetime.now().isoformat(),
-        "trips": list(trips_data.values())
-    }
+    # Streamed in batches from the exporter's own session; nothing is built in memory
+    filename = f"voyage_atlas_export_{datetime.now().date().isoformat()}.{format}"
+    return StreamingResponse(
+        stream_events_export(start_date, end_date, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 @router.post("/import")
-async def import_data(data: dict, session: Session = Depends(get_session)):
-    if "trips" not in data:
-        raise HTTPException(status_code=400, detail="Invalid data format: 'trips' key missing")
-    
-    import_count_trips = 0
-    import_count_events = 0
-    
-    for trip_data in data["trips"]:
-        # Create Trip
-        new_trip = Trip(title=trip_data.get("title", "Imported Trip"))
-        session.add(new_trip)
-        session.flush() # Get Trip ID
-        import_count_trips += 1
-        
-        for e_data in trip_data.get("events", []):
-            new_event = TravelEvent(
-                trip_id=new_trip.id,
-                title=e_data.get("title"),
-                from_name=e_data.get("from_name"),
-                to_name=e_data.get("to_name"),
-                from_lat=e_data.get("from_lat"),
-                from_lng=e_data.get("from_lng"),
-                to_lat=e_data.get("to_lat"),
-                to_lng=e_data.get("to_lng"),
-                start_datetime=datetime.fromisoformat(e_data.get("start_datetime")),
-                transport=e_data.get("transport", "plane"),
-                note=e_data.get("note")
-            )
-            session.add(new_event)
-            import_count_events += 1
-            
-    session.commit()
+async def import_data(request: Request, session: AsyncSession = Depends(get_async_session)):
+    # The body is parsed and inserted as it arrives, in bulk batches
+    def trip_row(trip_data):
+        title = trip_data.get("title") or "Imported Trip"
+        if not isinstance(title, str):
+            raise ValueError(f"Trip title {title!r} is not text")
+        return {"title": title, "created_at": datetime.utcnow()}
+
+    try:
+        counts = await import_trips(session, request.stream(), trip_row, total_bytes=request.headers.get("content-length"))
+    except ValueError as exc:
+        await session.rollback()
+        raise HTTPException(status_code=400, detail=str(exc))
+
     return {
         "status": "success",
-        "imported_trips": import_count_trips,
-        "imported_events": import_count_events
+        "imported_trips": counts["trips"],
+        "imported_events": counts["events"]
     }
 
 @router.delete("/all/clear")
-def delete_all_events(session: Session = Depends(get_session)):
-    events = session.exec(select(TravelEvent)).all()
+async def delete_all_events(session: AsyncSession = Depends(get_async_session)):
+    events = (await session.exec(select(TravelEvent).options(selectinload(TravelEvent.media_list)))).all()
     for event in events:
-        session.delete(event)
+        await session.delete(event)
+    for prep in (await session.exec(select(TripPreparation))).all():
+        await session.delete(prep)
     # Also delete orphan trips
-    trips = session.exec(select(Trip)).all()
+    trips = (await session.exec(select(Trip).options(selectinload(Trip.events)))).all()
     for trip in trips:
-        session.delete(trip)
-    session.commit()
+        await session.delete(trip)
+    await session.commit()
+    await release_unreferenced(session, get_storage())
     return {"ok": True}
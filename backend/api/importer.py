@@ -1,64 +1,122 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 import pandas as pd
 import io
 from datetime import datetime
-from sqlmodel import Session
-from database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import get_async_session
 from models import TravelEvent, EventMedia, Trip
 from sqlmodel import select, col
 import json
 from typing import List
 from datetime import date
 from sqlalchemy.orm import selectinload
+from starlette.concurrency import run_in_threadpool
+from utils.exporter import stream_trips_export, EXPORT_FORMATS
+from utils.bulk import BULK_CHUNK_SIZE, insert_events, insert_media
+from utils.json_import import import_trips, upload_chunks, parse_datetime
 
 router = APIRouter(prefix="/data", tags=["data"])
 
+CSV_COORDINATES = ["from_lat", "from_lng", "to_lat", "to_lng"]
+CSV_REQUIRED_TEXT = ["from_name", "to_name", "title"]
+CSV_EVENT_COLUMNS = ["start_datetime", *CSV_REQUIRED_TEXT[:2], *CSV_COORDINATES, "title", "note"]
+CSV_DTYPES = {column: "string" for column in ["start_datetime", *CSV_REQUIRED_TEXT, "note", "media_url"]}
+
+def _to_naive_datetime(value):
+    parsed = pd.to_datetime(value, errors="coerce")
+    return parsed.tz_localize(None) if parsed is not pd.NaT and parsed.tzinfo else parsed
+
+def _parse_datetimes(values):
+    """
+    Column-wise ISO 8601 parsing; other formats and mixed UTC offsets fall
+    back to parsing those values one by one. Offsets are dropped, keeping the
+    wall-clock time, as storing a TravelEvent does.
+    """
+    try:
+        parsed = pd.to_datetime(values, errors="coerce", format="ISO8601")
+        if parsed.dt.tz is not None:
+            parsed = parsed.dt.tz_localize(None)
+    except (ValueError, TypeError):
+        parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    retry = parsed.isna() & values.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(values[retry].map(_to_naive_datetime), errors="coerce")
+    return parsed
+
+def _read_events_csv(source):
+    """
+    Parse and validate an events CSV column by column.
+    Returns (frame of valid rows, ["Row i: reason", ...]) with the first
+    problem of every rejected row.
+    """
+    df = pd.read_csv(source, dtype=CSV_DTYPES)
+    problems = pd.Series(pd.NA, index=df.index, dtype="object")
+
+    def reject(mask, reason):
+        mask = mask & problems.isna()
+        if mask.any():
+            problems[mask] = reason
+
+    for column in ["start_datetime", *CSV_COORDINATES, *CSV_REQUIRED_TEXT]:
+        if column not in df.columns:
+            reject(pd.Series(True, index=df.index), repr(column))
+    if "start_datetime" in df.columns:
+        df["start_datetime"] = _parse_datetimes(df["start_datetime"])
+        reject(df["start_datetime"].isna(), "invalid start_datetime")
+    for column in CSV_COORDINATES:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+            reject(df[column].isna(), f"invalid {column}")
+    for column in CSV_REQUIRED_TEXT:
+        if column in df.columns:
+            reject(df[column].isna(), f"missing {column}")
+
+    failed = problems.notna()
+    errors = [f"Row {index}: {reason}" for index, reason in problems[failed].items()]
+    return df[~failed], errors
+
+def _nullable(column):
+    return column.astype(object).where(column.notna(), None).tolist()
+
+def _event_rows(part, trip_id):
+    columns = [
+        part["start_datetime"].dt.to_pydatetime().tolist(),
+        *(part[column].tolist() for column in CSV_EVENT_COLUMNS[1:-1]),
+        _nullable(part["note"]) if "note" in part.columns else [None] * len(part),
+    ]
+    return [dict(zip(CSV_EVENT_COLUMNS, values), trip_id=trip_id, transport="plane") for values in zip(*columns)]
+
+def _media_rows(part, event_ids):
+    if "media_url" not in part.columns:
+        return []
+    urls = _nullable(part["media_url"])
+    return [
+        {"event_id": event_id, "url": url, "media_type": "pano_image" if "sphere" in url.lower() else "image"}
+        for event_id, url in zip(event_ids, urls) if url
+    ]
+
 @router.post("/csv")
-async def import_csv(file: UploadFile = File(...), trip_id: int = 1, session: Session = Depends(get_session)):
+async def import_csv(file: UploadFile = File(...), trip_id: int = 1, session: AsyncSession = Depends(get_async_session)):
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload a CSV.")
     
-    contents = await file.read()
-    df = pd.read_csv(io.BytesIO(contents))
-    
-    results = []
-    errors = []
+    if not await session.get(Trip, trip_id):
+        raise HTTPException(status_code=404, detail="Trip not found")
     
-    for index, row in df.iterrows():
-        try:
-            event = TravelEvent(
-                trip_id=trip_id,
-                start_datetime=pd.to_datetime(row['start_datetime']),
-                from_name=row['from_name'],
-                to_name=row['to_name'],
-                from_lat=float(row['from_lat']),
-                from_lng=float(row['from_lng']),
-                to_lat=float(row['to_lat']),
-                to_lng=float(row['to_lng']),
-                title=row['title'],
-                note=row.get('note')
-            )
-            session.add(event)
-            session.flush() # Get event ID
-            
-            # Add media if exists in CSV
-            media_url = row.get('media_url')
-            if media_url and pd.notna(media_url):
-                media = EventMedia(
-                    event_id=event.id,
-                    url=str(media_url),
-                    media_type="pano_image" if "sphere" in str(media_url).lower() else "image"
-                )
-                session.add(media)
-                
-            results.append(row['title'])
-        except Exception as e:
-            errors.append(f"Row {index}: {str(e)}")
+    # Parsed straight from the spooled upload; validation is column-wise
+    valid, errors = await run_in_threadpool(_read_events_csv, file.file)
+
+    # Bulk inserts chunk by chunk, all in one transaction
+    for start in range(0, len(valid), BULK_CHUNK_SIZE):
+        part = valid.iloc[start:start + BULK_CHUNK_SIZE]
+        event_ids = await insert_events(session, _event_rows(part, trip_id))
+        await insert_media(session, _media_rows(part, event_ids))
             
-    session.commit()
+    await session.commit()
     
     return {
-        "imported": len(results),
+        "imported": len(valid),
         "failed": len(errors),
         "errors": errors
     }
@@ -67,111 +125,40 @@ async def import_csv(file: UploadFile = File(...), trip_id: int = 1, session: Se
 async def export_json(
     start_date: date,
     end_date: date,
-    session: Session = Depends(get_session)
+    format: str = Query("json", pattern="^(json|ndjson)$")
 ):
-    # Find trips that have events within the date range
-    statement = (
-        select(Trip)
-        .join(TravelEvent)
-        .where(TravelEvent.start_datetime >= datetime.combine(start_date, datetime.min.time()))
-        .where(TravelEvent.start_datetime <= datetime.combine(end_date, datetime.max.time()))
-        .distinct()
-        .options(selectinload(Trip.events).selectinload(TravelEvent.media_list))
+    # Trips that have events within the date range, streamed trip by trip
+    return StreamingResponse(
+        stream_trips_export(
+            datetime.combine(start_date, datetime.min.time()),
+            datetime.combine(end_date, datetime.max.time()),
+            format
+        ),
+        media_type=EXPORT_FORMATS[format]
     )
-    
-    trips = session.exec(statement).all()
-    
-    export_data = {
-        "version": "1.0",
-        "exported_at": datetime.now().isoformat(),
-        "date_range": {
-            "start": start_date.isoformat(),
-            "end": end_date.isoformat()
-        },
-        "trips": [
-            {
-                "title": trip.title,
-                "description": trip.description,
-                "created_at": trip.created_at.isoformat() if trip.created_at else None,
-                "events": [
-                    {
-                        "start_datetime": event.start_datetime.isoformat(),
-                        "from_name": event.from_name,
-                        "to_name": event.to_name,
-                        "from_lat": event.from_lat,
-                        "from_lng": event.from_lng,
-                        "to_lat": event.to_lat,
-                        "to_lng": event.to_lng,
-                        "transport": event.transport,
-                        "title": event.title,
-                        "note": event.note,
-                        "media_list": [
-                            {
-                                "url": media.url,
-                                "media_type": media.media_type
-                            } for media in event.media_list
-                        ]
-                    } for event in trip.events
-                ]
-            } for trip in trips
-        ]
-    }
-    
-    return export_data
 
 @router.post("/import/json")
-async def import_json(file: UploadFile = File(...), session: Session = Depends(get_session)):
+async def import_json(file: UploadFile = File(...), session: AsyncSession = Depends(get_async_session)):
     if not file.filename.endswith('.json'):
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload a JSON file.")
-    
-    contents = await file.read()
+
+    def trip_row(trip_data):
+        title = trip_data.get('title')
+        description = trip_data.get('description')
+        if description is not None and not isinstance(description, str):
+            raise ValueError(f"Trip '{title}' has a non-text description")
+        created_at = trip_data.get('created_at')
+        return {
+            "title": f"{title} (Imported)",
+            "description": description,
+            "created_at": parse_datetime(created_at, f"Trip '{title}' created_at") if created_at else datetime.utcnow()
+        }
+
+    # Parsed and inserted as the upload is read, in bulk batches
     try:
-        data = json.loads(contents.decode('utf-8'))
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid JSON format.")
-        
-    version = data.get("version", "1.0")
-    trips_data = data.get("trips", [])
-    
-    imported_count = 0
-    
-    for trip_data in trips_data:
-        # Create new Trip
-        new_trip = Trip(
-            title=f"{trip_data['title']} (Imported)",
-            description=trip_data.get('description'),
-            created_at=datetime.fromisoformat(trip_data['created_at']) if trip_data.get('created_at') else datetime.utcnow()
-        )
-        session.add(new_trip)
-        session.flush() # Generate ID
-        
-        for event_data in trip_data.get("events", []):
-            new_event = TravelEvent(
-                trip_id=new_trip.id,
-                start_datetime=datetime.fromisoformat(event_data['start_datetime']),
-                from_name=event_data['from_name'],
-                to_name=event_data['to_name'],
-                from_lat=event_data['from_lat'],
-                from_lng=event_data['from_lng'],
-                to_lat=event_data['to_lat'],
-                to_lng=event_data['to_lng'],
-                transport=event_data.get('transport', 'plane'),
-                title=event_data['title'],
-                note=event_data.get('note')
-            )
-            session.add(new_event)
-            session.flush()
-            
-            for media_data in event_data.get("media_list", []):
-                new_media = EventMedia(
-                    event_id=new_event.id,
-                    url=media_data['url'],
-                    media_type=media_data.get('media_type', 'image')
-                )
-                session.add(new_media)
-        
-        imported_count += 1
-        
-    session.commit()
-    
-    return {"message": f"Successfully imported {imported_count} trips."}
+        counts = await import_trips(session, upload_chunks(file), trip_row, total_bytes=file.size)
+    except ValueError as exc:
+        await session.rollback()
+        raise HTTPException(status_code=400, detail=f"Invalid JSON format: {exc}")
+
+    return {"message": f"Successfully imported {counts['trips']} trips."}
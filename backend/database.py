@@ -1,9 +1,121 @@
 from sqlmodel import create_engine, Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./voyage.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False, "timeout": 30})
+# Async drivers used by the API routers, picked from the sync URL's backend.
+# Set ASYNC_DATABASE_URL to override (e.g. a different host or driver).
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+# Connection tuning profile: "production" (WAL + pragmas below) or "default"
+# (plain SQLite with a busy timeout, as before). Individual pragmas can be
+# overridden with SQLITE_<NAME>, e.g. SQLITE_MMAP_SIZE=0.
+DB_PROFILE = os.getenv("DB_PROFILE", "production")
+
+SQLITE_PROFILES = {
+    "default": {
+        "busy_timeout": 30000,
+    },
+    "production": {
+        "journal_mode": "WAL",       # readers no longer block on the writer
+        "synchronous": "NORMAL",     # durable at checkpoints, safe with WAL
+        "busy_timeout": 30000,       # ms to wait on a locked database
+        "foreign_keys": "ON",
+        "cache_size": -65536,        # negative = KiB, i.e. 64 MiB page cache
+        "mmap_size": 268435456,      # 256 MiB memory-mapped reads
+        "temp_store": "MEMORY",
+    },
+}
+
+POOL_SETTINGS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+}
+
+def sqlite_pragmas(profile=DB_PROFILE):
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE '{profile}', expected one of {sorted(SQLITE_PROFILES)}")
+    pragmas = dict(SQLITE_PROFILES[profile])
+    for name in SQLITE_PROFILES["production"]:
+        override = os.getenv(f"SQLITE_{name.upper()}")
+        if override is not None:
+            pragmas[name] = override
+    return pragmas
+
+def _is_sqlite(url):
+    return make_url(url).get_backend_name() == "sqlite"
+
+def _to_async_url(url):
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for '{url.get_backend_name()}'")
+    return url.set(drivername=driver)
+
+def _attach_pragmas(sync_engine, pragmas):
+    @event.listens_for(sync_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def _engine_kwargs(url):
+    if not _is_sqlite(url):
+        return {}
+    # busy_timeout is applied as a pragma; the driver-level timeout mirrors it
+    timeout = int(sqlite_pragmas().get("busy_timeout", 30000)) / 1000
+    return {"connect_args": {"check_same_thread": False, "timeout": timeout}}
+
+def _build_engine(url):
+    sync_engine = create_engine(url, poolclass=QueuePool, **_engine_kwargs(url), **POOL_SETTINGS)
+    if _is_sqlite(url):
+        _attach_pragmas(sync_engine, sqlite_pragmas())
+    return sync_engine
+
+def _build_async_engine(url):
+    async_engine = create_async_engine(url, poolclass=AsyncAdaptedQueuePool, **_engine_kwargs(url), **POOL_SETTINGS)
+    if _is_sqlite(url):
+        _attach_pragmas(async_engine.sync_engine, sqlite_pragmas())
+    return async_engine
+
+engine = _build_engine(DATABASE_URL)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _to_async_url(DATABASE_URL)
+async_engine = _build_async_engine(ASYNC_DATABASE_URL)
+
+def describe_database(bind=engine):
+    """Effective connection settings, read back from a live connection."""
+    report = {
+        "url": bind.url.render_as_string(hide_password=True),
+        "dialect": bind.dialect.name,
+        "pool": {
+            "class": type(bind.pool).__name__,
+            "size": POOL_SETTINGS["pool_size"],
+            "max_overflow": POOL_SETTINGS["max_overflow"],
+            "timeout": POOL_SETTINGS["pool_timeout"],
+            "recycle": POOL_SETTINGS["pool_recycle"],
+            "pre_ping": POOL_SETTINGS["pool_pre_ping"],
+        },
+    }
+    if bind.dialect.name == "sqlite":
+        report["profile"] = DB_PROFILE
+        with bind.connect() as conn:
+            report["pragmas"] = {
+                name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+                for name in SQLITE_PROFILES["production"]
+            }
+    return report
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
@@ -11,3 +123,9 @@ def create_db_and_tables():
 def get_session():
     with Session(engine) as session:
         yield session
+
+async def get_async_session():
+    # expire_on_commit=False: attributes stay readable after commit without
+    # an implicit (and, under asyncio, forbidden) lazy refresh
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
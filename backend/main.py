@@ -1,43 +1,29 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 import os
 from api.events import router as events_router
 from api.importer import router as importer_router
-from database import create_db_and_tables
+from database import create_db_and_tables, describe_database
 from init_storage import init_minio
+from storage import get_storage, LocalStorage
 from migrate_db import migrate
+from utils.jobs import start_job_runner, stop_job_runner
 
 app = FastAPI(title="VoyageAtlas API")
 
-import sqlite3
-
-def check_db_schema():
-    db_path = './voyage.db'
-    if not os.path.exists(db_path):
-        return
-    
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    try:
-        # Check if essential columns exist in trip table
-        # If any essential new columns are missing, we reset for development convenience as requested.
-        cursor.execute("SELECT cost, note FROM trip LIMIT 1")
-    except sqlite3.OperationalError:
-        print("ALERT: DB Schema mismatch (missing cost/note in trip). Resetting database...")
-        conn.close()
-        try:
-            os.remove(db_path)
-        except Exception as e:
-            print(f"Failed to remove DB file: {e}")
-        return
-    conn.close()
-
 @app.on_event("startup")
 def on_startup():
-    check_db_schema() # Boldly delete if sync is off
-    migrate()
+    # New tables are created from the models; existing ones are upgraded in place
     create_db_and_tables()
+    migrate()
+    print(f"Database settings: {describe_database()}")
     init_minio()
+    start_job_runner()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    stop_job_runner()
 
 app.add_middleware(
     CORSMiddleware,
@@ -45,11 +31,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(events_router)
 app.include_router(importer_router)
 
+# The local storage backend is served by the API itself
+if isinstance(get_storage(), LocalStorage):
+    get_storage().ensure_bucket()
+    app.mount("/media", StaticFiles(directory=get_storage().root), name="media")
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to VoyageAtlas API"}
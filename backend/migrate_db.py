@@ -1,53 +1,143 @@
-import sqlite3
-import os
-
-def migrate():
-    db_path = './voyage.db'
-    if not os.path.exists(db_path):
-        print(f"Database {db_path} not found. Skipping manual migration.")
-        return
-
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    columns_to_add = [
-        ("captured_at", "DATETIME"),
-        ("lat", "FLOAT"),
-        ("lng", "FLOAT"),
-        ("city", "VARCHAR"),
-        ("country", "VARCHAR")
-    ]
-
-    for col_name, col_type in columns_to_add:
-        try:
-            print(f"Adding column {col_name} to eventmedia table...")
-            cursor.execute(f"ALTER TABLE eventmedia ADD COLUMN {col_name} {col_type}")
-            print(f"Column {col_name} added successfully.")
-        except sqlite3.OperationalError as e:
-            if "duplicate column name" in str(e).lower():
-                print(f"Column {col_name} already exists.")
-            else:
-                print(f"Error adding column {col_name}: {e}")
-
-    trip_columns = [
-        ("note", "TEXT"),
-        ("cost", "FLOAT")
-    ]
-    
-    for col_name, col_type in trip_columns:
-        try:
-            print(f"Adding column {col_name} to trip table...")
-            cursor.execute(f"ALTER TABLE trip ADD COLUMN {col_name} {col_type}")
-            print(f"Column {col_name} added successfully.")
-        except sqlite3.OperationalError as e:
-            if "duplicate column name" in str(e).lower():
-                print(f"Column {col_name} already exists.")
-            else:
-                print(f"Error adding column {col_name}: {e}")
-
-    conn.commit()
-    conn.close()
-    print("Migration complete.")
+"""
+Versioned schema migrations.
+
+Every migration is a (version, description, function) entry in MIGRATIONS and runs
+in its own transaction, after which the `schema_version` row is bumped. Steps must be
+idempotent: a fresh database is created from the models by create_all() and then
+walks through the same steps as an old one. Nothing here ever drops data; a failing
+step aborts startup and leaves the database at the last completed version.
+"""
+from sqlalchemy import inspect, text, select
+from database import engine
+from models import Trip, TravelEvent, EventMedia, TripPreparation, TravelRoute, MediaBlob, AnalysisJobItem
+from utils.routes import rebuild_routes
+from utils.stats import rebuild_stats
+from utils.legs import backfill_legs
+from utils.spatial import backfill_geohashes, EVENT_POINTS, MEDIA_POINTS
+
+SCHEMA_VERSION_TABLE = "schema_version"
+
+def _add_columns(conn, model, column_names):
+    """ALTER TABLE ADD COLUMN for every listed model column missing from the table."""
+    table = model.__table__
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    for name in column_names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        col_type = column.type.compile(dialect=conn.dialect)
+        print(f"Adding column {name} to {table.name} table...")
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {col_type}"))
+
+def _create_indexes(conn, model, index_names):
+    """Create the named indexes declared on the model, skipping existing ones."""
+    indexes = {index.name: index for index in model.__table__.indexes}
+    for name in index_names:
+        print(f"Ensuring index {name}...")
+        indexes[name].create(conn, checkfirst=True)
+
+def _v1_media_intelligence_and_trip_notes(conn):
+    _add_columns(conn, EventMedia, ["captured_at", "lat", "lng", "city", "country"])
+    _add_columns(conn, Trip, ["note", "cost"])
+
+def _v2_query_indexes(conn):
+    _create_indexes(conn, Trip, ["ix_trip_created_at_id"])
+    _create_indexes(conn, TravelEvent, [
+        "ix_travelevent_trip_id_start_datetime",
+        "ix_travelevent_trip_id_to_name",
+        "ix_travelevent_start_datetime",
+    ])
+    _create_indexes(conn, EventMedia, ["ix_eventmedia_event_id"])
+    _create_indexes(conn, TripPreparation, ["ix_trippreparation_trip_id"])
+
+def _v3_backfill_route_table(conn):
+    has_routes = conn.execute(select(TravelRoute.__table__.c.event_id).limit(1)).first()
+    if not has_routes:
+        rebuild_routes(conn)
+
+def _v4_media_content_hash(conn):
+    _add_columns(conn, EventMedia, ["content_hash"])
+    _create_indexes(conn, EventMedia, ["ix_eventmedia_content_hash"])
+
+def _v5_media_derivatives(conn):
+    _add_columns(conn, EventMedia, ["thumbnail_url", "preview_url"])
+    _add_columns(conn, MediaBlob, ["derivatives"])
+
+def _v6_pano_tiles(conn):
+    _add_columns(conn, EventMedia, ["tiles_url"])
+
+def _v7_travel_stats(conn):
+    # Tables come from create_all(); totals are recomputed from the data
+    rebuild_stats(conn)
+
+def _v8_leg_distance_and_bearing(conn):
+    _add_columns(conn, TravelEvent, ["distance_km", "bearing_deg"])
+    _create_indexes(conn, TravelEvent, ["ix_travelevent_distance_km"])
+    backfill_legs(conn)
+
+def _v9_geohash_columns(conn):
+    _add_columns(conn, TravelEvent, ["to_geohash"])
+    _add_columns(conn, EventMedia, ["geohash"])
+    _create_indexes(conn, TravelEvent, ["ix_travelevent_to_geohash", "ix_travelevent_trip_id_to_geohash"])
+    _create_indexes(conn, EventMedia, ["ix_eventmedia_geohash"])
+    backfill_geohashes(conn, EVENT_POINTS)
+    backfill_geohashes(conn, MEDIA_POINTS)
+
+def _v10_analysis_item_leases(conn):
+    _add_columns(conn, AnalysisJobItem, ["claimed_by", "lease_until"])
+
+def _v11_media_derivative_names(conn):
+    _add_columns(conn, EventMedia, ["derivatives"])
+    # Rows sharing a blob were rendered with it
+    conn.execute(text(
+        "UPDATE eventmedia SET derivatives = "
+        "(SELECT derivatives FROM mediablob WHERE mediablob.content_hash = eventmedia.content_hash) "
+        "WHERE derivatives IS NULL AND content_hash IS NOT NULL"
+    ))
+
+MIGRATIONS = [
+    (1, "media intelligence columns, trip note/cost", _v1_media_intelligence_and_trip_notes),
+    (2, "indexes for trip, event, media and preparation lookups", _v2_query_indexes),
+    (3, "backfill travel route table", _v3_backfill_route_table),
+    (4, "content hash on event media", _v4_media_content_hash),
+    (5, "thumbnail and preview urls", _v5_media_derivatives),
+    (6, "panorama tile manifest url", _v6_pano_tiles),
+    (7, "backfill travel statistics", _v7_travel_stats),
+    (8, "leg distance and bearing columns", _v8_leg_distance_and_bearing),
+    (9, "geohash columns for spatial queries", _v9_geohash_columns),
+    (10, "claim owner and lease on analysis job items", _v10_analysis_item_leases),
+    (11, "rendered derivative names on event media", _v11_media_derivative_names),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (version INTEGER NOT NULL)"))
+    version = conn.execute(text(f"SELECT version FROM {SCHEMA_VERSION_TABLE}")).scalar()
+    if version is None:
+        conn.execute(text(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version) VALUES (0)"))
+        version = 0
+    return version
+
+def migrate(bind=engine):
+    """Bring the database up to LATEST_VERSION. Returns the resulting version."""
+    with bind.begin() as conn:
+        version = get_schema_version(conn)
+    if version >= LATEST_VERSION:
+        return version
+
+    for target, description, step in MIGRATIONS:
+        if target <= version:
+            continue
+        print(f"Migrating schema to v{target}: {description}")
+        with bind.begin() as conn:
+            step(conn)
+            conn.execute(text(f"UPDATE {SCHEMA_VERSION_TABLE} SET version = :v"), {"v": target})
+        version = target
+
+    print(f"Migration complete. Schema at v{version}.")
+    return version
 
 if __name__ == "__main__":
+    from database import create_db_and_tables
+    create_db_and_tables()
     migrate()
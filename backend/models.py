@@ -1,8 +1,13 @@
 from datetime import datetime
 from typing import Optional, List
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index
 
 class Trip(SQLModel, table=True):
+    __table_args__ = (
+        # Keyset pagination in read_trips orders by (created_at, id)
+        Index("ix_trip_created_at_id", "created_at", "id"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
     description: Optional[str] = None
@@ -13,7 +18,7 @@ class Trip(SQLModel, table=True):
 
 class EventMedia(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    event_id: int = Field(foreign_key="travelevent.id")
+    event_id: int = Field(foreign_key="travelevent.id", index=True)
     url: str
     media_type: str = "image"  # pano_image, image, video
     
@@ -23,14 +28,33 @@ class EventMedia(SQLModel, table=True):
     lng: Optional[float] = None
     city: Optional[str] = None
     country: Optional[str] = None
+
+    # SHA-256 of the file; the stored object and analysis live in MediaBlob
+    content_hash: Optional[str] = Field(default=None, index=True)
+    # Geohash of lat/lng for the spatial queries of utils/spatial.py
+    geohash: Optional[str] = Field(default=None, index=True)
+    # Downsized copies stored next to the original (see utils/derivatives.py)
+    thumbnail_url: Optional[str] = None
+    preview_url: Optional[str] = None
+    tiles_url: Optional[str] = None  # pano_image tile pyramid manifest
+    # Comma-separated names rendered ("" when none could be); None until tried
+    derivatives: Optional[str] = None
     
     event: "TravelEvent" = Relationship(back_populates="media_list")
 
 class TravelEvent(SQLModel, table=True):
+    __table_args__ = (
+        # Events of a trip in chronological order; also serves plain trip_id lookups
+        Index("ix_travelevent_trip_id_start_datetime", "trip_id", "start_datetime"),
+        # Auto-destination lookup in upload_media for photos without coordinates
+        Index("ix_travelevent_trip_id_to_name", "trip_id", "to_name"),
+        # Nearest destination of a trip (see utils/spatial.py)
+        Index("ix_travelevent_trip_id_to_geohash", "trip_id", "to_geohash"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     trip_id: int = Field(foreign_key="trip.id")
     
-    start_datetime: datetime
+    start_datetime: datetime = Field(index=True)
     from_name: str
     to_name: str
     from_lat: float
@@ -41,6 +65,12 @@ class TravelEvent(SQLModel, table=True):
     transport: str = "plane"  # plane, train, car
     title: str
     note: Optional[str] = None
+
+    # Derived from the coordinates by utils/legs.py
+    distance_km: Optional[float] = Field(default=None, index=True)  # great-circle length
+    bearing_deg: Optional[float] = None  # initial compass bearing, 0-360
+    # Geohash of the destination, set by utils/spatial.py
+    to_geohash: Optional[str] = Field(default=None, index=True)
     
     media_list: List[EventMedia] = Relationship(
         back_populates="event",
@@ -50,8 +80,86 @@ class TravelEvent(SQLModel, table=True):
 
 class TripPreparation(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    trip_id: int = Field(foreign_key="trip.id")
+    trip_id: int = Field(foreign_key="trip.id", index=True)
     category: str = Field(default="Packing") # e.g. Packing, Checklist, Finance
     item_name: str
     is_checked: bool = Field(default=False)
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class TravelRoute(SQLModel, table=True):
+    """Denormalized leg geometry for the globe, one row per TravelEvent.
+    Kept in sync by the mapper listeners in utils/routes.py."""
+    event_id: int = Field(primary_key=True)
+    trip_id: int = Field(index=True)
+    start_datetime: datetime = Field(index=True)
+    from_lat: float
+    from_lng: float
+    to_lat: float
+    to_lng: float
+    transport: int = 0  # index into utils.routes.TRANSPORT_MODES
+
+class TravelStat(SQLModel, table=True):
+    """Running totals behind /events/stats, one row per (dimension, key):
+    total, continent, country, year or transport. Maintained by utils/stats.py."""
+    dimension: str = Field(primary_key=True)
+    key: str = Field(primary_key=True)
+    trips: int = 0
+    events: int = 0
+    places: int = 0  # distinct destinations
+    distance_km: float = 0.0
+    cost: float = 0.0
+
+class VisitedPlace(SQLModel, table=True):
+    """A distinct destination with the number of events arriving there (see utils/stats.py)."""
+    name: str = Field(primary_key=True)
+    lat: float = Field(primary_key=True)
+    lng: float = Field(primary_key=True)
+    country: str
+    continent: str
+    events: int = 0
+
+class GeocodeCache(SQLModel, table=True):
+    """Persistent reverse-geocode results keyed by geohash cell (see utils/geocode_cache.py)."""
+    cell: str = Field(primary_key=True)
+    city: Optional[str] = None
+    country: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class MediaBlob(SQLModel, table=True):
+    """One stored object per distinct upload content, shared by every EventMedia
+    with the same content_hash (see utils/media_blobs.py)."""
+    content_hash: str = Field(primary_key=True)
+    key: str = Field(index=True)
+    size: int
+    content_type: Optional[str] = None
+    intelligence: Optional[str] = None  # cached analyze_media result (JSON)
+    derivatives: Optional[str] = None  # comma-separated derivative names rendered for the object
+    ref_count: int = Field(default=0, index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class AnalysisJob(SQLModel, table=True):
+    """Bulk media analysis job, run in the background by utils/jobs.py."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    status: str = Field(default="queued", index=True)  # queued, running, done, failed
+    total: int = 0
+    processed: int = 0
+    failed: int = 0
+    suggestions: Optional[str] = None  # JSON, refreshed while items complete
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class AnalysisJobItem(SQLModel, table=True):
+    """One uploaded file of an AnalysisJob, spooled to disk until analyzed."""
+    __table_args__ = (
+        Index("ix_analysisjobitem_status_id", "status", "id"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_id: int = Field(foreign_key="analysisjob.id", index=True)
+    filename: str
+    path: str
+    status: str = Field(default="queued")  # queued, running, done, failed
+    claimed_by: Optional[str] = None  # JobRunner.worker_id of the process analyzing it
+    lease_until: Optional[datetime] = None  # another process may take it over after this
+    intelligence: Optional[str] = None  # JSON metadata from analyze_media
+    error: Optional[str] = None
@@ -0,0 +1,161 @@
+"""
+Object storage for uploaded media.
+
+One process-wide backend, picked by STORAGE_BACKEND:
+- "s3" (default): MinIO or any S3-compatible service through a single boto3
+  client with a sized connection pool. boto3 clients are thread-safe, so the
+  same client is shared by every request and worker thread.
+- "local": files under MEDIA_ROOT, served by the API under /media.
+"""
+import os
+import json
+import shutil
+import tempfile
+import threading
+import urllib.parse
+from functools import lru_cache
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3")
+BUCKET_NAME = os.getenv("MINIO_BUCKET", "voyage-media")
+
+def _public_read_policy(bucket_name):
+    return {
+        "Version": "2012-10-17",
+        "Statement": [{
+            "Sid": "PublicRead",
+            "Effect": "Allow",
+            "Principal": "*",
+            "Action": ["s3:GetObject"],
+            "Resource": [f"arn:aws:s3:::{bucket_name}/*"]
+        }]
+    }
+
+class S3Storage:
+    def __init__(self, endpoint, access_key, secret_key, bucket_name, public_url, max_pool_connections=32):
+        import boto3
+        from botocore.client import Config
+
+        self.bucket_name = bucket_name
+        self.public_url = public_url.rstrip("/")
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint if endpoint.startswith('http') else f"http://{endpoint}",
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name='us-east-1',
+            config=Config(
+                signature_version='s3v4',
+                max_pool_connections=max_pool_connections,
+                tcp_keepalive=True,
+                retries={"max_attempts": 3, "mode": "standard"},
+            )
+        )
+        self._bucket_ready = False
+        self._bucket_lock = threading.Lock()
+
+    def ensure_bucket(self):
+        """Create the bucket with a public read policy if missing. Runs once per process."""
+        if self._bucket_ready:
+            return
+        with self._bucket_lock:
+            if self._bucket_ready:
+                return
+            from botocore.exceptions import ClientError
+            try:
+                self.client.head_bucket(Bucket=self.bucket_name)
+            except ClientError:
+                self.client.create_bucket(Bucket=self.bucket_name)
+                self.client.put_bucket_policy(
+                    Bucket=self.bucket_name,
+                    Policy=json.dumps(_public_read_policy(self.bucket_name))
+                )
+                print(f"Created bucket {self.bucket_name} and applied public read policy")
+            self._bucket_ready = True
+
+    def put(self, key, fileobj, content_type=None):
+        self.ensure_bucket()
+        extra_args = {"ContentType": content_type} if content_type else None
+        self.client.upload_fileobj(fileobj, self.bucket_name, key, ExtraArgs=extra_args)
+
+    def open(self, key):
+        """Seekable binary file with the object's bytes (spills to disk past 8 MB)."""
+        fileobj = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        self.client.download_fileobj(self.bucket_name, key, fileobj)
+        fileobj.seek(0)
+        return fileobj
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket_name, Key=key)
+
+    def delete_prefix(self, prefix):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            objects = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+            if objects:
+                # A listing page holds at most 1000 keys, the delete_objects limit
+                self.client.delete_objects(Bucket=self.bucket_name, Delete={"Objects": objects, "Quiet": True})
+
+    def url_for(self, key):
+        return f"{self.public_url}/{self.bucket_name}/{urllib.parse.quote(key)}"
+
+    def key_from_url(self, url):
+        # URL format: http://host:port/bucket_name/path/to/file (path is URL-encoded)
+        parts = url.split(f"/{self.bucket_name}/", 1)
+        return urllib.parse.unquote(parts[1]) if len(parts) > 1 else None
+
+class LocalStorage:
+    def __init__(self, root, public_url):
+        self.root = os.path.abspath(root)
+        self.public_url = public_url.rstrip("/")
+
+    def ensure_bucket(self):
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def put(self, key, fileobj, content_type=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as out:
+            shutil.copyfileobj(fileobj, out, length=1024 * 1024)
+
+    def open(self, key):
+        return open(self._path(key), "rb")
+
+    def delete(self, key):
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def delete_prefix(self, prefix):
+        # Prefixes used here always end at a directory boundary
+        shutil.rmtree(self._path(prefix.rstrip("/")), ignore_errors=True)
+
+    def url_for(self, key):
+        return f"{self.public_url}/{urllib.parse.quote(key)}"
+
+    def key_from_url(self, url):
+        prefix = f"{self.public_url}/"
+        return urllib.parse.unquote(url[len(prefix):]) if url.startswith(prefix) else None
+
+@lru_cache(maxsize=None)
+def get_storage():
+    if STORAGE_BACKEND == "local":
+        return LocalStorage(
+            root=os.getenv("MEDIA_ROOT", "./media"),
+            public_url=os.getenv("MEDIA_PUBLIC_URL", "/api/media")
+        )
+    if STORAGE_BACKEND == "s3":
+        return S3Storage(
+            endpoint=os.getenv("MINIO_ENDPOINT", "http://minio:9000"),
+            access_key=os.getenv("MINIO_ACCESS_KEY", "minioadmin"),
+            secret_key=os.getenv("MINIO_SECRET_KEY", "minioadmin"),
+            bucket_name=BUCKET_NAME,
+            public_url=os.getenv("MEDIA_PUBLIC_URL", "http://localhost:9999"),
+            max_pool_connections=int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}', expected 's3' or 'local'")
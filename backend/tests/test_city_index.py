@@ -0,0 +1,21 @@
+from utils.geocoder import get_city_index
+
+def resolve(name, approximate=True):
+    index = get_city_index()
+    city = index.resolve(name, approximate)
+    return None if city is None else index.gazetteer.names[city]
+
+def test_gwangju_is_not_guangzhou():
+    assert resolve("광주") == "Gwangju"
+    assert resolve("광주광역시") == "Gwangju"
+    assert resolve("Gwangju") == "Gwangju"
+    assert resolve("광저우") == "Guangzhou"
+    assert resolve("Guangzhou") == "Guangzhou"
+
+def test_exact_only_skips_approximate_matches():
+    assert resolve("Chiang Rai", approximate=False) is None
+    assert resolve("Port", approximate=False) is None
+    assert resolve("Seoul", approximate=False) == "Seoul"
+
+def test_ambiguous_prefix_is_not_a_match():
+    assert resolve("Sant") is None
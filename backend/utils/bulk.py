@@ -0,0 +1,61 @@
+"""
+Bulk inserts for imports.
+
+Rows are plain dicts of column values inserted with Core executemany in
+chunks of BULK_CHUNK_SIZE, instead of one ORM object and one flush per row.
+Trip and TravelEvent ids come back from INSERT ... RETURNING. The ids are assigned in
+VALUES order, but RETURNING does not promise that order and asking SQLAlchemy
+to sort them (sort_by_parameter_order) falls back to row-at-a-time inserts on
+SQLite, so the returned ids are sorted instead.
+
+Core inserts bypass the mapper listeners, so insert_events writes the
+TravelRoute rows itself (see utils/routes.py) and fills the leg columns (see
+utils/legs.py), the geohash columns are filled for every table that has one
+(see utils/spatial.py), and the insert functions update the travel statistics
+(see utils/stats.py). Media rows inserted here carry
+no content_hash and therefore need no MediaBlob reference counting.
+"""
+import os
+from sqlalchemy import insert
+from models import Trip, TravelEvent, EventMedia
+from utils.routes import route_table, route_row
+from utils.stats import apply_events, apply_trips
+from utils.legs import add_leg_columns
+from utils.spatial import add_geohash_columns, EVENT_POINTS, MEDIA_POINTS
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "5000"))
+
+trip_table = Trip.__table__
+event_table = TravelEvent.__table__
+media_table = EventMedia.__table__
+
+def chunks(rows, size=BULK_CHUNK_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+async def _insert_returning_ids(session, table, chunk):
+    result = await session.execute(insert(table).returning(table.c.id), chunk)
+    return sorted(result.scalars().all())
+
+async def insert_trips(session, rows):
+    """Insert trip rows; returns the new ids in row order."""
+    ids = []
+    for chunk in chunks(rows):
+        ids.extend(await _insert_returning_ids(session, trip_table, chunk))
+        await session.run_sync(lambda sync_session: apply_trips(sync_session.connection(), chunk))
+    return ids
+
+async def insert_events(session, rows):
+    """Insert event rows and their routes; returns the new ids in row order."""
+    ids = []
+    for chunk in chunks(rows):
+        add_geohash_columns(add_leg_columns(chunk), EVENT_POINTS)
+        chunk_ids = await _insert_returning_ids(session, event_table, chunk)
+        await session.execute(insert(route_table), [route_row({**row, "id": event_id}) for row, event_id in zip(chunk, chunk_ids)])
+        await session.run_sync(lambda sync_session: apply_events(sync_session.connection(), chunk))
+        ids.extend(chunk_ids)
+    return ids
+
+async def insert_media(session, rows):
+    for chunk in chunks(rows):
+        await session.execute(insert(media_table), add_geohash_columns(chunk, MEDIA_POINTS))
@@ -0,0 +1,161 @@
+"""
+In-memory forward geocoding index over the gazetteer.
+
+Every city is reachable under a normalized key (accents, case, punctuation
+and spaces removed) for its name, ASCII name, alternate names, the aliases
+in utils.geocoder.CITY_COORDS and the romanized form of any Hangul name.
+Keys live in dicts for O(1) exact hits and in a character trie that serves
+prefix completion and Levenshtein-bounded fuzzy search.
+
+A romanized key only ranks below every name a city was actually given, so a
+Hangul spelling borrowed by a foreign city cannot take over the Korean one's
+English name. Approximate (fuzzy and prefix) matches are only returned when a
+single city is the best candidate.
+"""
+import re
+import unicodedata
+from utils.hangul import is_hangul, romanize
+
+# Administrative suffixes dropped when the full name has no match,
+# e.g. "서울특별시" -> "서울", "Kyoto City" -> "kyoto"
+NAME_SUFFIXES = ["특별자치시", "특별시", "광역시", "시", "군", "city", "town", "prefecture"]
+
+# Edits allowed in a fuzzy match; short names are only matched exactly
+def max_edits(key):
+    if len(key) <= 4:
+        return 0
+    if len(key) <= 8:
+        return 1
+    return 2
+
+_SEPARATORS = re.compile(r"[\s\-_'’.,/()]+")
+
+def normalize(name):
+    """Casefolded, accent- and separator-free form of a place name."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    # NFC recombines the Hangul jamo that NFKD split apart
+    return _SEPARATORS.sub("", unicodedata.normalize("NFC", stripped).casefold())
+
+class TrieNode:
+    __slots__ = ("children", "cities")
+
+    def __init__(self):
+        self.children = {}
+        self.cities = None
+
+class CityIndex:
+    def __init__(self, gazetteer, aliases=None):
+        self.gazetteer = gazetteer
+        self.keys = {}
+        self.romanized_keys = {}
+        self.root = TrieNode()
+        for i, name in enumerate(gazetteer.names):
+            for variant in [name] + gazetteer.alternate_names[i]:
+                self.add(variant, i)
+        if aliases:
+            names = list(aliases)
+            coords = [aliases[name] for name in names]
+            indices, _ = gazetteer.nearest([lat for lat, _ in coords], [lng for _, lng in coords], max_km=5)
+            for name, i in zip(names, indices):
+                if i >= 0:
+                    self.add(name, int(i))
+
+    def add(self, name, city):
+        key = normalize(name)
+        if key:
+            self.keys.setdefault(key, set()).add(city)
+            self._add_to_trie(key, city)
+        if is_hangul(name):
+            key = normalize(romanize(name))
+            if key:
+                self.romanized_keys.setdefault(key, set()).add(city)
+                self._add_to_trie(key, city)
+
+    def _add_to_trie(self, key, city):
+        node = self.root
+        for ch in key:
+            node = node.children.setdefault(ch, TrieNode())
+        if node.cities is None:
+            node.cities = set()
+        node.cities.add(city)
+
+    def _best(self, cities):
+        return max(cities, key=lambda i: self.gazetteer.population[i])
+
+    def _candidates(self, name):
+        key = normalize(name)
+        yield key
+        for suffix in NAME_SUFFIXES:
+            if key.endswith(suffix) and len(key) > len(suffix) + 1:
+                yield key[:-len(suffix)]
+        if is_hangul(name):
+            yield normalize(romanize(name))
+
+    def fuzzy(self, key, max_cost):
+        """[(cost, city)] for keys within max_cost edits of key (trie-pruned Levenshtein)."""
+        matches = []
+        first_row = list(range(len(key) + 1))
+
+        def walk(node, ch, previous_row):
+            row = [previous_row[0] + 1]
+            for col in range(1, len(key) + 1):
+                row.append(min(
+                    row[col - 1] + 1,
+                    previous_row[col] + 1,
+                    previous_row[col - 1] + (key[col - 1] != ch),
+                ))
+            if node.cities and row[-1] <= max_cost:
+                matches.extend((row[-1], city) for city in node.cities)
+            if min(row) <= max_cost:
+                for next_ch, child in node.children.items():
+                    walk(child, next_ch, row)
+
+        for ch, child in self.root.children.items():
+            walk(child, ch, first_row)
+        return matches
+
+    def complete(self, prefix):
+        """Cities whose key starts with the normalized prefix."""
+        node = self.root
+        for ch in normalize(prefix):
+            node = node.children.get(ch)
+            if node is None:
+                return set()
+        found, stack = set(), [node]
+        while stack:
+            node = stack.pop()
+            if node.cities:
+                found |= node.cities
+            stack.extend(node.children.values())
+        return found
+
+    def resolve(self, name, approximate=True):
+        """
+        Best city index for a free-form name, or None.
+        Exact key (incl. suffix-stripped forms) > romanized key, with
+        population breaking ties; then, if `approximate`, the single city
+        with the fewest edits, or else the single prefix completion.
+        """
+        if not name or not name.strip():
+            return None
+        candidates = [key for key in self._candidates(name) if key]
+        for keys in (self.keys, self.romanized_keys):
+            for key in candidates:
+                if key in keys:
+                    return self._best(keys[key])
+        if not approximate:
+            return None
+
+        fuzzy = [match for key in candidates for match in self.fuzzy(key, max_edits(key))]
+        if fuzzy:
+            lowest = min(cost for cost, _ in fuzzy)
+            best = {city for cost, city in fuzzy if cost == lowest}
+            return best.pop() if len(best) == 1 else None
+
+        key = candidates[0]
+        if len(key) >= 4:
+            completions = self.complete(key)
+            if len(completions) == 1:
+                return completions.pop()
+        return None
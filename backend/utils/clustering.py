@@ -1,85 +1,249 @@
-from datetime import timedelta
-from geopy.distance import geodesic
+"""
+Groups analyzed media into suggested travel events.
+
+The files are turned into columnar NumPy arrays (capture time, lat, lng) and
+segmented in one pass:
+
+- "sequential" (default): photos in capture order start a new event when the
+  time gap exceeds time_threshold_hours or consecutive photos are more than
+  distance_threshold_km apart (vectorized haversine over np.diff gaps).
+- "density": photos are first clustered by place, DBSCAN-style over a KD-tree
+  (eps = distance_threshold_km), and every place is then split by the time
+  threshold, so visits interleaved with a short trip elsewhere still merge.
+
+IncrementalClusterer keeps sequential-mode groups up to date as files are
+analyzed one by one, for background analysis jobs.
+"""
+import os
+import numpy as np
+from datetime import date, timedelta
+from operator import attrgetter
+from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from sortedcontainers import SortedList
+from utils.geo import haversine_km, point_distance_km, to_unit_vectors, km_to_chord
 import logging
 
 logger = logging.getLogger(__name__)
 
-def cluster_media_to_suggestions(analyzed_files, time_threshold_hours=6, distance_threshold_km=50):
+CLUSTERING_MODE = os.getenv("CLUSTERING_MODE", "sequential")
+CLUSTERING_MODES = ("sequential", "density")
+# Density mode snaps photos to cells this fraction of eps wide before the
+# neighbor search, so thousands of photos at one place cost one point
+DENSITY_CELL_FRACTION = 0.25
+
+def _microseconds(datetimes):
+    """Capture times as int64 microseconds. Reading the fields with
+    np.fromiter is several times faster than np.array(..., "datetime64")."""
+    if any(d.tzinfo is not None for d in datetimes):
+        return np.array([round(d.timestamp() * 1e6) for d in datetimes], dtype=np.int64)
+    def field(getter):
+        return np.fromiter(map(getter, datetimes), np.int64, len(datetimes))
+    seconds = field(date.toordinal) * 86400 + field(attrgetter("hour")) * 3600 \
+        + field(attrgetter("minute")) * 60 + field(attrgetter("second"))
+    return seconds * 1_000_000 + field(attrgetter("microsecond"))
+
+def _columns(valid_files):
+    intelligence = [f["intelligence"] for f in valid_files]
+    times = _microseconds([i["captured_at"] for i in intelligence])
+    # None becomes NaN in a float array
+    coords = np.array([(i["lat"], i["lng"]) for i in intelligence], dtype=float).reshape(-1, 2)
+    lat, lng = coords[:, 0], coords[:, 1]
+    has_city = np.array([bool(i["city"]) for i in intelligence])
+    return times, lat, lng, has_city
+
+def _sequential_breaks(times, lat, lng, max_gap, distance_threshold_km):
+    """Start index of every group after the first, for arrays in capture order."""
+    time_gaps = np.diff(times) > max_gap
+    # NaN (no location on either side) compares False: no distance break
+    with np.errstate(invalid="ignore"):
+        dist_gaps = haversine_km(lat[:-1], lng[:-1], lat[1:], lng[1:]) > distance_threshold_km
+    return np.flatnonzero(time_gaps | dist_gaps) + 1
+
+def _place_labels(lat, lng, distance_threshold_km, min_samples):
+    """
+    DBSCAN-style place label per photo (arrays in capture order). Points are
+    snapped to small cells first; cells within eps are neighbors, cells whose
+    neighborhoods hold min_samples photos are cores, connected cores form a
+    place and other cells join a neighboring core or stay on their own.
+    Photos without a location take the place of the previous located photo.
+    """
+    located = ~np.isnan(lat)
+    labels = np.zeros(len(lat), dtype=np.int64)
+    if not located.any():
+        return labels
+
+    points = to_unit_vectors(lat[located], lng[located])
+    eps = km_to_chord(distance_threshold_km)
+    cells, cell_of_point = np.unique(np.floor(points / (eps * DENSITY_CELL_FRACTION)).astype(np.int64), axis=0, return_inverse=True)
+    cell_of_point = cell_of_point.ravel()
+    weights = np.bincount(cell_of_point, minlength=len(cells))
+    centroids = np.column_stack([np.bincount(cell_of_point, points[:, axis]) for axis in range(3)]) / weights[:, None]
+
+    pairs = cKDTree(centroids).query_pairs(eps, output_type="ndarray")
+    neighbor_weight = weights + np.bincount(pairs[:, 0], weights[pairs[:, 1]], len(cells)) \
+        + np.bincount(pairs[:, 1], weights[pairs[:, 0]], len(cells))
+    core = neighbor_weight >= min_samples
+
+    core_pairs = pairs[core[pairs[:, 0]] & core[pairs[:, 1]]]
+    graph = coo_matrix((np.ones(len(core_pairs)), (core_pairs[:, 0], core_pairs[:, 1])), shape=(len(cells), len(cells)))
+    _, cell_labels = connected_components(graph, directed=False)
+    # Border cells join the place of a core neighbor
+    for a, b in ((0, 1), (1, 0)):
+        border = ~core[pairs[:, a]] & core[pairs[:, b]]
+        cell_labels[pairs[border, a]] = cell_labels[pairs[border, b]]
+
+    labels[located] = cell_labels[cell_of_point]
+    previous = np.maximum.accumulate(np.where(located, np.arange(len(lat)), -1))
+    previous[previous < 0] = np.argmax(located)
+    return labels[previous]
+
+def _group_dict(first, last, rep, files):
+    return {
+        "title": f"Visit to {rep['city'] or 'Unknown Region'}",
+        "start_date": first["captured_at"].isoformat(),
+        "end_date": last["captured_at"].isoformat(),
+        "city": rep["city"],
+        "country": rep["country"],
+        "lat": rep["lat"],
+        "lng": rep["lng"],
+        "files": files
+    }
+
+def cluster_media_to_suggestions(analyzed_files, time_threshold_hours=6, distance_threshold_km=50,
+                                 mode=None, min_samples=1):
     """
     Groups analyzed files into suggested 'Travel Events'.
-    
+
     analyzed_files: List of dicts like {"filename": str, "intelligence": dict}
     time_threshold_hours: Max time gap between photos in the same event.
     distance_threshold_km: Max distance between photos in the same event.
+    mode: "sequential" or "density" (default: CLUSTERING_MODE).
+    min_samples: Photos within distance_threshold_km that make a place (density mode).
     """
-    # 1. Filter and Sort by capture time
+    mode = mode or CLUSTERING_MODE
+    if mode not in CLUSTERING_MODES:
+        raise ValueError(f"Unknown clustering mode '{mode}', expected one of {CLUSTERING_MODES}")
+
+    # 1. Filter and sort by capture time (stable, like list.sort)
     valid_files = [f for f in analyzed_files if f["intelligence"]["captured_at"]]
     if not valid_files:
         return []
-        
-    # Python's datetime sorted
-    valid_files.sort(key=lambda x: x["intelligence"]["captured_at"])
-    
-    suggestions = []
-    if not valid_files:
-        return suggestions
-        
-    current_group = {
-        "title": "New Event",
-        "start_date": valid_files[0]["intelligence"]["captured_at"],
-        "end_date": valid_files[0]["intelligence"]["captured_at"],
-        "city": valid_files[0]["intelligence"]["city"],
-        "country": valid_files[0]["intelligence"]["country"],
-        "lat": valid_files[0]["intelligence"]["lat"],
-        "lng": valid_files[0]["intelligence"]["lng"],
-        "files": [valid_files[0]["filename"]]
-    }
-    
-    for i in range(1, len(valid_files)):
-        prev = valid_files[i-1]["intelligence"]
-        curr = valid_files[i]["intelligence"]
-        
-        # Calculate Gaps
-        time_gap = curr["captured_at"] - prev["captured_at"]
-        dist_gap = 0
-        if prev["lat"] is not None and curr["lat"] is not None:
-            dist_gap = geodesic((prev["lat"], prev["lng"]), (curr["lat"], curr["lng"])).km
-            
-        # Decision: Start new group?
-        if time_gap > timedelta(hours=time_threshold_hours) or dist_gap > distance_threshold_km:
-            # Save current group
-            current_group["title"] = f"Visit to {current_group['city'] or 'Unknown Region'}"
-            suggestions.append(current_group)
-            
-            # Start new group
-            current_group = {
-                "title": "New Event",
-                "start_date": curr["captured_at"],
-                "end_date": curr["captured_at"],
-                "city": curr["city"],
-                "country": curr["country"],
-                "lat": curr["lat"],
-                "lng": curr["lng"],
-                "files": [valid_files[i]["filename"]]
-            }
-        else:
-            # Update current group
-            current_group["end_date"] = curr["captured_at"]
-            current_group["files"].append(valid_files[i]["filename"])
-            # Update city if it was unknown but now we have it
-            if not current_group["city"] and curr["city"]:
-                 current_group["city"] = curr["city"]
-                 current_group["country"] = curr["country"]
-                 current_group["lat"] = curr["lat"]
-                 current_group["lng"] = curr["lng"]
-                 
-    # Add final group
-    current_group["title"] = f"Visit to {current_group['city'] or 'Unknown Region'}"
-    suggestions.append(current_group)
-    
-    # Format dates to string for JSON serialization
-    for s in suggestions:
-        s["start_date"] = s["start_date"].isoformat()
-        s["end_date"] = s["end_date"].isoformat()
-        
-    return suggestions
+    times, lat, lng, has_city = _columns(valid_files)
+    order = np.argsort(times, kind="stable")
+    times, lat, lng, has_city = times[order], lat[order], lng[order], has_city[order]
+    max_gap = time_threshold_hours * 3600 * 1_000_000
+
+    # 2. Segment: runs of positions in `order` form the groups
+    if mode == "sequential":
+        positions = np.arange(len(order))
+        breaks = _sequential_breaks(times, lat, lng, max_gap, distance_threshold_km)
+    else:
+        labels = _place_labels(lat, lng, distance_threshold_km, min_samples)
+        positions = np.lexsort((np.arange(len(order)), labels))  # by place, then capture order
+        breaks = np.flatnonzero(
+            (np.diff(labels[positions]) != 0) | (np.diff(times[positions]) > max_gap)
+        ) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.append(breaks, len(positions))
+
+    # 3. A group is described by its first photo, or by its first photo with a city
+    city_at = np.append(np.flatnonzero(has_city[positions]), len(positions))
+    next_city = city_at[np.searchsorted(city_at, starts)]
+    representatives = np.where(next_city < ends, next_city, starts)
+
+    groups = np.arange(len(starts))
+    if mode == "density":
+        # Places were grouped together; present the events chronologically
+        groups = np.argsort(times[positions[starts]], kind="stable")
+    ordered = [valid_files[i] for i in order[positions].tolist()]
+    filenames = [f["filename"] for f in ordered]
+    starts, ends, representatives = starts.tolist(), ends.tolist(), representatives.tolist()
+    return [
+        _group_dict(
+            ordered[starts[g]]["intelligence"],
+            ordered[ends[g] - 1]["intelligence"],
+            ordered[representatives[g]]["intelligence"],
+            filenames[starts[g]:ends[g]]
+        )
+        for g in groups.tolist()
+    ]
+
+class IncrementalClusterer:
+    """
+    Sequential-mode clustering maintained one file at a time, for suggestions
+    that update while an analysis is still running.
+
+    Photos are kept in a SortedList by capture time and the photos that begin
+    a group in a second SortedList. Adding a photo only re-evaluates the two
+    gaps around it, so it is O(log n) and merges or splits just the
+    neighboring groups; suggestions() rebuilds only the groups that changed.
+    The result matches cluster_media_to_suggestions(mode="sequential") over
+    the same files in the same order. Returned dicts are shared with the
+    cache and must not be modified.
+    """
+    def __init__(self, time_threshold_hours=6, distance_threshold_km=50):
+        self.max_gap = timedelta(hours=time_threshold_hours)
+        self.distance_threshold_km = distance_threshold_km
+        self._photos = SortedList()  # (captured_at, sequence) keys
+        self._files = {}             # key -> (filename, intelligence)
+        self._starts = SortedList()  # keys of the photos that begin a group
+        self._groups = {}            # start key -> cached suggestion
+        self._sequence = 0
+
+    def __len__(self):
+        return len(self._photos)
+
+    def _breaks(self, before, after):
+        if after[0] - before[0] > self.max_gap:
+            return True
+        a, b = self._files[before][1], self._files[after][1]
+        if a["lat"] is None or b["lat"] is None:
+            return False
+        return point_distance_km(a["lat"], a["lng"], b["lat"], b["lng"]) > self.distance_threshold_km
+
+    def _start_of(self, key):
+        return self._starts[self._starts.bisect_right(key) - 1]
+
+    def add(self, filename, intelligence):
+        """Insert an analyzed file; files without a capture time are ignored, as in batch clustering."""
+        if not intelligence["captured_at"]:
+            return
+        key = (intelligence["captured_at"], self._sequence)
+        self._sequence += 1
+        self._files[key] = (filename, intelligence)
+        self._photos.add(key)
+        index = self._photos.bisect_left(key)
+        before = self._photos[index - 1] if index > 0 else None
+        after = self._photos[index + 1] if index + 1 < len(self._photos) else None
+
+        if before is not None:
+            # The group the photo lands in changes whether or not it splits
+            self._groups.pop(self._start_of(before), None)
+        if after is not None:
+            # The gap before `after` is now measured from the new photo
+            self._groups.pop(after, None)
+            if after in self._starts:
+                self._starts.remove(after)
+            if self._breaks(key, after):
+                self._starts.add(after)
+        if before is None or self._breaks(before, key):
+            self._starts.add(key)
+
+    def _build(self, start, stop):
+        keys = list(self._photos.irange(start, stop, inclusive=(True, False)))
+        files = [self._files[key] for key in keys]
+        representative = next((i for _, i in files if i["city"]), files[0][1])
+        return _group_dict(files[0][1], files[-1][1], representative, [name for name, _ in files])
+
+    def suggestions(self):
+        starts = list(self._starts)
+        result = []
+        for position, start in enumerate(starts):
+            group = self._groups.get(start)
+            if group is None:
+                stop = starts[position + 1] if position + 1 < len(starts) else None
+                group = self._groups[start] = self._build(start, stop)
+            result.append(group)
+        return result
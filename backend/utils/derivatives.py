@@ -0,0 +1,119 @@
+"""
+Downsized derivatives of uploaded media for galleries and previews.
+
+Every original gets a small thumbnail and a larger preview, encoded as WebP
+(DERIVATIVE_FORMAT=jpeg for JPEG) and stored next to it: the derivative of
+media/ab/<hash>.jpg is media/ab/<hash>.thumb.webp. Videos get the same pair
+from a poster frame, which needs an ffmpeg binary on PATH; without one they
+simply have no derivatives. upload_media renders derivatives while ingesting
+new content; media stored before that are rendered on first request.
+Panoramas additionally get a tile pyramid (utils/pano_tiles.py), recorded
+under the derivative name "tiles".
+"""
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+from PIL import Image, ImageOps
+from utils.pano_tiles import create_tiles, manifest_key, tiles_prefix
+
+# Longest edge in pixels, largest first: each size is scaled down from the previous one
+DERIVATIVE_SIZES = {"preview": 1280, "thumb": 320}
+DERIVATIVE_FORMAT = os.getenv("DERIVATIVE_FORMAT", "webp").lower()
+DERIVATIVE_QUALITY = int(os.getenv("DERIVATIVE_QUALITY", "80"))
+POSTER_OFFSET_SECONDS = 1.0
+POSTER_TIMEOUT_SECONDS = 30
+
+_FORMATS = {"webp": ("WEBP", "image/webp", "webp"), "jpeg": ("JPEG", "image/jpeg", "jpg")}
+if DERIVATIVE_FORMAT not in _FORMATS:
+    raise ValueError(f"Unknown DERIVATIVE_FORMAT '{DERIVATIVE_FORMAT}', expected 'webp' or 'jpeg'")
+
+def derivative_key(key, name):
+    if name == "tiles":
+        return manifest_key(key)
+    extension = _FORMATS[DERIVATIVE_FORMAT][2]
+    return f"{os.path.splitext(key)[0]}.{name}.{extension}"
+
+def delete_derivatives(storage, key):
+    for name in DERIVATIVE_SIZES:
+        storage.delete(derivative_key(key, name))
+    storage.delete_prefix(tiles_prefix(key))
+
+def can_render(media_type):
+    return media_type != "video" or shutil.which("ffmpeg") is not None
+
+def _poster_frame(source):
+    """First frame after POSTER_OFFSET_SECONDS (or the very first one for
+    shorter clips) as a PIL image; None when ffmpeg is unavailable."""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return None
+    # ffmpeg needs a seekable file for most containers
+    with tempfile.NamedTemporaryFile(prefix="voyage-poster-") as video:
+        source.seek(0)
+        shutil.copyfileobj(source, video, length=1024 * 1024)
+        video.flush()
+        source.seek(0)
+        for offset in (POSTER_OFFSET_SECONDS, 0):
+            result = subprocess.run(
+                [ffmpeg, "-v", "error", "-ss", str(offset), "-i", video.name,
+                 "-frames:v", "1", "-f", "image2pipe", "-c:v", "png", "-"],
+                capture_output=True, timeout=POSTER_TIMEOUT_SECONDS
+            )
+            if result.stdout:
+                return Image.open(io.BytesIO(result.stdout))
+    return None
+
+def _open_image(source, media_type):
+    if media_type == "video":
+        return _poster_frame(source)
+    source.seek(0)
+    image = Image.open(source)
+    # JPEG can decode at 1/2, 1/4 or 1/8 scale, far cheaper than a full decode
+    largest = max(DERIVATIVE_SIZES.values())
+    image.draft("RGB", (largest, largest))
+    return image
+
+def render_derivatives(source, media_type):
+    """{name: encoded bytes} for a binary stream holding the original."""
+    image = _open_image(source, media_type)
+    if image is None:
+        return {}
+    pil_format = _FORMATS[DERIVATIVE_FORMAT][0]
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("RGBA" if pil_format == "WEBP" and "A" in image.getbands() else "RGB")
+    rendered = {}
+    for name, size in DERIVATIVE_SIZES.items():
+        # thumbnail() never upscales, so small originals keep their size
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, pil_format, quality=DERIVATIVE_QUALITY)
+        rendered[name] = out.getvalue()
+    source.seek(0)
+    return rendered
+
+def create_derivatives(storage, source, key, media_type):
+    """Render and store the derivatives of the object at `key`. Returns the
+    names stored; a file Pillow cannot read yields none instead of failing."""
+    try:
+        rendered = render_derivatives(source, media_type)
+    except Exception as e:
+        print(f"DEBUG: No derivatives for {key}: {e}")
+        return []
+    content_type = _FORMATS[DERIVATIVE_FORMAT][1]
+    for name, data in rendered.items():
+        storage.put(derivative_key(key, name), io.BytesIO(data), content_type=content_type)
+    names = list(rendered)
+    if media_type == "pano_image":
+        try:
+            create_tiles(storage, source, key)
+            names.append("tiles")
+        except Exception as e:
+            print(f"DEBUG: No panorama tiles for {key}: {e}")
+    return names
+
+def create_stored_derivatives(storage, key, media_type):
+    """create_derivatives() for an object that is already in storage."""
+    with storage.open(key) as source:
+        return create_derivatives(storage, source, key, media_type)
@@ -0,0 +1,166 @@
+"""
+Streaming exports of trips and events.
+
+The exports are produced as a stream of text chunks for a StreamingResponse,
+one trip at a time: trips and events are read in keyset batches of
+EXPORT_BATCH_SIZE on a session owned by the stream (the request's session is
+closed once the response starts), and every batch is encoded and sent before
+the next one is read, so memory stays flat whatever the size of the history.
+
+Two encodings carry the same objects:
+- "json": one document, {"version", ..., "trips": [...]}, as before.
+- "ndjson": a header line with the document fields, then one line per trip.
+"""
+import os
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_, func, exists
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import async_engine
+from models import Trip, TravelEvent, EventMedia
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+EXPORT_FORMATS = {"json": "application/json", "ndjson": "application/x-ndjson"}
+
+def _event_dict(event):
+    return {
+        "title": event.title,
+        "from_name": event.from_name,
+        "to_name": event.to_name,
+        "from_lat": event.from_lat,
+        "from_lng": event.from_lng,
+        "to_lat": event.to_lat,
+        "to_lng": event.to_lng,
+        "start_datetime": event.start_datetime.isoformat(),
+        "transport": event.transport,
+        "note": event.note
+    }
+
+def _date_filters(start_date, end_date):
+    filters = []
+    if start_date:
+        filters.append(TravelEvent.start_datetime >= start_date)
+    if end_date:
+        filters.append(TravelEvent.start_datetime <= end_date)
+    return filters
+
+async def _event_batches(session, trip_id, filters):
+    """Events of one trip in (start_datetime, id) order, EXPORT_BATCH_SIZE at a time."""
+    last = None
+    while True:
+        query = select(TravelEvent).where(TravelEvent.trip_id == trip_id, *filters)
+        if last:
+            query = query.where(or_(
+                TravelEvent.start_datetime > last.start_datetime,
+                and_(TravelEvent.start_datetime == last.start_datetime, TravelEvent.id > last.id)
+            ))
+        events = (await session.exec(query.order_by(TravelEvent.start_datetime, TravelEvent.id).limit(EXPORT_BATCH_SIZE))).all()
+        if not events:
+            return
+        yield events
+        # Nothing read so far needs to stay in the identity map
+        session.expunge_all()
+        last = events[-1]
+        if len(events) < EXPORT_BATCH_SIZE:
+            return
+
+async def _event_dicts(session, trip_id, filters, with_media=False):
+    async for events in _event_batches(session, trip_id, filters):
+        dicts = [_event_dict(event) for event in events]
+        if with_media:
+            media_by_event = {event.id: [] for event in events}
+            media = (await session.exec(
+                select(EventMedia).where(EventMedia.event_id.in_(list(media_by_event))).order_by(EventMedia.id)
+            )).all()
+            for item in media:
+                media_by_event[item.event_id].append({"url": item.url, "media_type": item.media_type})
+            for event, data in zip(events, dicts):
+                data["media_list"] = media_by_event[event.id]
+        yield dicts
+
+async def _encode(head, trips, fmt):
+    """Serialize (trip fields, async iterator of event dict lists) pairs piece by piece."""
+    ndjson = fmt == "ndjson"
+    yield json.dumps(head) + "\n" if ndjson else json.dumps(head)[:-1] + ', "trips": ['
+    first_trip = True
+    async for fields, event_batches in trips:
+        opening = json.dumps(fields)[:-1] + ', "events": ['
+        yield opening if ndjson or first_trip else ", " + opening
+        first_trip = False
+        first_event = True
+        async for batch in event_batches:
+            if batch:
+                encoded = ", ".join(json.dumps(event) for event in batch)
+                yield encoded if first_event else ", " + encoded
+                first_event = False
+        yield "]}\n" if ndjson else "]}"
+    if not ndjson:
+        yield "]}"
+
+async def stream_events_export(start_date=None, end_date=None, fmt="json"):
+    """
+    Chunks of the /events/export document: events between the dates grouped
+    by trip, trips in order of their first matching event.
+    """
+    filters = _date_filters(start_date, end_date)
+    head = {"version": "1.0", "export_date": datetime.now().isoformat()}
+
+    async def trips(session):
+        first_start = func.min(TravelEvent.start_datetime)
+        last = None
+        while True:
+            query = select(TravelEvent.trip_id, first_start).where(*filters).group_by(TravelEvent.trip_id)
+            if last:
+                query = query.having(or_(first_start > last[1], and_(first_start == last[1], TravelEvent.trip_id > last[0])))
+            batch = (await session.exec(query.order_by(first_start, TravelEvent.trip_id).limit(EXPORT_BATCH_SIZE))).all()
+            if not batch:
+                return
+            titles = dict((await session.exec(
+                select(Trip.id, Trip.title).where(Trip.id.in_([trip_id for trip_id, _ in batch]))
+            )).all())
+            for trip_id, _ in batch:
+                yield {"title": titles.get(trip_id, "Unnamed Trip")}, _event_dicts(session, trip_id, filters)
+            last = batch[-1]
+            if len(batch) < EXPORT_BATCH_SIZE:
+                return
+
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        async for chunk in _encode(head, trips(session), fmt):
+            yield chunk
+
+async def stream_trips_export(start_date, end_date, fmt="json"):
+    """
+    Chunks of the /data/export/json document: every trip with an event between
+    the dates, with all of its events and their media.
+    """
+    in_range = _date_filters(start_date, end_date)
+    head = {
+        "version": "1.0",
+        "exported_at": datetime.now().isoformat(),
+        "date_range": {"start": start_date.date().isoformat(), "end": end_date.date().isoformat()},
+    }
+
+    async def trips(session):
+        has_event = exists().where(TravelEvent.trip_id == Trip.id, *in_range)
+        last_id = 0
+        while True:
+            batch = (await session.exec(
+                select(Trip).where(Trip.id > last_id, has_event).order_by(Trip.id).limit(EXPORT_BATCH_SIZE)
+            )).all()
+            if not batch:
+                return
+            for trip in batch:
+                fields = {
+                    "title": trip.title,
+                    "description": trip.description,
+                    "created_at": trip.created_at.isoformat() if trip.created_at else None,
+                }
+                yield fields, _event_dicts(session, trip.id, [], with_media=True)
+            last_id = batch[-1].id
+            if len(batch) < EXPORT_BATCH_SIZE:
+                return
+
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        async for chunk in _encode(head, trips(session), fmt):
+            yield chunk
@@ -0,0 +1,90 @@
+"""
+Batch metadata extraction spread over CPU cores.
+
+exifread and hachoir are pure-Python parsers, so threads only take turns on
+the GIL; here every file is parsed in a worker process instead. Each file
+gets EXTRACTION_TIMEOUT_SECONDS, enforced inside the worker with SIGALRM, so
+a corrupt or pathological video fails on its own instead of stalling the
+batch. Geocoding is not done here: callers geocode the collected results in
+one batch (utils.media_analyzer.geocode_metadata).
+"""
+import io
+import os
+import signal
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from utils.media_analyzer import analyze_media
+
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 2)))
+EXTRACTION_TIMEOUT_SECONDS = float(os.getenv("EXTRACTION_TIMEOUT_SECONDS", "15"))
+
+class _Deadline(BaseException):
+    # BaseException so the parsers' own `except Exception` blocks cannot swallow it
+    pass
+
+def _on_alarm(signum, frame):
+    raise _Deadline()
+
+def extract_file(path, filename=None, timeout=EXTRACTION_TIMEOUT_SECONDS):
+    """
+    Metadata without geocoding. Runs in a worker process (tasks run on its main
+    thread). `path` may also be the leading bytes of the file.
+    """
+    if isinstance(path, bytes):
+        path = io.BytesIO(path)
+    if not timeout or not hasattr(signal, "setitimer"):
+        return analyze_media(path, filename, geocode=False)
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return analyze_media(path, filename, geocode=False)
+    except _Deadline:
+        raise TimeoutError(f"Metadata extraction timed out after {timeout:g}s")
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+class ExtractionEngine:
+    def __init__(self, workers=EXTRACTION_WORKERS, timeout=EXTRACTION_TIMEOUT_SECONDS):
+        self.workers = workers
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        # spawn: the API process runs threads, which fork does not copy safely
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, path, filename=None):
+        """Future of the file's metadata dict; it raises TimeoutError past the deadline."""
+        with self._lock:
+            try:
+                return self._executor.submit(extract_file, path, filename, self.timeout)
+            except BrokenProcessPool:
+                # A worker died (e.g. a parser crashed the interpreter); start a fresh pool
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._new_executor()
+                return self._executor.submit(extract_file, path, filename, self.timeout)
+
+    def extract(self, files):
+        """
+        Yield (position, metadata, error) for [(path, filename)] as files
+        finish, fastest first. Exactly one of metadata / error is None.
+        """
+        futures = {self.submit(path, filename): position for position, (path, filename) in enumerate(files)}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, str(e) or type(e).__name__
+
+    def shutdown(self):
+        with self._lock:
+            self._executor.shutdown(cancel_futures=True)
+
+@lru_cache(maxsize=None)
+def get_extraction_engine():
+    return ExtractionEngine()
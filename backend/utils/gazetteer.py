@@ -0,0 +1,128 @@
+"""
+Offline gazetteer: city lookups without the network.
+
+Cities are loaded once per process from GAZETTEER_PATH, either the bundled
+data/cities.tsv or a GeoNames dump (e.g. cities15000.txt from
+download.geonames.org), and indexed in a KD-tree over unit vectors on the
+sphere. Chord length between unit vectors grows monotonically with
+great-circle distance, so the Euclidean nearest neighbour is also the
+haversine nearest neighbour.
+
+GEOCODER_MODE controls how the geocoders use it:
+- "offline": gazetteer only, never touches the network
+- "hybrid" (default): gazetteer first, online service for anything it cannot answer
+- "online": online service only (cached), as before
+"""
+import os
+import csv
+from functools import lru_cache
+import numpy as np
+from scipy.spatial import cKDTree
+from utils.geo import to_unit_vectors, chord_to_km
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", os.path.join(DATA_DIR, "cities.tsv"))
+COUNTRIES_PATH = os.getenv("GAZETTEER_COUNTRIES_PATH", os.path.join(DATA_DIR, "countries.tsv"))
+
+GEOCODER_MODE = os.getenv("GEOCODER_MODE", "hybrid")
+# A coordinate further than this from every gazetteer city is not answered offline
+GEOCODER_OFFLINE_MAX_KM = float(os.getenv("GEOCODER_OFFLINE_MAX_KM", "30"))
+
+if GEOCODER_MODE not in ("online", "offline", "hybrid"):
+    raise ValueError(f"Unknown GEOCODER_MODE '{GEOCODER_MODE}', expected 'online', 'offline' or 'hybrid'")
+
+# Column positions in the GeoNames "geoname" table dump
+GEONAMES_COLUMNS = {
+    "name": 1,
+    "ascii_name": 2,
+    "alternate_names": 3,
+    "lat": 4,
+    "lng": 5,
+    "country_code": 8,
+    "population": 14,
+}
+
+def load_countries(path=COUNTRIES_PATH):
+    """{country code: {"name", "continent"}}"""
+    with open(path, encoding="utf-8", newline="") as f:
+        return {row["code"]: row for row in csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)}
+
+def read_cities(path=GAZETTEER_PATH):
+    """Yield city rows from the bundled TSV (with a header) or a headerless GeoNames dump."""
+    with open(path, encoding="utf-8", newline="") as f:
+        header = f.readline()
+        if header.startswith("name\t"):
+            f.seek(0)
+            yield from csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+            return
+        f.seek(0)
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) <= GEONAMES_COLUMNS["population"]:
+                continue
+            yield {key: fields[i] for key, i in GEONAMES_COLUMNS.items()}
+
+class Gazetteer:
+    def __init__(self, cities, countries):
+        self.countries = countries
+        self.names = []
+        self.alternate_names = []
+        self.country_codes = []
+        lats, lngs, populations = [], [], []
+        for row in cities:
+            self.names.append(row["name"])
+            alternates = [row["ascii_name"]] + row["alternate_names"].split(",")
+            self.alternate_names.append([a.strip() for a in alternates if a.strip()])
+            self.country_codes.append(row["country_code"])
+            lats.append(float(row["lat"]))
+            lngs.append(float(row["lng"]))
+            populations.append(int(row["population"] or 0))
+        self.lat = np.array(lats, dtype=float)
+        self.lng = np.array(lngs, dtype=float)
+        self.population = np.array(populations, dtype=np.int64)
+        self._tree = cKDTree(to_unit_vectors(self.lat, self.lng))
+
+    def __len__(self):
+        return len(self.names)
+
+    def country_name(self, code):
+        country = self.countries.get(code)
+        return country["name"] if country else code
+
+    def continent(self, code):
+        country = self.countries.get(code)
+        return country["continent"] if country else None
+
+    def nearest(self, lats, lngs, max_km=None):
+        """
+        Nearest city for every coordinate, in one vectorized query.
+        Returns (indices, distances_km); the index is -1 for invalid coordinates
+        and for points with no city within max_km.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        lngs = np.atleast_1d(np.asarray(lngs, dtype=float))
+        indices = np.full(len(lats), -1, dtype=np.int64)
+        distances = np.full(len(lats), np.inf)
+
+        valid = np.isfinite(lats) & np.isfinite(lngs)
+        if valid.any():
+            chords, found = self._tree.query(to_unit_vectors(lats[valid], lngs[valid]), k=1)
+            indices[valid] = found
+            distances[valid] = chord_to_km(chords)
+        if max_km is not None:
+            indices[distances > max_km] = -1
+        return indices, distances
+
+    def reverse(self, lats, lngs, max_km=GEOCODER_OFFLINE_MAX_KM):
+        """[(city, country)] per coordinate; (None, None) where nothing is close enough."""
+        indices, _ = self.nearest(lats, lngs, max_km)
+        return [
+            (self.names[i], self.country_name(self.country_codes[i])) if i >= 0 else (None, None)
+            for i in indices
+        ]
+
+@lru_cache(maxsize=None)
+def get_gazetteer():
+    gazetteer = Gazetteer(read_cities(GAZETTEER_PATH), load_countries(COUNTRIES_PATH))
+    print(f"DEBUG: Loaded gazetteer with {len(gazetteer)} cities from {GAZETTEER_PATH}")
+    return gazetteer
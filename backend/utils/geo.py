@@ -0,0 +1,43 @@
+"""
+Vectorized great-circle helpers shared by the gazetteer and clustering code.
+All functions accept scalars or numpy arrays of degrees, except
+point_distance_km, the fast path for a single pair.
+"""
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+def to_unit_vectors(lat, lng):
+    """(N, 3) array of points on the unit sphere."""
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lng = np.radians(np.asarray(lng, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)))
+
+def chord_to_km(chord):
+    """Great-circle distance for a straight-line distance between unit vectors."""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord, dtype=float) / 2, 0, 1))
+
+def km_to_chord(km):
+    """Straight-line distance between unit vectors `km` apart on the sphere."""
+    return 2 * np.sin(np.asarray(km, dtype=float) / (2 * EARTH_RADIUS_KM))
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def initial_bearing_deg(lat1, lng1, lat2, lng2):
+    """Compass bearing (0-360, clockwise from north) at the start of the great circle."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    d_lng = lng2 - lng1
+    y = np.sin(d_lng) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(d_lng)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+def point_distance_km(lat1, lng1, lat2, lng2):
+    """haversine_km for one pair of floats, without NumPy's per-call overhead."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(max(a, 0.0), 1.0)))
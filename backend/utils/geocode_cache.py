@@ -0,0 +1,112 @@
+"""
+Two-level cache for reverse geocoding, keyed by geohash cell so that nearby
+photos share one lookup:
+- an in-process LRU of recent cells (microsecond hits),
+- the GeocodeCache table, whose rows expire after GEOCODE_CACHE_TTL_DAYS.
+Concurrent misses on the same cell wait for a single resolver call.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlmodel import Session
+from database import engine
+from models import GeocodeCache
+from utils import geohash
+import logging
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_CACHE_PRECISION = int(os.getenv("GEOCODE_CACHE_PRECISION", "6"))  # ~1.2 x 0.6 km cells
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "4096"))
+GEOCODE_CACHE_TTL_DAYS = int(os.getenv("GEOCODE_CACHE_TTL_DAYS", "90"))
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+_memory = LRUCache(GEOCODE_CACHE_SIZE)
+# cell -> [lock, callers holding or waiting for it]; an entry is dropped only
+# when its last caller leaves, so a newcomer always queues on the lock the
+# current waiters share
+_cell_locks = {}
+_cell_locks_guard = threading.Lock()
+
+def _acquire_cell(cell):
+    with _cell_locks_guard:
+        entry = _cell_locks.get(cell)
+        if entry is None:
+            entry = _cell_locks[cell] = [threading.Lock(), 0]
+        entry[1] += 1
+        return entry[0]
+
+def _release_cell(cell):
+    with _cell_locks_guard:
+        entry = _cell_locks[cell]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _cell_locks[cell]
+
+def _load(cell):
+    try:
+        with Session(engine) as session:
+            row = session.get(GeocodeCache, cell)
+            if row and row.created_at >= datetime.utcnow() - timedelta(days=GEOCODE_CACHE_TTL_DAYS):
+                return row.city, row.country
+    except Exception as e:
+        logger.error(f"Geocode cache read failed: {e}")
+    return None
+
+def _store(cell, city, country):
+    try:
+        with Session(engine) as session:
+            session.merge(GeocodeCache(cell=cell, city=city, country=country, created_at=datetime.utcnow()))
+            session.commit()
+    except Exception as e:
+        logger.error(f"Geocode cache write failed: {e}")
+
+def cached_reverse_geocode(lat, lng, resolver):
+    """
+    Return (city, country) for the cell containing (lat, lng).
+    `resolver(lat, lng)` is only called on a miss; it should raise on transient
+    failures so that they are not cached.
+    """
+    cell = geohash.encode(lat, lng, GEOCODE_CACHE_PRECISION)
+    hit = _memory.get(cell)
+    if hit is not None:
+        return hit
+
+    lock = _acquire_cell(cell)
+    try:
+        with lock:
+            hit = _memory.get(cell)
+            if hit is not None:
+                return hit
+            result = _load(cell)
+            if result is None:
+                result = tuple(resolver(lat, lng))
+                _store(cell, *result)
+            _memory.put(cell, result)
+            return result
+    finally:
+        _release_cell(cell)
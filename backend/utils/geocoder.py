@@ -1,4 +1,7 @@
 import requests
+from functools import lru_cache
+from utils.gazetteer import get_gazetteer, GEOCODER_MODE
+from utils.city_index import CityIndex
 
 CITY_COORDS = {
     # 한국
@@ -18,19 +21,63 @@ CITY_COORDS = {
     "Bangkok": (13.7563, 100.5018), "Da Nang": (16.0544, 108.2022), "Singapore": (1.3521, 103.8198), "Taipei": (25.0330, 121.5654),
 }
 
-def geocode_city(city_name: str):
-    # Try dictionary first
+NOMINATIM_SEARCH_URL = "https://nominatim.openstreetmap.org/search"
+
+@lru_cache(maxsize=None)
+def get_city_index():
+    return CityIndex(get_gazetteer(), CITY_COORDS)
+
+@lru_cache(maxsize=1024)
+def _nominatim_search(city_name):
+    """(lat, lng) from Nominatim. Raises on network errors so they are not cached."""
+    response = requests.get(
+        NOMINATIM_SEARCH_URL,
+        params={"q": city_name, "format": "json", "limit": 1},
+        headers={'User-Agent': 'VoyageAtlas-PoC'},
+        timeout=5
+    )
+    response.raise_for_status()
+    data = response.json()
+    if data:
+        return float(data[0]['lat']), float(data[0]['lon'])
+    return None, None
+
+@lru_cache(maxsize=4096)
+def _offline_coords(city_name, approximate=False):
     if city_name in CITY_COORDS:
         return CITY_COORDS[city_name]
-    
-    # Fallback to OpenStreetMap (Nominatim) - No API key required for low volume
-    try:
-        url = f"https://nominatim.openstreetmap.org/search?q={city_name}&format=json&limit=1"
-        response = requests.get(url, headers={'User-Agent': 'VoyageAtlas-PoC'})
-        data = response.json()
-        if data:
-            return float(data[0]['lat']), float(data[0]['lon'])
-    except Exception as e:
-        print(f"Geocoding error for {city_name}: {e}")
-    
-    return None, None
+    city = get_city_index().resolve(city_name, approximate)
+    if city is None:
+        return None
+    gazetteer = get_gazetteer()
+    return float(gazetteer.lat[city]), float(gazetteer.lng[city])
+
+def geocode_cities(city_names):
+    """
+    Resolve many names in one call: [(lat, lng)] in input order, (None, None)
+    for names that cannot be resolved. Each distinct name is looked up once,
+    in the local index first (exact, alias and romanized keys); only the
+    leftovers go to Nominatim, unless GEOCODER_MODE is "offline". Fuzzy and
+    prefix matches are a last resort, for names Nominatim did not find or
+    could not be asked about.
+    """
+    resolved = {}
+    for name in dict.fromkeys(city_names):
+        coords = _offline_coords(name) if GEOCODER_MODE != "online" else None
+        if coords is None and GEOCODER_MODE != "offline":
+            # Fallback to OpenStreetMap (Nominatim) - No API key required for low volume
+            try:
+                coords = _nominatim_search(name.strip())
+            except Exception as e:
+                print(f"Geocoding error for {name}: {e}")
+            if coords is not None and coords[0] is None:
+                coords = None
+        if coords is None and GEOCODER_MODE != "online":
+            coords = _offline_coords(name, approximate=True)
+            if coords is not None:
+                print(f"DEBUG: '{name}' geocoded by approximate match")
+        resolved[name] = coords or (None, None)
+    return [resolved[name] for name in city_names]
+
+def geocode_city(city_name: str):
+    return geocode_cities([city_name])[0]
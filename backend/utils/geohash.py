@@ -0,0 +1,99 @@
+"""Minimal geohash encoding (base32, interleaved lng/lat bits)."""
+import numpy as np
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def encode(lat, lng, precision=6):
+    """Geohash of a point. Precision 5 cells are ~4.9 km, 6 ~1.2 x 0.6 km, 7 ~150 m."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # even bits encode longitude
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits = bits << 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+# Vectorized encoding and range search. A geohash of n characters holds 5n
+# bits, alternately longitude and latitude, so a code is the interleaving of
+# the two cell indexes and every cell is one contiguous range of codes. The
+# alphabet is in ASCII order, so string order is code order and a B-tree index
+# on the hashes answers "inside these cells" as a few range scans.
+
+_ALPHABET = np.frombuffer(_BASE32.encode(), dtype=np.uint8)
+
+def _bit_counts(precision):
+    bits = 5 * precision
+    return (bits + 1) // 2, bits // 2  # longitude, latitude
+
+def cell_degrees(precision):
+    """(lat, lng) extent of a cell."""
+    lng_bits, lat_bits = _bit_counts(precision)
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+def _indexes(lats, lngs, precision):
+    lng_bits, lat_bits = _bit_counts(precision)
+    lat_idx = np.floor((np.asarray(lats, dtype=float) + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64)
+    lng_idx = np.floor((np.asarray(lngs, dtype=float) + 180.0) / 360.0 * (1 << lng_bits)).astype(np.int64)
+    return np.clip(lat_idx, 0, (1 << lat_bits) - 1), np.clip(lng_idx, 0, (1 << lng_bits) - 1)
+
+def _interleave(lat_idx, lng_idx, precision):
+    lng_bits, lat_bits = _bit_counts(precision)
+    codes = np.zeros(np.shape(lat_idx), dtype=np.int64)
+    for k in range(5 * precision):
+        if k % 2 == 0:
+            bit = (lng_idx >> (lng_bits - 1 - k // 2)) & 1
+        else:
+            bit = (lat_idx >> (lat_bits - 1 - k // 2)) & 1
+        codes = (codes << 1) | bit
+    return codes
+
+def _to_strings(codes, precision):
+    shifts = 5 * np.arange(precision - 1, -1, -1, dtype=np.int64)
+    chars = _ALPHABET[(np.asarray(codes, dtype=np.int64)[:, None] >> shifts) & 31]
+    return [value.decode() for value in np.ascontiguousarray(chars).view(f"S{precision}").ravel()]
+
+def encode_many(lats, lngs, precision=9):
+    """Geohashes of many points at once (precision <= 12)."""
+    if len(lats) == 0:
+        return []
+    return _to_strings(_interleave(*_indexes(lats, lngs, precision), precision), precision)
+
+def covering_ranges(min_lat, min_lng, max_lat, max_lng, max_cells=32, max_precision=9):
+    """
+    [(lower, upper)] hash ranges whose union covers the box: the cells of the
+    finest precision that needs at most max_cells cells, adjacent codes merged.
+    `upper` is exclusive, None past the last cell. Needs min_lng <= max_lng.
+    """
+    precision = max_precision
+    while True:
+        (lat0, lat1), (lng0, lng1) = zip(*(
+            (i.item() for i in pair) for pair in (_indexes(min_lat, min_lng, precision), _indexes(max_lat, max_lng, precision))
+        ))
+        if precision == 1 or (lat1 - lat0 + 1) * (lng1 - lng0 + 1) <= max_cells:
+            break
+        precision -= 1
+    lat_idx, lng_idx = np.meshgrid(np.arange(lat0, lat1 + 1), np.arange(lng0, lng1 + 1))
+    codes = np.unique(_interleave(lat_idx.ravel(), lng_idx.ravel(), precision))
+    # Runs of consecutive codes become one range
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(codes) > 1) + 1))
+    ends = np.append(starts[1:], len(codes)) - 1
+    lowers = _to_strings(codes[starts], precision)
+    last = 1 << (5 * precision)
+    upper_codes = codes[ends] + 1
+    uppers = _to_strings(np.minimum(upper_codes, last - 1), precision)
+    return [(lower, upper if code < last else None) for lower, upper, code in zip(lowers, uppers, upper_codes.tolist())]
@@ -0,0 +1,62 @@
+"""
+Hangul to Latin romanization (Revised Romanization of Korean), used to match
+Korean place names against their English spellings, e.g. 경주 -> gyeongju.
+
+Only the sound changes that commonly show up in place names are applied
+(linking a final consonant into a following vowel, ㄹ/ㄴ assimilation), so
+the output is a close approximation rather than a full transcription.
+"""
+
+HANGUL_BASE = 0xAC00
+HANGUL_LAST = 0xD7A3
+
+INITIALS = ["g", "kk", "n", "d", "tt", "r", "m", "b", "pp", "s", "ss", "", "j", "jj", "ch", "k", "t", "p", "h"]
+MEDIALS = ["a", "ae", "ya", "yae", "eo", "e", "yeo", "ye", "o", "wa", "wae", "oe", "yo", "u", "wo", "we", "wi", "yu", "eu", "ui", "i"]
+# Final consonant as pronounced at the end of a syllable
+FINALS = ["", "k", "k", "k", "n", "n", "n", "t", "l", "k", "m", "l", "l", "l", "p", "l", "m", "p", "p", "t", "t", "ng", "t", "t", "k", "t", "p", "t"]
+# Final consonant carried over into a following vowel (ㅇ initial)
+LINKED_FINALS = {1: "g", 7: "d", 8: "r", 17: "b", 19: "s", 22: "j", 23: "ch", 25: "t", 26: "p"}
+
+NIEUN_FINAL, RIEUL_FINAL, MIEUM_FINAL, IEUNG_FINAL = 4, 8, 16, 21
+RIEUL_INITIAL, IEUNG_INITIAL = 5, 11
+
+def _is_syllable(ch):
+    return ch is not None and HANGUL_BASE <= ord(ch) <= HANGUL_LAST
+
+def is_hangul(text):
+    return any(_is_syllable(ch) for ch in text)
+
+def _decompose(ch):
+    code = ord(ch) - HANGUL_BASE
+    return code // 588, (code % 588) // 28, code % 28
+
+def _onset(initial, previous_final):
+    if initial == RIEUL_INITIAL and previous_final in (NIEUN_FINAL, RIEUL_FINAL):
+        return "l"
+    if initial == RIEUL_INITIAL and previous_final in (MIEUM_FINAL, IEUNG_FINAL):
+        return "n"
+    return INITIALS[initial]
+
+def _coda(final, next_initial):
+    if next_initial == IEUNG_INITIAL and final in LINKED_FINALS:
+        return LINKED_FINALS[final]
+    if next_initial == RIEUL_INITIAL and final == NIEUN_FINAL:
+        return "l"
+    return FINALS[final]
+
+def romanize(text):
+    """Romanize the Hangul syllables in text; other characters are kept as is."""
+    syllables = [_decompose(ch) if _is_syllable(ch) else None for ch in text]
+    out = []
+    for pos, ch in enumerate(text):
+        current = syllables[pos]
+        if current is None:
+            out.append(ch)
+            continue
+        initial, medial, final = current
+        previous = syllables[pos - 1] if pos > 0 else None
+        following = syllables[pos + 1] if pos + 1 < len(syllables) else None
+        out.append(_onset(initial, previous[2] if previous else None))
+        out.append(MEDIALS[medial])
+        out.append(_coda(final, following[0] if following else None))
+    return "".join(out)
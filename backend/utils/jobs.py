@@ -0,0 +1,304 @@
+"""
+Background jobs for bulk media analysis.
+
+create_job() spools the uploaded files to ANALYSIS_JOBS_DIR and records an
+AnalysisJob with one AnalysisJobItem per file, so the request can return
+right away. The JobRunner thread claims queued items from the database,
+extracts their metadata on the shared ExtractionEngine, geocodes every finished batch
+at once and stores each result as soon as it is known. Finished files go into
+the job's IncrementalClusterer, so partial suggestions are refreshed without
+re-clustering the whole job. Progress lives in
+the database, so a dropped client connection loses nothing.
+
+Claims are conditional updates (queued -> running) that record the runner's
+worker id and a lease of ANALYSIS_LEASE_SECONDS, renewed while the item is
+in flight, so several API processes can share one database without
+analyzing a file twice. Items whose lease ran out, because the process that
+claimed them crashed or was restarted, can be claimed again; results are
+only recorded for items the runner still owns.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_
+from sqlmodel import Session, select
+from database import engine
+from models import AnalysisJob, AnalysisJobItem
+from utils.media_analyzer import geocode_metadata, metadata_to_json, metadata_from_json
+from utils.extraction import get_extraction_engine
+from utils.clustering import cluster_media_to_suggestions, IncrementalClusterer, CLUSTERING_MODE
+
+ANALYSIS_JOBS_DIR = os.path.abspath(os.getenv("ANALYSIS_JOBS_DIR", "./jobs"))
+# Minimum seconds between two suggestion refreshes of a running job
+SUGGESTION_REFRESH_SECONDS = float(os.getenv("ANALYSIS_SUGGESTION_REFRESH", "2"))
+POLL_SECONDS = 1.0
+# A claimed item another process may take over once its lease expires unrenewed
+LEASE_SECONDS = float(os.getenv("ANALYSIS_LEASE_SECONDS", "60"))
+
+def create_job(files):
+    """
+    Spool [(filename, binary stream)] to disk and queue them as one job.
+    Files are stored under their position in the upload, keeping only the
+    extension, so client-supplied names never become paths.
+    """
+    with Session(engine, expire_on_commit=False) as session:
+        job = AnalysisJob(total=len(files))
+        session.add(job)
+        session.flush()
+        job_dir = os.path.join(ANALYSIS_JOBS_DIR, str(job.id))
+        os.makedirs(job_dir, exist_ok=True)
+        for position, (filename, stream) in enumerate(files):
+            path = os.path.join(job_dir, f"{position}{os.path.splitext(filename)[1].lower()}")
+            stream.seek(0)
+            with open(path, "wb") as out:
+                shutil.copyfileobj(stream, out, length=1024 * 1024)
+            session.add(AnalysisJobItem(job_id=job.id, filename=filename, path=path))
+        session.commit()
+    runner.notify()
+    return job
+
+def _done_items(session, job_id):
+    items = session.exec(
+        select(AnalysisJobItem).where(AnalysisJobItem.job_id == job_id, AnalysisJobItem.status == "done")
+    ).all()
+    return [{"filename": item.filename, "intelligence": metadata_from_json(item.intelligence)} for item in items]
+
+def job_suggestions(session, job_id):
+    """Cluster the items of a job analyzed so far."""
+    return cluster_media_to_suggestions(_done_items(session, job_id))
+
+def job_clusterer(session, job_id):
+    """IncrementalClusterer seeded with the items of a job analyzed so far."""
+    clusterer = IncrementalClusterer()
+    for item in _done_items(session, job_id):
+        clusterer.add(item["filename"], item["intelligence"])
+    return clusterer
+
+def _claimable():
+    """Queued items, and running ones whose claim lease has expired (or predates leases)."""
+    return or_(
+        AnalysisJobItem.status == "queued",
+        (AnalysisJobItem.status == "running")
+        & or_(AnalysisJobItem.lease_until.is_(None), AnalysisJobItem.lease_until < datetime.utcnow()),
+    )
+
+class JobRunner:
+    def __init__(self):
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._engine = None
+        # Owner recorded on claimed items; a restarted process is a new owner
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+        self._last_heartbeat = 0.0
+        self._last_refresh = {}
+        # Running jobs' suggestions, updated as their items finish
+        self._clusterers = {}
+
+    def start(self):
+        if self._thread:
+            return
+        self._engine = get_extraction_engine()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="analysis-jobs", daemon=True)
+        self._thread.start()
+        print(f"DEBUG: Analysis job runner started with {self._engine.workers} workers")
+
+    def stop(self):
+        if not self._thread:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._engine.shutdown()
+        self._thread = None
+
+    def notify(self):
+        self._wake.set()
+
+    def _run(self):
+        in_flight = {}
+        while not self._stop.is_set():
+            try:
+                # Keep a second batch queued in the pool so workers never idle
+                for item in self._claim(self._engine.workers * 2 - len(in_flight)):
+                    in_flight[self._engine.submit(item.path, item.filename)] = item
+                if not in_flight:
+                    self._wake.wait(POLL_SECONDS)
+                    self._wake.clear()
+                    continue
+                done, _ = wait(in_flight, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+                if done:
+                    self._record([(in_flight.pop(future), future) for future in done])
+                self._heartbeat([item.id for item in in_flight.values()])
+            except Exception as e:
+                print(f"DEBUG: Analysis job runner error: {e}")
+                time.sleep(POLL_SECONDS)
+        self._release([item.id for item in in_flight.values()])
+
+    def _owned(self, item_ids):
+        return (
+            AnalysisJobItem.id.in_(item_ids),
+            AnalysisJobItem.status == "running",
+            AnalysisJobItem.claimed_by == self.worker_id,
+        )
+
+    def _heartbeat(self, item_ids):
+        """Renew the lease of the items in flight, a few times per lease period."""
+        now = time.monotonic()
+        if not item_ids or now - self._last_heartbeat < LEASE_SECONDS / 3:
+            return
+        self._last_heartbeat = now
+        with Session(engine) as session:
+            session.execute(
+                update(AnalysisJobItem)
+                .where(*self._owned(item_ids))
+                .values(lease_until=datetime.utcnow() + timedelta(seconds=LEASE_SECONDS))
+            )
+            session.commit()
+
+    def _release(self, item_ids):
+        """Queue the unfinished items of a stopping runner for the next one."""
+        if not item_ids:
+            return
+        try:
+            with Session(engine) as session:
+                session.execute(
+                    update(AnalysisJobItem)
+                    .where(*self._owned(item_ids))
+                    .values(status="queued", claimed_by=None, lease_until=None)
+                )
+                session.commit()
+        except Exception as e:
+            print(f"DEBUG: Could not release analysis items: {e}")
+
+    def _claim(self, limit):
+        if limit <= 0:
+            return []
+        with Session(engine, expire_on_commit=False) as session:
+            candidates = session.exec(
+                select(AnalysisJobItem.id)
+                .where(_claimable())
+                .order_by(AnalysisJobItem.id)
+                .limit(limit)
+            ).all()
+            lease_until = datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)
+            claimed = [
+                item_id for item_id in candidates
+                if session.execute(
+                    update(AnalysisJobItem)
+                    .where(AnalysisJobItem.id == item_id, _claimable())
+                    .values(status="running", claimed_by=self.worker_id, lease_until=lease_until)
+                ).rowcount
+            ]
+            if not claimed:
+                session.commit()
+                return []
+            items = session.exec(select(AnalysisJobItem).where(AnalysisJobItem.id.in_(claimed))).all()
+            session.execute(
+                update(AnalysisJob)
+                .where(AnalysisJob.id.in_({item.job_id for item in items}), AnalysisJob.status == "queued")
+                .values(status="running", updated_at=datetime.utcnow())
+            )
+            session.commit()
+            return items
+
+    def _record(self, finished):
+        results = []
+        for item, future in finished:
+            try:
+                results.append((item, future.result(), None))
+            except Exception as e:
+                results.append((item, None, str(e) or type(e).__name__))
+        # One vectorized reverse-geocoding pass for the whole batch
+        geocode_metadata([metadata for _, metadata, _ in results if metadata is not None])
+
+        counts = {}
+        with Session(engine) as session:
+            recorded = []
+            for item, metadata, error in results:
+                # An item whose lease lapsed may have been taken over; its new owner records it
+                if not session.execute(
+                    update(AnalysisJobItem)
+                    .where(*self._owned([item.id]))
+                    .values(
+                        status="done" if error is None else "failed",
+                        intelligence=metadata_to_json(metadata) if error is None else None,
+                        error=error,
+                        lease_until=None
+                    )
+                ).rowcount:
+                    continue
+                recorded.append((item, metadata, error))
+                processed, failed = counts.get(item.job_id, (0, 0))
+                counts[item.job_id] = (processed + 1, failed + (error is not None))
+            for job_id, (processed, failed) in counts.items():
+                session.execute(
+                    update(AnalysisJob)
+                    .where(AnalysisJob.id == job_id)
+                    .values(
+                        processed=AnalysisJob.processed + processed,
+                        failed=AnalysisJob.failed + failed,
+                        updated_at=datetime.utcnow()
+                    )
+                )
+            session.commit()
+
+            for item, _, _ in recorded:
+                if os.path.exists(item.path):
+                    os.remove(item.path)
+            if CLUSTERING_MODE == "sequential":
+                self._cluster(session, recorded)
+            for job_id in counts:
+                self._refresh(session, job_id)
+
+    def _cluster(self, session, results):
+        """Insert finished items into their job's clusterer, O(log n) each."""
+        for job_id in {item.job_id for item, _, _ in results}:
+            if job_id not in self._clusterers:
+                # First batch seen by this process (or after a restart): seed from the database
+                self._clusterers[job_id] = job_clusterer(session, job_id)
+                continue
+            clusterer = self._clusterers[job_id]
+            for item, metadata, error in results:
+                if item.job_id == job_id and error is None:
+                    clusterer.add(item.filename, metadata)
+
+    def _refresh(self, session, job_id):
+        """Store partial suggestions (throttled), or the final ones when the job is complete."""
+        job = session.get(AnalysisJob, job_id)
+        finished = job.processed >= job.total
+        now = time.monotonic()
+        if not finished and now - self._last_refresh.get(job_id, 0) < SUGGESTION_REFRESH_SECONDS:
+            return
+        self._last_refresh[job_id] = now
+
+        clusterer = self._clusterers.get(job_id)
+        if finished or clusterer is None:
+            # Final suggestions come from the database, which also holds items
+            # recorded by other processes
+            suggestions = job_suggestions(session, job_id)
+        else:
+            suggestions = clusterer.suggestions()
+        job.suggestions = json.dumps(suggestions)
+        job.updated_at = datetime.utcnow()
+        if finished:
+            job.status = "done"
+            self._last_refresh.pop(job_id, None)
+            self._clusterers.pop(job_id, None)
+            shutil.rmtree(os.path.join(ANALYSIS_JOBS_DIR, str(job_id)), ignore_errors=True)
+        session.add(job)
+        session.commit()
+
+runner = JobRunner()
+
+def start_job_runner():
+    runner.start()
+
+def stop_job_runner():
+    runner.stop()
@@ -0,0 +1,313 @@
+"""
+Streaming imports of exported trips.
+
+Backups are parsed as they arrive instead of being read and json.loads'ed
+whole: TripStreamParser is a push parser that takes text in any pieces and
+hands back every trip as soon as its closing brace is seen, so only one trip
+(plus the current read) is held at a time. It accepts both encodings written
+by utils/exporter.py:
+
+- "json": {"version": ..., "trips": [{...}, ...]}, other keys kept as header.
+- "ndjson": a header object on the first line, then one trip per line.
+
+import_trips buffers parsed trips and writes them with the bulk inserts of
+utils/bulk.py once BULK_CHUNK_SIZE events (or trips) are pending. Everything
+is committed once at the end, so a broken file imports nothing; with
+IMPORT_COMMIT_EVENTS set, the import commits every that many events instead
+and a failure keeps what was committed before it.
+"""
+import os
+import json
+import codecs
+from datetime import datetime
+from utils.bulk import BULK_CHUNK_SIZE, insert_trips, insert_events, insert_media
+
+IMPORT_READ_SIZE = int(os.getenv("IMPORT_READ_SIZE", str(1 << 16)))
+IMPORT_COMMIT_EVENTS = int(os.getenv("IMPORT_COMMIT_EVENTS", "0"))
+
+EVENT_REQUIRED_FIELDS = ["start_datetime", "from_name", "to_name", "from_lat", "from_lng", "to_lat", "to_lng", "title"]
+
+# A decode error this close to the end of the buffer may just be a value cut
+# off by the read (e.g. `tru`, `1.`, a partial \u escape)
+_TRUNCATION_MARGIN = 8
+_WHITESPACE = " \t\n\r"
+
+class _Incomplete(Exception):
+    pass
+
+class TripStreamParser:
+    """
+    Push parser for exported trip documents: feed() text as it arrives and
+    get back the trips completed so far, then close() at the end of input.
+    Raises ValueError (json.JSONDecodeError for syntax) on invalid input.
+
+    Values are decoded with JSONDecoder.raw_decode. A value cut off by the end
+    of the buffer is retried once the unread part has doubled, so a trip that
+    spans many reads is decoded O(1) times on average.
+    """
+    def __init__(self):
+        self.header = {}
+        self.trips_seen = 0
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._pending = []  # reads not yet appended to the buffer
+        self._pending_size = 0
+        self._retry_at = 0
+        self._eof = False
+        self._state = "start"
+        self._first = True
+        self._found_trips = False
+
+    def feed(self, text):
+        self._pending.append(text)
+        self._pending_size += len(text)
+        return self._run()
+
+    def close(self):
+        self._eof = True
+        trips = self._run()
+        if self._state != "lines":
+            raise ValueError("Unexpected end of JSON input")
+        if not self._found_trips:
+            raise ValueError("Invalid data format: 'trips' key missing")
+        return trips
+
+    def _skip_whitespace(self):
+        buffer, pos = self._buffer, self._pos
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        self._pos = pos
+        if pos == len(buffer):
+            raise _Incomplete
+        return buffer[pos]
+
+    def _expect(self, char):
+        if self._skip_whitespace() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self._buffer, self._pos)
+        self._pos += 1
+
+    def _separator(self, closing):
+        """Consume ',' between items; True (and the closing char) at the end of the container."""
+        char = self._skip_whitespace()
+        if char == closing:
+            self._pos += 1
+            return True
+        if not self._first:
+            if char != ",":
+                raise json.JSONDecodeError(f"Expecting ',' or '{closing}'", self._buffer, self._pos)
+            self._pos += 1
+            self._skip_whitespace()
+        return False
+
+    def _decode(self):
+        """Decode the value at the cursor and move past it."""
+        self._skip_whitespace()
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError as exc:
+            truncated = exc.msg.startswith("Unterminated string") or exc.pos >= len(self._buffer) - _TRUNCATION_MARGIN
+            if self._eof or not truncated:
+                raise
+            self._retry_at = 2 * (len(self._buffer) - self._pos)
+            raise _Incomplete
+        if end == len(self._buffer) and not self._eof:
+            # A number may continue in the next read
+            self._retry_at = end - self._pos + 1
+            raise _Incomplete
+        self._pos = end
+        return value
+
+    def _run(self):
+        if not self._eof and len(self._buffer) - self._pos + self._pending_size < self._retry_at:
+            return []
+        # Drop what was consumed and take in the pending reads in one copy
+        self._buffer = "".join([self._buffer[self._pos:], *self._pending])
+        self._pos = 0
+        self._pending, self._pending_size = [], 0
+        self._retry_at = 0
+        trips = []
+        while True:
+            start = self._pos
+            try:
+                trip = self._step()
+            except _Incomplete:
+                # Resume the interrupted step from where it began
+                self._pos = start
+                return trips
+            self._retry_at = 0
+            if trip is not None:
+                if not isinstance(trip, dict):
+                    raise ValueError(f"Trip {self.trips_seen} is not an object")
+                self.trips_seen += 1
+                trips.append(trip)
+
+    def _step(self):
+        """Advance by one token or value; returns a trip when one completes."""
+        state = self._state
+        if state == "start":
+            self._expect("{")
+            self._state, self._first = "member", True
+        elif state == "member":
+            if self._separator("}"):
+                self._state = "lines"
+                return None
+            key = self._decode()
+            self._expect(":")
+            if key == "trips":
+                self._expect("[")
+                self._state, self._first, self._found_trips = "trips", True, True
+            else:
+                self.header[key] = self._decode()
+                self._first = False
+        elif state == "trips":
+            if self._separator("]"):
+                self._state, self._first = "member", False
+                return None
+            trip = self._decode()
+            self._first = False
+            return trip
+        elif state == "lines":
+            # ndjson: the header line, then one trip per line (possibly none).
+            # A header without "trips" is an ndjson header once a newline follows
+            # it, even at the end of the input (an export with no trips).
+            start = self._pos
+            try:
+                self._skip_whitespace()
+            finally:
+                if "\n" in self._buffer[start:self._pos]:
+                    self._found_trips = True
+            if not self._found_trips:
+                raise json.JSONDecodeError("Expecting a newline after the header", self._buffer, self._pos)
+            return self._decode()
+        return None
+
+def parse_datetime(value, what):
+    """datetime from an ISO 8601 string; ValueError naming `what` otherwise."""
+    if not isinstance(value, str):
+        raise ValueError(f"{what} is not an ISO 8601 string")
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{what} is not a valid ISO 8601 datetime: {value!r}")
+
+def _text(data, field, label, default=None):
+    value = data.get(field)
+    if value is None:
+        return default
+    if not isinstance(value, str):
+        raise ValueError(f"{label} has a non-text {field}")
+    return value
+
+def _number(data, field, label):
+    value = data[field]
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{label} has an invalid {field}: {value!r}")
+
+def _event_row(data, trip_id):
+    if not isinstance(data, dict):
+        raise ValueError("Event is not an object")
+    label = f"Event '{data.get('title')}'"
+    missing = [field for field in EVENT_REQUIRED_FIELDS if data.get(field) is None]
+    if missing:
+        raise ValueError(f"{label} is missing {', '.join(missing)}")
+    return {
+        "trip_id": trip_id,
+        "start_datetime": parse_datetime(data["start_datetime"], f"{label} start_datetime"),
+        "from_name": _text(data, "from_name", label),
+        "to_name": _text(data, "to_name", label),
+        "from_lat": _number(data, "from_lat", label),
+        "from_lng": _number(data, "from_lng", label),
+        "to_lat": _number(data, "to_lat", label),
+        "to_lng": _number(data, "to_lng", label),
+        "transport": _text(data, "transport", label) or "plane",
+        "title": _text(data, "title", label),
+        "note": _text(data, "note", label),
+    }
+
+def _media_list(data):
+    media = data.get("media_list") or []
+    if not isinstance(media, list):
+        raise ValueError(f"Event '{data.get('title')}' has a media_list that is not a list")
+    return media
+
+def _media_row(data, event_id, event_title):
+    label = f"Media of event '{event_title}'"
+    if not isinstance(data, dict):
+        raise ValueError(f"{label} is not an object")
+    url = _text(data, "url", label)
+    if not url:
+        raise ValueError(f"{label} is missing url")
+    return {"event_id": event_id, "url": url, "media_type": _text(data, "media_type", label, "image")}
+
+async def upload_chunks(file, size=IMPORT_READ_SIZE):
+    """Bytes of an UploadFile, read piece by piece."""
+    while chunk := await file.read(size):
+        yield chunk
+
+async def import_trips(session, chunks, trip_row, total_bytes=None):
+    """
+    Import the trips of an exported document streamed as byte chunks.
+    trip_row(trip) returns the Trip column values for a parsed trip.
+    Returns {"trips", "events", "media"} counts.
+    """
+    parser = TripStreamParser()
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    counts = {"trips": 0, "events": 0, "media": 0}
+    pending = []  # (trip row, event dicts)
+    pending_events = 0
+    uncommitted = 0
+    read = 0
+
+    async def write_pending():
+        nonlocal pending, pending_events, uncommitted
+        trip_ids = await insert_trips(session, [row for row, _ in pending])
+        event_rows, media_lists = [], []
+        for trip_id, (_, events) in zip(trip_ids, pending):
+            for data in events:
+                event_rows.append(_event_row(data, trip_id))
+                media_lists.append(_media_list(data))
+        event_ids = await insert_events(session, event_rows)
+        media_rows = [
+            _media_row(m, event_id, row["title"])
+            for event_id, row, media in zip(event_ids, event_rows, media_lists) for m in media
+        ]
+        await insert_media(session, media_rows)
+
+        counts["trips"] += len(trip_ids)
+        counts["events"] += len(event_ids)
+        counts["media"] += len(media_rows)
+        uncommitted += len(event_ids)
+        pending, pending_events = [], 0
+        if IMPORT_COMMIT_EVENTS and uncommitted >= IMPORT_COMMIT_EVENTS:
+            await session.commit()
+            uncommitted = 0
+        done = f" of {total_bytes}" if total_bytes else ""
+        print(f"DEBUG: Import progress: {counts['trips']} trips, {counts['events']} events, {read}{done} bytes read")
+
+    async def add(trips):
+        nonlocal pending_events
+        for trip in trips:
+            events = trip.get("events") or []
+            if not isinstance(events, list):
+                raise ValueError(f"Trip '{trip.get('title')}' has events that are not a list")
+            pending.append((trip_row(trip), events))
+            pending_events += len(events)
+            if pending_events >= BULK_CHUNK_SIZE or len(pending) >= BULK_CHUNK_SIZE:
+                await write_pending()
+
+    async for chunk in chunks:
+        # Large reads are parsed piece by piece so few trips are held at once
+        for start in range(0, len(chunk), IMPORT_READ_SIZE):
+            piece = chunk[start:start + IMPORT_READ_SIZE]
+            read += len(piece)
+            await add(parser.feed(decoder.decode(piece)))
+    await add(parser.feed(decoder.decode(b"", final=True)) + parser.close())
+    if pending:
+        await write_pending()
+    await session.commit()
+    return counts
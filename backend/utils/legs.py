@@ -0,0 +1,72 @@
+"""
+Derived leg geometry stored on TravelEvent.
+
+distance_km is the great-circle length of the leg and bearing_deg the compass
+bearing at departure (0-360, clockwise from north). They are derived from the
+coordinates, so the listener below sets them on every ORM insert and update,
+and utils/bulk.py fills them for Core inserts with add_leg_columns().
+
+Rows written before the columns existed are filled by backfill_legs(), run as
+a schema migration; `python -m utils.legs` recomputes every row.
+"""
+from sqlalchemy import event, select, update, bindparam
+from models import TravelEvent
+from utils.geo import haversine_km, initial_bearing_deg
+
+BACKFILL_BATCH_SIZE = 10000
+
+_events = TravelEvent.__table__
+COORDINATES = ["from_lat", "from_lng", "to_lat", "to_lng"]
+
+def leg_metrics(from_lat, from_lng, to_lat, to_lng):
+    """(distances_km, bearings_deg) arrays for arrays of leg coordinates."""
+    return (
+        haversine_km(from_lat, from_lng, to_lat, to_lng),
+        initial_bearing_deg(from_lat, from_lng, to_lat, to_lng),
+    )
+
+def add_leg_columns(rows):
+    """Set distance_km and bearing_deg on event row dicts, vectorized over the list."""
+    if rows:
+        distances, bearings = leg_metrics(*([row[name] for row in rows] for name in COORDINATES))
+        for row, distance, bearing in zip(rows, distances.tolist(), bearings.tolist()):
+            row["distance_km"] = distance
+            row["bearing_deg"] = bearing
+    return rows
+
+def backfill_legs(connection, only_missing=True):
+    """Compute the leg columns in batches of BACKFILL_BATCH_SIZE; returns the rows updated."""
+    statement = (
+        update(_events)
+        .where(_events.c.id == bindparam("event_id"))
+        .values(distance_km=bindparam("distance"), bearing_deg=bindparam("bearing"))
+    )
+    updated = 0
+    last_id = 0
+    while True:
+        query = select(_events.c.id, *(_events.c[name] for name in COORDINATES)).where(_events.c.id > last_id)
+        if only_missing:
+            query = query.where(_events.c.distance_km.is_(None))
+        rows = connection.execute(query.order_by(_events.c.id).limit(BACKFILL_BATCH_SIZE)).all()
+        if not rows:
+            return updated
+        ids, *coordinates = zip(*rows)
+        distances, bearings = leg_metrics(*coordinates)
+        connection.execute(statement, [
+            {"event_id": event_id, "distance": distance, "bearing": bearing}
+            for event_id, distance, bearing in zip(ids, distances.tolist(), bearings.tolist())
+        ])
+        updated += len(rows)
+        last_id = ids[-1]
+
+@event.listens_for(TravelEvent, "before_insert")
+@event.listens_for(TravelEvent, "before_update")
+def _set_leg_columns(mapper, connection, target):
+    distances, bearings = leg_metrics(*([getattr(target, name)] for name in COORDINATES))
+    target.distance_km = float(distances[0])
+    target.bearing_deg = float(bearings[0])
+
+if __name__ == "__main__":
+    from database import engine
+    with engine.begin() as conn:
+        print(f"Updated leg distance and bearing of {backfill_legs(conn, only_missing=False)} events")
@@ -1,13 +1,19 @@
 import os
+import json
 import exifread
 from PIL import Image
 from PIL.ExifTags import TAGS, GPSTAGS
 from geopy.geocoders import Nominatim
-from hachoir.parser import createParser
+from geopy.extra.rate_limiter import RateLimiter
+from hachoir.parser import guessParser
+from hachoir.stream import InputIOStream
 from hachoir.metadata import extractMetadata
 from hachoir.core import config as hachoir_config
 from datetime import datetime
+from contextlib import contextmanager
 import logging
+from utils.geocode_cache import cached_reverse_geocode
+from utils.gazetteer import get_gazetteer, GEOCODER_MODE
 
 # Disable hachoir warnings
 hachoir_config.quiet = True
@@ -29,18 +35,48 @@ def get_decimal_from_dms(dms, ref):
         decimal = -decimal
     return decimal
 
-def extract_image_metadata(file_path):
-    """Extract GPS and DateTime from images using PIL and ExifRead."""
-    metadata = {
+def empty_metadata():
+    return {
         "captured_at": None,
         "lat": None,
         "lng": None,
         "city": None,
         "country": None
     }
+
+def metadata_to_json(metadata):
+    return json.dumps(metadata, default=lambda value: value.isoformat() if isinstance(value, datetime) else str(value))
+
+def metadata_from_json(raw):
+    metadata = json.loads(raw)
+    if metadata.get("captured_at"):
+        metadata["captured_at"] = datetime.fromisoformat(metadata["captured_at"])
+    return metadata
+
+@contextmanager
+def _open_source(source):
+    """
+    Yield a binary file object for a path or an already open stream.
+    Streams (e.g. an UploadFile's spooled file) are rewound and left open so the
+    caller can reuse them, e.g. to upload the same bytes afterwards.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield f
+    else:
+        source.seek(0)
+        try:
+            yield source
+        finally:
+            source.seek(0)
+
+def extract_image_metadata(source):
+    """Extract GPS and DateTime from images using ExifRead.
+    Only the EXIF header segments are read, never the image data."""
+    metadata = empty_metadata()
     
     try:
-        with open(file_path, 'rb') as f:
+        with _open_source(source) as f:
             tags = exifread.process_file(f, details=False)
             
             # 1. Capture Time
@@ -66,22 +102,19 @@ def extract_image_metadata(file_path):
         
     return metadata
 
-def extract_video_metadata(file_path):
-    """Extract basic metadata from videos using hachoir."""
-    metadata = {
-        "captured_at": None,
-        "lat": None,
-        "lng": None,
-        "city": None,
-        "country": None
-    }
+def extract_video_metadata(source, filename=None):
+    """Extract basic metadata from videos using hachoir.
+    hachoir parses container atoms lazily and seeks over the media payload,
+    so only headers (e.g. the MP4/MOV moov atom) are actually read."""
+    metadata = empty_metadata()
     
-    parser = createParser(file_path)
-    if not parser:
-        return metadata
-        
     try:
-        with parser:
+        with _open_source(source) as f:
+            name = filename or getattr(f, "name", None) or "<stream>"
+            stream = InputIOStream(f, source=f"file:{name}", tags=[("filename", str(name))])
+            parser = guessParser(stream)
+            if not parser:
+                return metadata
             video_meta = extractMetadata(parser)
             if video_meta:
                 if video_meta.has('creation_date'):
@@ -96,42 +129,81 @@ def extract_video_metadata(file_path):
         
     return metadata
 
-def reverse_geocode(lat, lng):
-    """Convert coordinates to city/country using Nominatim (OpenStreetMap)."""
-    if lat is None or lng is None:
-        return None, None
-        
+# One geolocator per process; Nominatim's usage policy allows ~1 request/second
+_geolocator = Nominatim(user_agent="voyage_atlas_analyzer")
+_nominatim_reverse = RateLimiter(_geolocator.reverse, min_delay_seconds=1, max_retries=0, swallow_exceptions=False)
+
+def _nominatim_city(lat, lng):
+    """Resolve (city, country) with Nominatim. Raises on network/service errors."""
+    location = _nominatim_reverse((lat, lng), language='en', timeout=5)
+    if location and 'address' in location.raw:
+        address = location.raw['address']
+        city = address.get('city') or address.get('town') or address.get('village') or address.get('suburb')
+        country = address.get('country')
+        return city, country
+    return None, None
+
+def _online_reverse_geocode(lat, lng):
     try:
-        geolocator = Nominatim(user_agent="voyage_atlas_analyzer")
-        location = geolocator.reverse((lat, lng), language='en', timeout=5)
-        if location and 'address' in location.raw:
-            address = location.raw['address']
-            city = address.get('city') or address.get('town') or address.get('village') or address.get('suburb')
-            country = address.get('country')
-            return city, country
+        return cached_reverse_geocode(lat, lng, _nominatim_city)
     except Exception as e:
         logger.error(f"Geocoding failed: {e}")
-        
     return None, None
 
-def analyze_media(file_path):
+def reverse_geocode_batch(coords):
+    """
+    Convert [(lat, lng)] to [(city, country)] according to GEOCODER_MODE.
+    The offline gazetteer answers the whole batch in one vectorized query;
+    in hybrid mode only the points it cannot place go to Nominatim.
+    """
+    results = [(None, None)] * len(coords)
+    pending = [i for i, (lat, lng) in enumerate(coords) if lat is not None and lng is not None]
+
+    if GEOCODER_MODE != "online" and pending:
+        offline = get_gazetteer().reverse([coords[i][0] for i in pending], [coords[i][1] for i in pending])
+        for i, result in zip(pending, offline):
+            results[i] = result
+        pending = [i for i in pending if results[i][0] is None]
+
+    if GEOCODER_MODE != "offline":
+        for i in pending:
+            results[i] = _online_reverse_geocode(*coords[i])
+    return results
+
+def reverse_geocode(lat, lng):
+    """Convert coordinates to city/country (offline gazetteer and/or cached Nominatim, per GEOCODER_MODE)."""
+    return reverse_geocode_batch([(lat, lng)])[0]
+
+def geocode_metadata(metadata_list):
+    """Fill in city/country for every metadata dict with coordinates, as one batch."""
+    located = [m for m in metadata_list if m["lat"] and m["lng"]]
+    places = reverse_geocode_batch([(m["lat"], m["lng"]) for m in located])
+    for metadata, (city, country) in zip(located, places):
+        metadata["city"] = city
+        metadata["country"] = country
+    return metadata_list
+
+def analyze_media(source, filename=None, geocode=True):
     """
     Main entry point: Flexible common function for any media type.
     Detects type and extracts metadata including reverse geocoding.
+
+    source: a file path, or a seekable binary stream together with its filename.
+    geocode: set to False when the caller geocodes a whole batch afterwards
+    with geocode_metadata().
     """
-    ext = os.path.splitext(file_path)[1].lower()
+    name = filename or (source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", ""))
+    ext = os.path.splitext(str(name))[1].lower()
     
     if ext in ['.jpg', '.jpeg', '.png', '.tiff']:
-        metadata = extract_image_metadata(file_path)
+        metadata = extract_image_metadata(source)
     elif ext in ['.mp4', '.mov', '.avi', '.mkv']:
-        metadata = extract_video_metadata(file_path)
+        metadata = extract_video_metadata(source, filename)
     else:
-        metadata = {"captured_at": None, "lat": None, "lng": None, "city": None, "country": None}
+        metadata = empty_metadata()
         
     # Attempt Geocoding if coordinates found
-    if metadata["lat"] and metadata["lng"]:
-        city, country = reverse_geocode(metadata["lat"], metadata["lng"])
-        metadata["city"] = city
-        metadata["country"] = country
+    if geocode:
+        geocode_metadata([metadata])
         
     return metadata
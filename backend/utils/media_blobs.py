@@ -0,0 +1,129 @@
+"""
+Content-addressed media storage.
+
+Uploads are identified by the SHA-256 of their bytes, computed while the
+request body is spooled (hashed_uploads). Every distinct content is stored
+once, under media/<hash[:2]>/<hash><ext>, and described by a MediaBlob row
+that also caches its analysis. EventMedia rows point at their
+blob through content_hash; the mapper listeners below keep MediaBlob.ref_count
+in step with every insert and delete (cascades from events included), and
+release_unreferenced() removes blobs and objects no row points at any more.
+"""
+import os
+import hashlib
+from fastapi import HTTPException, Request, UploadFile
+from starlette.formparsers import MultiPartParser, MultiPartException
+from sqlalchemy import event, update, delete, inspect
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlmodel import select
+from models import EventMedia, MediaBlob
+from utils.media_pipeline import run_blocking
+from utils.derivatives import delete_derivatives
+
+_blobs = MediaBlob.__table__
+_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+class HashingUploadFile(UploadFile):
+    """UploadFile that hashes its bytes while the multipart parser spools them."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._digest = hashlib.sha256()
+
+    async def write(self, data):
+        self._digest.update(data)
+        await super().write(data)
+
+    @property
+    def content_hash(self):
+        return self._digest.hexdigest()
+
+class HashingMultiPartParser(MultiPartParser):
+    """Starlette's multipart parser with every file part spooled into a HashingUploadFile."""
+    def on_headers_finished(self):
+        super().on_headers_finished()
+        upload = self._current_part.file
+        if upload is not None:
+            self._current_part.file = HashingUploadFile(
+                file=upload.file, size=0, filename=upload.filename, headers=upload.headers
+            )
+
+async def hashed_uploads(request: Request):
+    """
+    Dependency yielding the "files" of a multipart request as HashingUploadFiles,
+    so content hashes and sizes come out of the single pass that spools the
+    body. The spooled files are closed after the response.
+    """
+    try:
+        form = await HashingMultiPartParser(request.headers, request.stream()).parse()
+    except (MultiPartException, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid multipart upload: {e}")
+    try:
+        files = [item for item in form.getlist("files") if isinstance(item, UploadFile)]
+        if not files:
+            raise HTTPException(status_code=400, detail="No files uploaded")
+        yield files
+    finally:
+        await form.close()
+
+def blob_key(content_hash, filename):
+    return f"media/{content_hash[:2]}/{content_hash}{os.path.splitext(filename or '')[1].lower()}"
+
+def insert_blob(dialect_name, blob):
+    """INSERT for a MediaBlob that leaves an existing row with the same hash
+    untouched; rowcount tells whether this statement created it."""
+    values = {column.name: getattr(blob, column.name) for column in _blobs.columns}
+    values["ref_count"] = 0
+    return _INSERTS[dialect_name](_blobs).values(**values).on_conflict_do_nothing(index_elements=["content_hash"])
+
+def _adjust_refs(connection, content_hash, delta):
+    if content_hash:
+        connection.execute(
+            update(_blobs)
+            .where(_blobs.c.content_hash == content_hash)
+            .values(ref_count=_blobs.c.ref_count + delta)
+        )
+
+@event.listens_for(EventMedia, "after_insert")
+def _reference_blob(mapper, connection, target):
+    _adjust_refs(connection, target.content_hash, 1)
+
+@event.listens_for(EventMedia, "after_update")
+def _move_reference(mapper, connection, target):
+    history = inspect(target).attrs.content_hash.history
+    for content_hash in history.deleted or ():
+        _adjust_refs(connection, content_hash, -1)
+    for content_hash in history.added or ():
+        _adjust_refs(connection, content_hash, 1)
+
+@event.listens_for(EventMedia, "after_delete")
+def _release_blob(mapper, connection, target):
+    _adjust_refs(connection, target.content_hash, -1)
+
+async def release_unreferenced(session, storage, hashes=None):
+    """
+    Delete blobs whose last reference is gone (only those in `hashes` when
+    given), then their stored objects and derivatives. Each row is deleted with a
+    ref_count <= 0 guard, so a blob re-referenced in the meantime survives.
+    """
+    query = select(MediaBlob).where(MediaBlob.ref_count <= 0)
+    if hashes is not None:
+        query = query.where(MediaBlob.content_hash.in_(set(hashes)))
+    keys = []
+    for blob in (await session.exec(query)).all():
+        result = await session.execute(
+            delete(_blobs).where(_blobs.c.content_hash == blob.content_hash, _blobs.c.ref_count <= 0)
+        )
+        if result.rowcount:
+            keys.append(blob.key)
+    await session.commit()
+    for key in keys:
+        try:
+            await run_blocking(storage.delete, key)
+            await run_blocking(delete_derivatives, storage, key)
+        except Exception as e:
+            print(f"DEBUG: Failed to delete blob {key}: {e}")
+    return len(keys)
+
+async def owned_by_blob(session, key):
+    """Whether a stored object belongs to a MediaBlob (legacy rows must not delete it)."""
+    return (await session.exec(select(MediaBlob.content_hash).where(MediaBlob.key == key))).first() is not None
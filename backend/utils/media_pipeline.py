@@ -0,0 +1,101 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from utils.media_analyzer import analyze_media, geocode_metadata, empty_metadata
+from utils.extraction import get_extraction_engine
+
+# Blocking media work (metadata parsing, reverse geocoding, storage
+# transfers) runs on a dedicated pool so it never blocks the event loop and
+# never competes with FastAPI's default threadpool.
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "16"))
+# Files of one request processed at the same time
+MEDIA_CONCURRENCY = int(os.getenv("MEDIA_CONCURRENCY", "8"))
+# Leading bytes of an in-memory upload sent to the extraction processes: the
+# metadata parsers only need the headers (EXIF segments, faststart moov atom)
+EXTRACTION_HEADER_BYTES = int(os.getenv("EXTRACTION_HEADER_BYTES", str(1 << 20)))
+
+_executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="media")
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv')
+
+def media_type_for(filename):
+    lower_filename = filename.lower()
+    if "pano" in lower_filename:
+        return "pano_image"
+    if lower_filename.endswith(VIDEO_EXTENSIONS):
+        return "video"
+    return "image"
+
+async def run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(fn, *args, **kwargs))
+
+async def map_bounded(fn, items, limit=MEDIA_CONCURRENCY):
+    """
+    Await `fn(item)` for every item with at most `limit` in flight.
+    Results are returned in input order; the first exception is raised
+    once every started task has finished, so none is left running against
+    the shared session.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _run(item):
+        async with semaphore:
+            return await fn(item)
+
+    results = await asyncio.gather(*(_run(item) for item in items), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+def analyze_upload(upload_file, geocode=True):
+    """Analyze an UploadFile in place: metadata comes from the header bytes of
+    its spooled file, with no temp-file copy."""
+    return analyze_media(upload_file.file, upload_file.filename, geocode=geocode)
+
+async def analyze_uploads(files):
+    """Extract metadata from every upload concurrently, then reverse geocode
+    all of them in one batch."""
+    metadata_list = await map_bounded(lambda file: run_blocking(analyze_upload, file, geocode=False), files)
+    return await run_blocking(geocode_metadata, metadata_list)
+
+def _extraction_source(upload_file):
+    """
+    What a worker process parses for an upload, without copying it: the
+    spooled file itself (reopened by path) once it has rolled over to disk,
+    otherwise the leading EXTRACTION_HEADER_BYTES of the in-memory buffer.
+    """
+    spooled = upload_file.file
+    if getattr(spooled, "_rolled", False):
+        spooled.flush()
+        name = spooled._file.name
+        # Unlinked temp files only have a descriptor, reachable through /proc on Linux
+        path = f"/proc/{os.getpid()}/fd/{name}" if isinstance(name, int) else name
+        if os.path.exists(path):
+            return path
+    spooled.seek(0)
+    try:
+        return spooled.read(EXTRACTION_HEADER_BYTES)
+    finally:
+        spooled.seek(0)
+
+def extract_uploads_in_pool(files):
+    """
+    Blocking: parse every upload on the extraction process pool (all cores,
+    per-file timeout), then geocode them as one batch. A file that fails or
+    times out gets empty metadata instead of failing the batch.
+    """
+    results = [None] * len(files)
+    sources = [(_extraction_source(f), f.filename) for f in files]
+    for position, metadata, error in get_extraction_engine().extract(sources):
+        if error:
+            print(f"DEBUG: Metadata extraction failed for {files[position].filename}: {error}")
+        results[position] = metadata or empty_metadata()
+    return geocode_metadata(results)
+
+def store_upload(storage, upload_file, key):
+    """Stream the UploadFile's bytes to storage in a single pass."""
+    upload_file.file.seek(0)
+    storage.put(key, upload_file.file, content_type=upload_file.content_type)
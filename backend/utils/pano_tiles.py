@@ -0,0 +1,108 @@
+"""
+Multi-resolution tile pyramids for panoramas.
+
+A pano_image is cut into square JPEG tiles of an equirectangular grid with
+power-of-two columns (rows = cols / 2), the layout photo-sphere-viewer's
+EquirectangularTilesAdapter loads. Every level halves the columns of the one
+above it, down to a 2 x 1 grid, and a small preview is shown while the visible
+tiles of the chosen level arrive. Everything lives under the original's key:
+
+    media/ab/<hash>.tiles/manifest.json
+    media/ab/<hash>.tiles/preview.jpg
+    media/ab/<hash>.tiles/<level>/<col>_<row>.jpg   (level 0 is the smallest)
+
+Like the viewer's default adapter, the whole image is mapped onto the sphere,
+so panoramas that are not 2:1 are stretched rather than padded.
+"""
+import io
+import os
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+
+PANO_TILE_SIZE = int(os.getenv("PANO_TILE_SIZE", "512"))
+PANO_PREVIEW_WIDTH = int(os.getenv("PANO_PREVIEW_WIDTH", "1024"))
+PANO_TILE_QUALITY = int(os.getenv("PANO_TILE_QUALITY", "80"))
+# The tiles adapter accepts at most 64 columns
+PANO_MAX_COLS = 64
+# Concurrent tile uploads per panorama
+PANO_UPLOAD_THREADS = 8
+
+def tiles_prefix(key):
+    return f"{os.path.splitext(key)[0]}.tiles/"
+
+def manifest_key(key):
+    return tiles_prefix(key) + "manifest.json"
+
+def tile_layout(width):
+    """(cols of the top level, tile edge in pixels) for an image `width` wide:
+    the fewest columns whose tiles fit PANO_TILE_SIZE, and tiles just large
+    enough that the top level keeps the full resolution."""
+    cols = 2
+    while cols < PANO_MAX_COLS and width / cols > PANO_TILE_SIZE:
+        cols *= 2
+    return cols, math.ceil(width / cols)
+
+def _jpeg(image):
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=PANO_TILE_QUALITY, optimize=True)
+    return out.getvalue()
+
+def render_tiles(source):
+    """Yield (relative path, JPEG bytes) for the preview and every tile, then
+    ("manifest.json", bytes) describing the pyramid."""
+    source.seek(0)
+    image = ImageOps.exif_transpose(Image.open(source)).convert("RGB")
+    top_cols, tile = tile_layout(image.width)
+
+    preview = image.resize((PANO_PREVIEW_WIDTH, PANO_PREVIEW_WIDTH // 2), Image.Resampling.LANCZOS)
+    yield "preview.jpg", _jpeg(preview)
+
+    levels = []
+    cols = top_cols
+    level = image.resize((tile * cols, tile * cols // 2), Image.Resampling.LANCZOS)
+    del image
+    # Top level first; each smaller level is the one above halved
+    while True:
+        rows = cols // 2
+        depth = int(math.log2(cols)) - 1
+        for col in range(cols):
+            for row in range(rows):
+                box = (col * tile, row * tile, (col + 1) * tile, (row + 1) * tile)
+                yield f"{depth}/{col}_{row}.jpg", _jpeg(level.crop(box))
+        levels.append({"level": depth, "width": level.width, "height": level.height, "cols": cols, "rows": rows})
+        if cols == 2:
+            break
+        cols //= 2
+        level = level.reduce(2)
+    source.seek(0)
+
+    manifest = {
+        "tile_size": tile,
+        "preview": "preview.jpg",
+        "tile_url": "{level}/{col}_{row}.jpg",
+        "levels": sorted(levels, key=lambda entry: entry["level"]),
+    }
+    yield "manifest.json", json.dumps(manifest).encode()
+
+def create_tiles(storage, source, key):
+    """Render the pyramid of the panorama at `key` and store it next to the
+    original; the manifest is written last, so its presence means complete."""
+    prefix = tiles_prefix(key)
+    stored = 0
+    with ThreadPoolExecutor(max_workers=PANO_UPLOAD_THREADS, thread_name_prefix="pano-tiles") as uploads:
+        pending = []
+        for path, data in render_tiles(source):
+            if path == "manifest.json":
+                for future in pending:
+                    future.result()
+                storage.put(prefix + path, io.BytesIO(data), content_type="application/json")
+                break
+            pending.append(uploads.submit(storage.put, prefix + path, io.BytesIO(data), content_type="image/jpeg"))
+            stored += 1
+            # Bound the encoded tiles held in memory while uploads catch up
+            if len(pending) >= PANO_UPLOAD_THREADS * 4:
+                pending.pop(0).result()
+    print(f"DEBUG: Stored {stored} panorama tiles under {prefix}")
+    return manifest_key(key)
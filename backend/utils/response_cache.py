@@ -0,0 +1,166 @@
+"""
+Response cache for the read endpoints.
+
+Every table has a version counter, bumped whenever a transaction that wrote
+to it commits. The engine events below see every INSERT, UPDATE and DELETE
+construct (ORM flushes, Core bulk inserts and the listeners' side tables
+alike), so no write path has to remember to invalidate anything.
+
+An endpoint decorated with @cached_response(Model, ...) on a router using
+CachedRoute keeps its serialized body in an LRU of at most
+RESPONSE_CACHE_BYTES, keyed by path and query string and tagged with the
+versions of the listed tables; once any of them moves on, the next request
+recomputes the body. Responses carry a strong ETag (a hash of the body) and
+`Cache-Control: no-cache`, so browsers revalidate with If-None-Match and an
+unchanged response costs a 304 without a body.
+
+Versions live in this process: writes made by another process (a second
+worker, `python -m utils.legs`) are not seen until something here writes the
+same table.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+RESPONSE_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_BYTES", str(64 << 20)))
+CACHE_CONTROL = "no-cache"
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+def table_versions(tables):
+    return tuple(_versions.get(name, 0) for name in tables)
+
+def bump_versions(tables):
+    with _versions_lock:
+        for name in tables:
+            _versions[name] = _versions.get(name, 0) + 1
+
+# Written tables are tracked on the pooled connection's info dict. They are
+# bumped when the transaction commits and once more when the connection goes
+# back to the pool: a request that read the old rows while the commit was
+# completing may have cached them under the first bump.
+_WRITTEN = "response_cache_written"
+_COMMITTED = "response_cache_committed"
+
+@event.listens_for(Engine, "after_execute")
+def _track_write(conn, clauseelement, multiparams, params, execution_options, result):
+    if getattr(clauseelement, "is_dml", False):
+        name = getattr(clauseelement.table, "name", None)
+        if name:
+            conn.info.setdefault(_WRITTEN, set()).add(name)
+
+@event.listens_for(Engine, "commit")
+def _bump_on_commit(conn):
+    written = conn.info.pop(_WRITTEN, None)
+    if written:
+        bump_versions(written)
+        conn.info.setdefault(_COMMITTED, set()).update(written)
+
+@event.listens_for(Engine, "rollback")
+def _forget_writes(conn):
+    conn.info.pop(_WRITTEN, None)
+
+@event.listens_for(Pool, "checkin")
+def _bump_on_checkin(dbapi_connection, connection_record):
+    if connection_record is not None:
+        committed = connection_record.info.pop(_COMMITTED, None)
+        if committed:
+            bump_versions(committed)
+
+class _Entry:
+    __slots__ = ("versions", "etag", "body", "headers")
+
+    def __init__(self, versions, etag, body, headers):
+        self.versions = versions
+        self.etag = etag
+        self.body = body
+        self.headers = headers
+
+class ResponseCache:
+    """LRU of response entries bounded by the total size of their bodies."""
+    def __init__(self, max_bytes=RESPONSE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.discard(key)
+        if len(entry.body) > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self.size += len(entry.body)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted.body)
+
+    def discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry.body)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+response_cache = ResponseCache()
+
+def cached_response(*models):
+    """Cache the GET endpoint's response until one of the models' tables is written."""
+    def decorate(endpoint):
+        endpoint.cache_tables = tuple(model.__tablename__ for model in models)
+        return endpoint
+    return decorate
+
+def _etag(body):
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+class CachedRoute(APIRoute):
+    """APIRoute serving endpoints marked with @cached_response from response_cache."""
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        tables = getattr(self.endpoint, "cache_tables", None)
+        if not tables or "GET" not in self.methods:
+            return handler
+
+        async def cached_handler(request: Request) -> Response:
+            key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+            # Read before the handler runs, so a write committed meanwhile invalidates the entry
+            versions = table_versions(tables)
+            entry = response_cache.get(key)
+            if entry is None or entry.versions != versions:
+                response = await handler(request)
+                if response.status_code != 200 or isinstance(response, StreamingResponse):
+                    return response
+                headers = {
+                    name: value for name, value in response.headers.items()
+                    if name not in ("content-length", "etag", "cache-control")
+                }
+                entry = _Entry(versions, _etag(response.body), response.body, headers)
+                response_cache.put(key, entry)
+            validators = {"ETag": entry.etag, "Cache-Control": CACHE_CONTROL}
+            if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+                return Response(status_code=304, headers=validators)
+            return Response(content=entry.body, headers={**entry.headers, **validators})
+
+        return cached_handler
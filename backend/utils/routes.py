@@ -0,0 +1,69 @@
+from sqlalchemy import event, select, func, delete, insert, case
+from models import TravelEvent, TravelRoute
+
+# Transport codes used by the route table and the /events/arcs payload.
+# Unknown values are stored as "other" so the code array stays compact.
+TRANSPORT_MODES = ["plane", "train", "car", "bus", "ship", "walk", "other"]
+_TRANSPORT_INDEX = {mode: i for i, mode in enumerate(TRANSPORT_MODES)}
+
+route_table = TravelRoute.__table__
+
+def transport_code(transport):
+    return _TRANSPORT_INDEX.get((transport or "").lower(), _TRANSPORT_INDEX["other"])
+
+def route_row(event_data):
+    """Build a route table row from a TravelEvent or a dict with the same keys."""
+    get = event_data.get if isinstance(event_data, dict) else lambda key: getattr(event_data, key)
+    return {
+        "event_id": get("id"),
+        "trip_id": get("trip_id"),
+        "start_datetime": get("start_datetime"),
+        "from_lat": get("from_lat"),
+        "from_lng": get("from_lng"),
+        "to_lat": get("to_lat"),
+        "to_lng": get("to_lng"),
+        "transport": transport_code(get("transport")),
+    }
+
+def upsert_routes(connection, events):
+    """Replace the route rows for the given events (ORM objects or dicts)."""
+    rows = [route_row(e) for e in events]
+    if not rows:
+        return
+    connection.execute(delete(route_table).where(route_table.c.event_id.in_([r["event_id"] for r in rows])))
+    connection.execute(insert(route_table), rows)
+
+def delete_routes(connection, event_ids):
+    if event_ids:
+        connection.execute(delete(route_table).where(route_table.c.event_id.in_(list(event_ids))))
+
+def rebuild_routes(connection):
+    """Repopulate the whole route table from TravelEvent in one statement."""
+    ev = TravelEvent.__table__
+    connection.execute(delete(route_table))
+    connection.execute(
+        insert(route_table).from_select(
+            ["event_id", "trip_id", "start_datetime", "from_lat", "from_lng", "to_lat", "to_lng", "transport"],
+            select(
+                ev.c.id, ev.c.trip_id, ev.c.start_datetime,
+                ev.c.from_lat, ev.c.from_lng, ev.c.to_lat, ev.c.to_lng,
+                _transport_case(ev.c.transport)
+            )
+        )
+    )
+
+def _transport_case(column):
+    return case(
+        {mode: code for mode, code in _TRANSPORT_INDEX.items()},
+        value=func.lower(column),
+        else_=_TRANSPORT_INDEX["other"]
+    )
+
+@event.listens_for(TravelEvent, "after_insert")
+@event.listens_for(TravelEvent, "after_update")
+def _sync_route(mapper, connection, target):
+    upsert_routes(connection, [target])
+
+@event.listens_for(TravelEvent, "before_delete")
+def _drop_route(mapper, connection, target):
+    delete_routes(connection, [target.id])
@@ -0,0 +1,164 @@
+"""
+Spatial lookups of event destinations and geotagged media.
+
+TravelEvent.to_geohash and EventMedia.geohash hold the geohash of the
+destination / photo location at GEOHASH_PRECISION (~5 m cells) and are B-tree
+indexed. A bounding box is covered by at most SPATIAL_MAX_CELLS geohash cells
+(utils/geohash.covering_ranges), which become range conditions on the index;
+the exact box test and, for radius queries, the great-circle distance then
+run on the few candidate rows only. Boxes crossing the antimeridian are split
+in two. A radius query with a limit starts SPATIAL_RADIUS_STEPS halvings
+below the radius and doubles it until enough rows are found, so a nearest-one
+lookup in a dense area does not load every row of the full circle.
+
+The geohashes are derived from the coordinates, so the listeners below set
+them on every ORM insert and update and utils/bulk.py fills them for Core
+inserts with add_geohash_columns(). Rows written before the columns existed
+are filled by backfill_geohashes(), run as a schema migration.
+"""
+import math
+import os
+from sqlalchemy import event, select, update, bindparam, and_, or_
+from models import TravelEvent, EventMedia
+from utils.geo import EARTH_RADIUS_KM, haversine_km
+from utils.geohash import encode_many, covering_ranges
+
+GEOHASH_PRECISION = 9
+SPATIAL_MAX_CELLS = int(os.getenv("SPATIAL_MAX_CELLS", "32"))
+SPATIAL_RADIUS_STEPS = int(os.getenv("SPATIAL_RADIUS_STEPS", "6"))
+BACKFILL_BATCH_SIZE = 10000
+
+_events = TravelEvent.__table__
+_media = EventMedia.__table__
+
+# (model, lat column, lng column, geohash column) per indexed table
+EVENT_POINTS = (TravelEvent, "to_lat", "to_lng", "to_geohash")
+MEDIA_POINTS = (EventMedia, "lat", "lng", "geohash")
+
+def add_geohash_columns(rows, points):
+    """Set the geohash column on row dicts, vectorized over the list; None without coordinates."""
+    _, lat_name, lng_name, hash_name = points
+    located = [row for row in rows if row.get(lat_name) is not None and row.get(lng_name) is not None]
+    hashes = encode_many([row[lat_name] for row in located], [row[lng_name] for row in located], GEOHASH_PRECISION)
+    for row in rows:
+        row[hash_name] = None
+    for row, value in zip(located, hashes):
+        row[hash_name] = value
+    return rows
+
+def backfill_geohashes(connection, points):
+    """Fill the missing geohashes of a table in batches; returns the rows updated."""
+    model, lat_name, lng_name, hash_name = points
+    table = model.__table__
+    statement = update(table).where(table.c.id == bindparam("row_id")).values({hash_name: bindparam("hash")})
+    updated = 0
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(table.c.id, table.c[lat_name], table.c[lng_name])
+            .where(table.c.id > last_id, table.c[hash_name].is_(None),
+                   table.c[lat_name].is_not(None), table.c[lng_name].is_not(None))
+            .order_by(table.c.id).limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return updated
+        ids, lats, lngs = zip(*rows)
+        connection.execute(statement, [
+            {"row_id": row_id, "hash": value}
+            for row_id, value in zip(ids, encode_many(lats, lngs, GEOHASH_PRECISION))
+        ])
+        updated += len(rows)
+        last_id = ids[-1]
+
+def _set_geohash(target, lat_name, lng_name, hash_name):
+    lat, lng = getattr(target, lat_name), getattr(target, lng_name)
+    value = None if lat is None or lng is None else encode_many([lat], [lng], GEOHASH_PRECISION)[0]
+    setattr(target, hash_name, value)
+
+@event.listens_for(TravelEvent, "before_insert")
+@event.listens_for(TravelEvent, "before_update")
+def _set_event_geohash(mapper, connection, target):
+    _set_geohash(target, *EVENT_POINTS[1:])
+
+@event.listens_for(EventMedia, "before_insert")
+@event.listens_for(EventMedia, "before_update")
+def _set_media_geohash(mapper, connection, target):
+    _set_geohash(target, *MEDIA_POINTS[1:])
+
+def split_box(min_lat, min_lng, max_lat, max_lng):
+    """The box as [(min_lat, min_lng, max_lat, max_lng)], split at the antimeridian when min_lng > max_lng."""
+    if min_lng > max_lng:
+        return [(min_lat, min_lng, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lng)]
+    return [(min_lat, min_lng, max_lat, max_lng)]
+
+def radius_boxes(lat, lng, radius_km):
+    """Boxes enclosing every point within radius_km of (lat, lng)."""
+    angle = radius_km / EARTH_RADIUS_KM
+    d_lat = math.degrees(angle)
+    min_lat, max_lat = lat - d_lat, lat + d_lat
+    if min_lat <= -90 or max_lat >= 90:
+        # The circle contains a pole: every longitude
+        return [(max(min_lat, -90.0), -180.0, min(max_lat, 90.0), 180.0)]
+    d_lng = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(lat)))))
+    if d_lng >= 180:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+    min_lng, max_lng = lng - d_lng, lng + d_lng
+    if min_lng < -180:
+        min_lng += 360
+    if max_lng > 180:
+        max_lng -= 360
+    return split_box(min_lat, min_lng, max_lat, max_lng)
+
+def box_clause(points, boxes):
+    """WHERE clause for rows inside any of the boxes: geohash ranges for the index, then the exact box."""
+    model, lat_name, lng_name, hash_name = points
+    lat_col, lng_col, hash_col = (getattr(model, name) for name in (lat_name, lng_name, hash_name))
+    clauses = []
+    for min_lat, min_lng, max_lat, max_lng in boxes:
+        ranges = [
+            hash_col >= lower if upper is None else and_(hash_col >= lower, hash_col < upper)
+            for lower, upper in covering_ranges(min_lat, min_lng, max_lat, max_lng, SPATIAL_MAX_CELLS, GEOHASH_PRECISION)
+        ]
+        clauses.append(and_(or_(*ranges), lat_col.between(min_lat, max_lat), lng_col.between(min_lng, max_lng)))
+    return or_(*clauses)
+
+async def within_box(session, points, min_lat, min_lng, max_lat, max_lng, *where, limit=None):
+    """Rows of the points' model inside the box (min_lng > max_lng crosses the antimeridian)."""
+    model = points[0]
+    query = select(model).where(box_clause(points, split_box(min_lat, min_lng, max_lat, max_lng)), *where)
+    query = query.order_by(model.id)
+    if limit:
+        query = query.limit(limit)
+    return (await session.execute(query)).scalars().all()
+
+async def _within_radius_once(session, points, lat, lng, radius_km, where):
+    model, lat_name, lng_name, _ = points
+    query = select(model).where(box_clause(points, radius_boxes(lat, lng, radius_km)), *where)
+    candidates = (await session.execute(query)).scalars().all()
+    if not candidates:
+        return []
+    distances = haversine_km(
+        lat, lng,
+        [getattr(row, lat_name) for row in candidates], [getattr(row, lng_name) for row in candidates]
+    ).tolist()
+    return sorted(
+        ((row, distance) for row, distance in zip(candidates, distances) if distance <= radius_km),
+        key=lambda pair: (pair[1], pair[0].id)
+    )
+
+async def within_radius(session, points, lat, lng, radius_km, *where, limit=None):
+    """[(row, distance_km)] of the points' model within radius_km of (lat, lng), nearest first."""
+    if not limit:
+        return await _within_radius_once(session, points, lat, lng, radius_km, where)
+    # `limit` rows within a smaller radius are the nearest ones overall
+    step_km = radius_km / 2 ** SPATIAL_RADIUS_STEPS
+    while True:
+        step_km = min(step_km * 2, radius_km)
+        found = await _within_radius_once(session, points, lat, lng, step_km, where)
+        if len(found) >= limit or step_km >= radius_km:
+            return found[:limit]
+
+async def nearest_destination(session, trip_id, lat, lng, radius_km):
+    """(event, distance_km) of the trip's event arriving closest to (lat, lng) within radius_km, or None."""
+    found = await within_radius(session, EVENT_POINTS, lat, lng, radius_km, TravelEvent.trip_id == trip_id, limit=1)
+    return found[0] if found else None
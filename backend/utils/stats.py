@@ -0,0 +1,237 @@
+"""
+Travel statistics maintained as trips and events are written.
+
+TravelStat keeps running totals per (dimension, key), so /events/stats reads
+a few dozen rows instead of every event:
+
+- "total" (key ""): trips, events, places, distance_km and Trip.cost
+- "continent" / "country": events, places and distance_km by destination
+- "year" / "transport": events and distance_km
+
+Distances are great-circle lengths of the legs. Destinations are classified
+with the offline gazetteer: nearest city -> country -> continent, "Unknown"
+when no city is within STATS_PLACE_MAX_KM. "places" counts distinct
+destinations (to_name, to_lat, to_lng); VisitedPlace reference-counts them, so
+a place is counted when its first event arrives and dropped with its last.
+
+The mapper listeners below apply every ORM insert, update and delete. Core
+bulk inserts bypass them and call apply_events / apply_trips themselves
+(see utils/bulk.py); rebuild_stats() recomputes everything from scratch.
+"""
+import os
+from collections import defaultdict
+from sqlalchemy import event, select, delete, inspect, tuple_
+from sqlalchemy.dialects import sqlite, postgresql
+from models import Trip, TravelEvent, TravelStat, VisitedPlace
+from utils.geo import haversine_km
+from utils.gazetteer import get_gazetteer
+from utils.routes import TRANSPORT_MODES, transport_code
+
+STATS_PLACE_MAX_KM = float(os.getenv("STATS_PLACE_MAX_KM", "500"))
+# Events read per batch when rebuilding
+STATS_REBUILD_BATCH = 10000
+
+CONTINENT_NAMES = {
+    "AF": "Africa",
+    "AN": "Antarctica",
+    "AS": "Asia",
+    "EU": "Europe",
+    "NA": "North America",
+    "OC": "Oceania",
+    "SA": "South America",
+}
+UNKNOWN = "Unknown"
+DIMENSIONS = ["total", "continent", "country", "year", "transport"]
+COUNTERS = ["trips", "events", "places", "distance_km", "cost"]
+EVENT_FIELDS = ["start_datetime", "to_name", "from_lat", "from_lng", "to_lat", "to_lng", "transport"]
+
+_stats = TravelStat.__table__
+_places = VisitedPlace.__table__
+_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+def classify(lats, lngs):
+    """[(country, continent)] for every coordinate."""
+    gazetteer = get_gazetteer()
+    indices, _ = gazetteer.nearest(lats, lngs, STATS_PLACE_MAX_KM)
+    result = []
+    for i in indices.tolist():
+        if i < 0:
+            result.append((UNKNOWN, UNKNOWN))
+            continue
+        code = gazetteer.country_codes[i]
+        result.append((gazetteer.country_name(code), CONTINENT_NAMES.get(gazetteer.continent(code), UNKNOWN)))
+    return result
+
+def _upsert(connection, table, keys, rows, counters, returning=()):
+    """Add the counters of `rows` to the existing rows with the same keys."""
+    statement = _INSERTS[connection.dialect.name](table)
+    statement = statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: table.c[name] + statement.excluded[name] for name in counters}
+    )
+    if returning:
+        return connection.execute(statement.returning(*(table.c[name] for name in returning)), rows).all()
+    connection.execute(statement, rows)
+
+def _write_stats(connection, deltas):
+    rows = [
+        {"dimension": dimension, "key": key, **dict(zip(COUNTERS, values))}
+        for (dimension, key), values in deltas.items()
+    ]
+    if rows:
+        _upsert(connection, _stats, ["dimension", "key"], rows, COUNTERS)
+
+def apply_events(connection, events, sign=1):
+    """Count (sign=1) or uncount (sign=-1) events, given as TravelEvent objects
+    or dicts with the same keys, in the aggregate tables."""
+    def get(e, field):
+        return e.get(field) if isinstance(e, dict) else getattr(e, field, None)
+
+    distances = [get(e, "distance_km") for e in events]
+    events = [{field: get(e, field) for field in EVENT_FIELDS} for e in events]
+    if not events:
+        return
+    if None in distances:
+        # Rows from before the leg columns (utils/legs.py) were filled
+        distances = haversine_km(
+            [e["from_lat"] for e in events], [e["from_lng"] for e in events],
+            [e["to_lat"] for e in events], [e["to_lng"] for e in events]
+        ).tolist()
+    places = classify([e["to_lat"] for e in events], [e["to_lng"] for e in events])
+
+    deltas = defaultdict(lambda: [0, 0, 0, 0.0, 0.0])
+    place_deltas = {}
+    for e, distance, (country, continent) in zip(events, distances, places):
+        keys = [
+            ("total", ""),
+            ("continent", continent),
+            ("country", country),
+            ("year", str(e["start_datetime"].year)),
+            ("transport", TRANSPORT_MODES[transport_code(e["transport"])]),
+        ]
+        for key in keys:
+            deltas[key][1] += sign
+            deltas[key][3] += sign * distance
+        place = (e["to_name"], e["to_lat"], e["to_lng"])
+        if place not in place_deltas:
+            place_deltas[place] = {"country": country, "continent": continent, "events": 0}
+        place_deltas[place]["events"] += sign
+
+    # A place counts while at least one event arrives there
+    place_rows = [
+        {"name": name, "lat": lat, "lng": lng, **values}
+        for (name, lat, lng), values in place_deltas.items() if values["events"]
+    ]
+    emptied = []
+    if place_rows:
+        counts = _upsert(connection, _places, ["name", "lat", "lng"], place_rows, ["events"],
+                         returning=["name", "lat", "lng", "events"])
+        for name, lat, lng, after in counts:
+            values = place_deltas[(name, lat, lng)]
+            before = after - values["events"]
+            change = (after > 0) - (before > 0)
+            if change:
+                for key in [("total", ""), ("continent", values["continent"]), ("country", values["country"])]:
+                    deltas[key][2] += change
+            if after <= 0:
+                emptied.append((name, lat, lng))
+    if emptied:
+        connection.execute(delete(_places).where(tuple_(_places.c.name, _places.c.lat, _places.c.lng).in_(emptied)))
+    _write_stats(connection, deltas)
+
+def apply_trips(connection, trips, sign=1):
+    """Count or uncount trips (Trip objects or dicts with "cost") in the totals."""
+    trips = list(trips)
+    if not trips:
+        return
+    cost = sum((t.get("cost") if isinstance(t, dict) else t.cost) or 0.0 for t in trips)
+    _write_stats(connection, {("total", ""): [sign * len(trips), 0, 0, 0.0, sign * cost]})
+
+def rebuild_stats(connection):
+    """Recompute both aggregate tables from the trips and events."""
+    connection.execute(delete(_stats))
+    connection.execute(delete(_places))
+    apply_trips(connection, [dict(row) for row in connection.execute(select(Trip.__table__.c.cost)).mappings()])
+    ev = TravelEvent.__table__
+    columns = [ev.c[field] for field in EVENT_FIELDS]
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(ev.c.id, *columns).where(ev.c.id > last_id).order_by(ev.c.id).limit(STATS_REBUILD_BATCH)
+        ).mappings().all()
+        if not rows:
+            return
+        apply_events(connection, [dict(row) for row in rows])
+        last_id = rows[-1]["id"]
+
+def _previous(target, fields):
+    """Values of `fields` before the pending change, or None if none of them changed."""
+    state = inspect(target)
+    values = {}
+    changed = False
+    for field in fields:
+        deleted = state.attrs[field].history.deleted
+        if deleted:
+            values[field] = deleted[0]
+            changed = True
+        else:
+            values[field] = getattr(target, field)
+    return values if changed else None
+
+@event.listens_for(TravelEvent, "after_insert")
+def _count_event(mapper, connection, target):
+    apply_events(connection, [target])
+
+@event.listens_for(TravelEvent, "after_update")
+def _recount_event(mapper, connection, target):
+    previous = _previous(target, EVENT_FIELDS)
+    if previous:
+        apply_events(connection, [previous], -1)
+        apply_events(connection, [target])
+
+@event.listens_for(TravelEvent, "after_delete")
+def _uncount_event(mapper, connection, target):
+    apply_events(connection, [target], -1)
+
+@event.listens_for(Trip, "after_insert")
+def _count_trip(mapper, connection, target):
+    apply_trips(connection, [target])
+
+@event.listens_for(Trip, "after_update")
+def _recount_trip(mapper, connection, target):
+    previous = _previous(target, ["cost"])
+    if previous:
+        _write_stats(connection, {("total", ""): [0, 0, 0, 0.0, (target.cost or 0.0) - (previous["cost"] or 0.0)]})
+
+@event.listens_for(Trip, "after_delete")
+def _uncount_trip(mapper, connection, target):
+    apply_trips(connection, [target], -1)
+
+def stats_payload(rows):
+    """/events/stats payload from TravelStat rows."""
+    total = {name: 0 for name in COUNTERS}
+    breakdowns = {dimension: [] for dimension in DIMENSIONS[1:]}
+    for row in rows:
+        if row.dimension == "total":
+            total = {name: getattr(row, name) for name in COUNTERS}
+        elif row.dimension in breakdowns and (row.events > 0 or row.places > 0):
+            breakdowns[row.dimension].append({
+                "name": row.key,
+                "events": row.events,
+                "places": row.places,
+                "distance_km": round(row.distance_km, 1) or 0.0,
+            })
+    for dimension, entries in breakdowns.items():
+        if dimension == "year":
+            entries.sort(key=lambda entry: entry["name"])
+        else:
+            entries.sort(key=lambda entry: (-entry["places"], -entry["events"], entry["name"]))
+    total["distance_km"] = round(total["distance_km"], 1) or 0.0
+    return {
+        **total,
+        "countries_visited": sum(1 for entry in breakdowns["country"] if entry["places"] > 0 and entry["name"] != UNKNOWN),
+        "continents": breakdowns["continent"],
+        "countries": breakdowns["country"],
+        "years": breakdowns["year"],
+        "transports": breakdowns["transport"],
+    }
@@ -13,18 +13,19 @@ import './App.css';
 import { Play, Pause, SkipForward, SkipBack, Plane, MapPin, Wind, ArrowUp, Plus, Calendar, Database, Share2, Globe } from 'lucide-react';
 import TripDashboard from './components/TripDashboard';
 import './components/HUD.css';
-import { calculateDistance, formatDistance } from './utils';
+import { legDistance, formatDistance } from './utils';
 
 const API_BASE = '/api';
 
 const App = () => {
   const [events, setEvents] = useState([]);
   const [trips, setTrips] = useState([]); // Grouped data from backend
+  const [dataVersion, setDataVersion] = useState(0); // Bumped on every reload so the globe refetches its arcs
   const [currentEventIndex, setCurrentEventIndex] = useState(-1);
   const [isPlaying, setIsPlaying] = useState(false);
   const [speed, setSpeed] = useState(1);
   const [showForm, setShowForm] = useState(false);
-  const [panoUrl, setPanoUrl] = useState(null);
+  const [panoMedia, setPanoMedia] = useState(null);
   const [photoUrl, setPhotoUrl] = useState(null);
   const [carouselData, setCarouselData] = useState(null); // { mediaList, index }
   const [selectedCoords, setSelectedCoords] = useState(null);
@@ -49,7 +50,7 @@ const App = () => {
      trips.forEach(trip => {
          if(trip.events && trip.events.length > 0) {
              trip.events.forEach((ev, idx) => {
-                 total += calculateDistance(ev.from_lat, ev.from_lng, ev.to_lat, ev.to_lng);
+                 total += legDistance(ev);
              });
          }
      });
@@ -58,7 +59,8 @@ const App = () => {
 
   const fetchEvents = async () => {
     try {
-      // Fetch both flat events for globe AND grouped trips for dashboard metadata
+      // Flat events (with media) for playback and the event views, grouped trips
+      // for dashboard metadata; the globe loads its own compact arcs
       const [eventsRes, tripsRes] = await Promise.all([
           axios.get(`${API_BASE}/events/`),
           axios.get(`${API_BASE}/events/trips`)
@@ -66,6 +68,7 @@ const App = () => {
       
       setEvents(eventsRes.data);
       setTrips(tripsRes.data);
+      setDataVersion(v => v + 1);
       
       if (eventsRes.data.length > 0 && currentEventIndex === -1) setCurrentEventIndex(0);
       return eventsRes.data;
@@ -183,7 +186,7 @@ const App = () => {
           setIsPlaying(false);
           // Show panorama from media list if available
           const pano = current.media_list?.find(m => m.media_type === 'pano_image');
-          if (pano) setPanoUrl(pano.url);
+          if (pano) setPanoMedia(pano);
         }
       }, 5000 / speed);
     }
@@ -197,8 +200,8 @@ const App = () => {
   return (
     <div className="app-container">
        <TravelGlobe 
-          events={events} 
-          currentEventIndex={currentEventIndex}
+          currentEventId={events[currentEventIndex]?.id}
+          refreshKey={dataVersion}
           isPlaying={isPlaying}
           speed={speed}
           onGlobeClick={handleGlobeClick}
@@ -290,7 +293,6 @@ const App = () => {
 
        {showStats && (
          <ContinentStats 
-            events={events}
             onClose={() => setShowStats(false)}
          />
        )}
@@ -332,7 +334,7 @@ const App = () => {
       )}
 
       {/* Panorama Viewer and Media Carousel */}
-      {panoUrl && <PanoramaViewer imageUrl={panoUrl} onClose={() => setPanoUrl(null)} />}
+      {panoMedia && <PanoramaViewer imageUrl={panoMedia.url} tilesUrl={panoMedia.tiles_url} onClose={() => setPanoMedia(null)} />}
       {carouselData && (
         <MediaCarousel 
           mediaList={carouselData.mediaList} 
@@ -1,39 +1,24 @@
-import React, { useMemo } from 'react';
+import React, { useEffect, useState } from 'react';
+import axios from 'axios';
 import { X, Globe } from 'lucide-react';
 import './ContinentStats.css';
-import { getContinent } from '../utils/continentUtils';
 
-const ContinentStats = ({ events, onClose }) => {
-    
-    const stats = useMemo(() => {
-        if (!events || events.length === 0) return [];
+const API_BASE = '/api';
 
-        const continentCounts = {};
-        const visitedCities = new Set();
+const ContinentStats = ({ onClose }) => {
+    // Aggregated on the server; continents are classified there from the gazetteer
+    const [summary, setSummary] = useState(null);
 
-        events.forEach(event => {
-            // Check 'to_name' (Destination)
-            const cityKey = `${event.to_name}-${event.to_lat}-${event.to_lng}`;
-            
-            if (!visitedCities.has(cityKey)) {
-                visitedCities.add(cityKey);
-                
-                const continent = getContinent(event.to_lat, event.to_lng);
-                continentCounts[continent] = (continentCounts[continent] || 0) + 1;
-            }
-        });
-
-        // Also check 'from_name' of the very first event? 
-        // Typically we care about destinations. But if I started in Seoul, it counts as a place I've been.
-        // Let's include the start of the first event if simpler.
-        // For now, let's stick to destinations (legs completed).
+    useEffect(() => {
+        axios.get(`${API_BASE}/events/stats`)
+            .then(res => setSummary(res.data))
+            .catch(err => console.error("Failed to load stats", err));
+    }, []);
 
-        // Sort by count descending
-        return Object.entries(continentCounts)
-            .map(([name, count]) => ({ name, count }))
-            .sort((a, b) => b.count - a.count);
-
-    }, [events]);
+    // Distinct destinations per continent, most visited first
+    const stats = (summary?.continents || [])
+        .filter(continent => continent.places > 0)
+        .map(continent => ({ name: continent.name, count: continent.places }));
 
     return (
         <div className="continent-stats-panel">
@@ -56,7 +41,21 @@ const ContinentStats = ({ events, onClose }) => {
                         </div>
                     ))
                 ) : (
-                    <div className="no-data">No travel data available</div>
+                    <div className="no-data">{summary ? 'No travel data available' : 'Loading...'}</div>
+                )}
+                {summary && summary.events > 0 && (
+                    <>
+                        <div className="stat-row">
+                            <span className="continent-name">Countries</span>
+                            <span className="dots-leader"></span>
+                            <span className="visit-count">{summary.countries_visited}</span>
+                        </div>
+                        <div className="stat-row">
+                            <span className="continent-name">Distance</span>
+                            <span className="dots-leader"></span>
+                            <span className="visit-count">{Math.round(summary.distance_km).toLocaleString()} km</span>
+                        </div>
+                    </>
                 )}
             </div>
         </div>
@@ -2,7 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Trash2, X, Image as ImageIcon, MapPin, ChevronDown, ChevronRight, Calendar, ArrowUpDown, Globe } from 'lucide-react';
 import axios from 'axios';
 import './EventManager.css';
-import { calculateDistance, formatDistance } from '../utils';
+import { legDistance, formatDistance } from '../utils';
 
 const API_BASE = '/api';
 
@@ -17,7 +17,7 @@ const EventManager = ({ events: propEvents, onClose, onRefresh, onSelectTrip })
 
   const fetchTrips = async () => {
     try {
-      const res = await axios.get(`${API_BASE}/events/trips`);
+      const res = await axios.get(`${API_BASE}/events/trips`, { params: { include: 'events' } });
       setTrips(res.data);
     } catch (err) {
       console.error("Failed to fetch trips", err);
@@ -61,7 +61,7 @@ const EventManager = ({ events: propEvents, onClose, onRefresh, onSelectTrip })
       if (!trip.events) return 0;
       let total = 0;
       trip.events.forEach(ev => {
-          total += calculateDistance(ev.from_lat, ev.from_lng, ev.to_lat, ev.to_lng);
+          total += legDistance(ev);
       });
       return total;
   };
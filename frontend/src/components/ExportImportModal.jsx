@@ -9,6 +9,7 @@ const ExportImportModal = ({ onClose, onRefresh }) => {
   const [endDate, setEndDate] = useState('');
   const [isExporting, setIsExporting] = useState(false);
   const [isImporting, setIsImporting] = useState(false);
+  const [importProgress, setImportProgress] = useState(0);
   const [message, setMessage] = useState(null); // { text, type }
   const [dragActive, setDragActive] = useState(false);
 
@@ -24,18 +25,13 @@ const ExportImportModal = ({ onClose, onRefresh }) => {
       
       if (params.toString()) url += `?${params.toString()}`;
       
-      const res = await axios.get(url);
-      const dataStr = JSON.stringify(res.data, null, 2);
-      const dataUri = 'data:application/json;charset=utf-8,'+ encodeURIComponent(dataStr);
-      
-      const exportFileDefaultName = `voyage_atlas_export_${new Date().toISOString().split('T')[0]}.json`;
-      
+      // The export is streamed by the server; let the browser save it straight to disk
       const linkElement = document.createElement('a');
-      linkElement.setAttribute('href', dataUri);
-      linkElement.setAttribute('download', exportFileDefaultName);
+      linkElement.setAttribute('href', url);
+      linkElement.setAttribute('download', `voyage_atlas_export_${new Date().toISOString().split('T')[0]}.json`);
       linkElement.click();
       
-      setMessage({ text: 'Export complete!', type: 'success' });
+      setMessage({ text: 'Export started!', type: 'success' });
     } catch (err) {
       console.error("Export failed", err);
       setMessage({ text: 'Export failed. Please try again.', type: 'error' });
@@ -49,29 +45,25 @@ const ExportImportModal = ({ onClose, onRefresh }) => {
     
     try {
       setIsImporting(true);
+      setImportProgress(0);
       setMessage(null);
       
-      const reader = new FileReader();
-      reader.onload = async (e) => {
-        try {
-          const json = JSON.parse(e.target.result);
-          const res = await axios.post(`${API_BASE}/events/import`, json);
-          setMessage({ 
-            text: `Import successful! Added ${res.data.imported_trips} trips and ${res.data.imported_events} events.`, 
-            type: 'success' 
-          });
-          if (onRefresh) onRefresh();
-        } catch (err) {
-          console.error("Import API failed", err);
-          setMessage({ text: 'Invalid JSON format or server error.', type: 'error' });
-        } finally {
-          setIsImporting(false);
+      // Sent as-is: the server parses the backup while it is being uploaded
+      const res = await axios.post(`${API_BASE}/events/import`, file, {
+        headers: { 'Content-Type': 'application/json' },
+        onUploadProgress: (e) => {
+          if (e.total) setImportProgress(Math.round((e.loaded / e.total) * 100));
         }
-      };
-      reader.readAsText(file);
+      });
+      setMessage({ 
+        text: `Import successful! Added ${res.data.imported_trips} trips and ${res.data.imported_events} events.`, 
+        type: 'success' 
+      });
+      if (onRefresh) onRefresh();
     } catch (err) {
-      console.error("File reading failed", err);
-      setMessage({ text: 'Failed to read file.', type: 'error' });
+      console.error("Import API failed", err);
+      setMessage({ text: err.response?.data?.detail || 'Invalid JSON format or server error.', type: 'error' });
+    } finally {
       setIsImporting(false);
     }
   };
@@ -181,7 +173,7 @@ const ExportImportModal = ({ onClose, onRefresh }) => {
                   <Upload size={40} />
                 </div>
                 <div className="upload-text">
-                  {isImporting ? 'PROCESSING...' : 'DRAG & DROP OR CLICK TO SELECT'}
+                  {isImporting ? `PROCESSING... ${importProgress}%` : 'DRAG & DROP OR CLICK TO SELECT'}
                 </div>
               </label>
             </div>
@@ -139,6 +139,7 @@ const MediaCarousel = ({ mediaList, initialIndex = 0, onClose, eventId }) => {
         <div key={media.id || index} className={isFull ? "" : `carousel-item ${isActive ? 'active' : ''}`} onClick={() => !isFull && !isEditMode && setCurrentIndex(index)}>
           <video 
             src={media.url} 
+            poster={media.preview_url}
             className={mediaCls}
             // Allow controls when active so user can play/unmute
             controls={isActive || isFull} 
@@ -159,7 +160,7 @@ const MediaCarousel = ({ mediaList, initialIndex = 0, onClose, eventId }) => {
     return (
       <div key={media.id || index} className={isFull ? "" : `carousel-item ${isActive ? 'active' : ''}`} onClick={() => !isFull && !isEditMode && setCurrentIndex(index)}>
         <img 
-          src={media.url} 
+          src={isFull ? media.url : (media.preview_url || media.url)} 
           alt="Travel Detail" 
           className={mediaCls} 
           onDragStart={(e) => e.preventDefault()}
@@ -1,30 +1,66 @@
 import React, { useEffect, useRef } from 'react';
 import { Viewer } from 'photo-sphere-viewer';
+import { EquirectangularTilesAdapter } from 'photo-sphere-viewer/dist/adapters/equirectangular-tiles';
 import 'photo-sphere-viewer/dist/photo-sphere-viewer.css';
 
-const PanoramaViewer = ({ imageUrl, onClose }) => {
+// Tiled panorama config from the backend's tile manifest: the low-res preview
+// shows first, then only the visible tiles of the sharpest level are fetched.
+const loadTiledPanorama = async (tilesUrl) => {
+  const manifestUrl = new URL(tilesUrl, window.location.href);
+  const response = await fetch(manifestUrl);
+  if (!response.ok) throw new Error(`Tile manifest unavailable (${response.status})`);
+  const manifest = await response.json();
+  const top = manifest.levels[manifest.levels.length - 1];
+  const resolve = (path) => new URL(path, response.url || manifestUrl).href;
+  return {
+    width: top.width,
+    cols: top.cols,
+    rows: top.rows,
+    baseUrl: resolve(manifest.preview),
+    tileUrl: (col, row) => resolve(
+      manifest.tile_url.replace('{level}', top.level).replace('{col}', col).replace('{row}', row)
+    ),
+  };
+};
+
+const PanoramaViewer = ({ imageUrl, tilesUrl, onClose }) => {
   const viewerRef = useRef();
 
   useEffect(() => {
     if (!viewerRef.current || !imageUrl) return;
+    let viewer;
+    let cancelled = false;
+
+    const createViewer = (options) => {
+      viewer = new Viewer({
+        container: viewerRef.current,
+        loadingTxt: 'CALIBRATING SENSORS...',
+        navbar: [
+          'zoom',
+          'move',
+          'download',
+          'fullscreen',
+          'caption'
+        ],
+        ...options
+      });
+    };
 
-    const viewer = new Viewer({
-      container: viewerRef.current,
-      panorama: imageUrl,
-      loadingTxt: 'CALIBRATING SENSORS...',
-      navbar: [
-        'zoom',
-        'move',
-        'download',
-        'fullscreen',
-        'caption'
-      ]
-    });
+    const tiled = tilesUrl ? loadTiledPanorama(tilesUrl) : Promise.reject(new Error('No tiles'));
+    tiled
+      .then((panorama) => {
+        if (!cancelled) createViewer({ adapter: EquirectangularTilesAdapter, panorama });
+      })
+      .catch(() => {
+        // Panoramas without tiles still open from the full image
+        if (!cancelled) createViewer({ panorama: imageUrl });
+      });
 
     return () => {
+      cancelled = true;
       if (viewer && viewer.destroy) viewer.destroy();
     };
-  }, [imageUrl]);
+  }, [imageUrl, tilesUrl]);
 
   return (
     <div className="pano-modal-overlay">
@@ -1,10 +1,38 @@
 import React, { useState, useEffect, useRef, useMemo } from 'react';
+import axios from 'axios';
 import Globe from 'react-globe.gl';
 import * as THREE from 'three';
 
-const TravelGlobe = ({ events, currentEventIndex, isPlaying, onGlobeClick, onMarkerClick, speed, forcedCamera }) => {
+const API_BASE = '/api';
+
+// /events/arcs sends parallel arrays, one entry per leg; turn them into leg objects
+const decodeArcs = (data) => data.event_id.map((id, i) => ({
+  id,
+  trip_id: data.trip_id[i],
+  start_datetime: data.start_datetime[i],
+  from_lat: data.from_lat[i],
+  from_lng: data.from_lng[i],
+  to_lat: data.to_lat[i],
+  to_lng: data.to_lng[i],
+  to_name: data.to_name[i],
+  transport: data.transport_modes[data.transport[i]],
+}));
+
+const TravelGlobe = ({ currentEventId, refreshKey, isPlaying, onGlobeClick, onMarkerClick, speed, forcedCamera }) => {
   const globeEl = useRef();
-  // ...
+  const [legs, setLegs] = useState([]);
+
+  // Legs come from the compact arcs endpoint, refetched whenever the app reloads its data
+  useEffect(() => {
+    axios.get(`${API_BASE}/events/arcs`)
+      .then(res => setLegs(decodeArcs(res.data)))
+      .catch(err => console.error("Failed to fetch arcs", err));
+  }, [refreshKey]);
+
+  const currentEventIndex = useMemo(
+    () => legs.findIndex(leg => leg.id === currentEventId),
+    [legs, currentEventId]
+  );
 
   // Handle Forced Camera (Map Sync)
   useEffect(() => {
@@ -23,7 +51,7 @@ const TravelGlobe = ({ events, currentEventIndex, isPlaying, onGlobeClick, onMar
   // Cluster events by destination
   const cityClusters = useMemo(() => {
     const clusters = {};
-    events.forEach(e => {
+    legs.forEach(e => {
       const key = e.to_name;
       if (!clusters[key]) {
         clusters[key] = { 
@@ -38,19 +66,18 @@ const TravelGlobe = ({ events, currentEventIndex, isPlaying, onGlobeClick, onMar
       clusters[key].events.push(e);
     });
     return Object.values(clusters);
-  }, [events]);
+  }, [legs]);
 
   const arcsData = useMemo(() => {
-    return events.map((e, i) => ({
+    return legs.map((e, i) => ({
       startLat: e.from_lat,
       startLng: e.from_lng,
       endLat: e.to_lat,
       endLng: e.to_lng,
       color: i === currentEventIndex ? ['#00f2ff', '#ffffff'] : ['rgba(255,255,255,0.05)', 'rgba(255,255,255,0.02)'],
-      active: i === currentEventIndex,
-      title: e.title
+      active: i === currentEventIndex
     }));
-  }, [events, currentEventIndex]);
+  }, [legs, currentEventIndex]);
 
   // Calculate heading between two points
   const getHeading = (phi1, lam1, phi2, lam2) => {
@@ -163,8 +190,8 @@ const TravelGlobe = ({ events, currentEventIndex, isPlaying, onGlobeClick, onMar
 
 
   useEffect(() => {
-    if (currentEventIndex >= 0 && currentEventIndex < events.length && isPlaying) {
-      const current = events[currentEventIndex];
+    if (currentEventIndex >= 0 && currentEventIndex < legs.length && isPlaying) {
+      const current = legs[currentEventIndex];
       let startTime = Date.now();
       const baseDuration = 5000;
       const duration = baseDuration / speed;
@@ -227,7 +254,7 @@ const TravelGlobe = ({ events, currentEventIndex, isPlaying, onGlobeClick, onMar
       // Default Sun to NOW if idle
       setSunPos(calculateSunPosition(new Date()));
     }
-  }, [currentEventIndex, isPlaying, speed, events]); // Added speed and events dependency
+  }, [currentEventIndex, isPlaying, speed, legs]);
 
   // Handle Window Resize
   const [dimensions, setDimensions] = useState({ width: window.innerWidth, height: window.innerHeight });
@@ -279,8 +306,9 @@ const TravelGlobe = ({ events, currentEventIndex, isPlaying, onGlobeClick, onMar
           // Visibility Logic:
           // If Playing: Show only FROM and TO cities.
           // If Idle: Show ALL cities.
-          const isFrom = events[currentEventIndex]?.from_name === c.name;
-          const isTo = events[currentEventIndex]?.to_name === c.name;
+          const current = legs[currentEventIndex];
+          const isFrom = current?.from_lat === c.lat && current?.from_lng === c.lng;
+          const isTo = current?.to_name === c.name;
           
           const isVisible = isPlaying ? (isFrom || isTo) : true;
           
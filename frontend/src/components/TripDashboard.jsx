@@ -100,7 +100,7 @@ const TripDashboard = ({ trip, onClose, onRefresh, onFocusLocation }) => {
 
   useEffect(() => {
     if (allMedia.length > 0 && !heroImage) {
-        setHeroImage(allMedia[0].url);
+        setHeroImage(allMedia[0].preview_url || allMedia[0].url);
     }
   }, [allMedia, heroImage]);
 
@@ -164,7 +164,7 @@ const TripDetailModal = ({ trip, onClose, onRefresh, onViewMedia }) => {
                                         <div className="journal-media-grid">
                                             {item.media.map((m, mIdx) => (
                                                 <div key={m.id} className="journal-media-thumb" onClick={() => onViewMedia(item.media, mIdx)}>
-                                                    <img src={m.url} loading="lazy"/>
+                                                    <img src={m.thumbnail_url || m.url} loading="lazy"/>
                                                 </div>
                                             ))}
                                         </div>
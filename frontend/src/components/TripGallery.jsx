@@ -14,7 +14,7 @@ const TripGallery = ({ media, activeFilter, onImageClick }) => {
                 <div className="masonry-grid">
                     {media.map(m => (
                         <div key={m.id} className="masonry-item" onClick={() => onImageClick && onImageClick(m.url)}>
-                            <img src={m.url} loading="lazy" alt={m.city || "Travel memory"} />
+                            <img src={m.thumbnail_url || m.url} loading="lazy" alt={m.city || "Travel memory"} />
                             <div className="masonry-overlay">
                                 <span className="loc-tag"><MapPin size={10}/> {m.city}</span>
                             </div>
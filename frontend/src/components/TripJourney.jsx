@@ -45,7 +45,7 @@ const TripJourney = ({ feedItems, onUploadClick, trip }) => {
                         <div className="stay-gallery-grid">
                            {item.media.map((m, mIdx) => (
                               <div key={m.id} className="stay-media-thumb">
-                                 <img src={m.url} loading="lazy" alt="Stay memory" />
+                                 <img src={m.thumbnail_url || m.url} loading="lazy" alt="Stay memory" />
                               </div>
                            ))}
                            {item.media.length === 0 && (
@@ -17,6 +17,11 @@ export const calculateDistance = (lat1, lon1, lat2, lon2) => {
     return deg * (Math.PI / 180);
   };
   
+  // Leg length in km: stored by the server, computed here for unsaved legs
+  export const legDistance = (ev) => {
+      return ev.distance_km != null ? Math.round(ev.distance_km) : calculateDistance(ev.from_lat, ev.from_lng, ev.to_lat, ev.to_lng);
+  };
+  
   export const formatDistance = (dist) => {
       return dist.toLocaleString();
   };